@@ -0,0 +1 @@
+"""Helpers shared by the lidar and sentinel scripts."""
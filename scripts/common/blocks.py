@@ -0,0 +1,21 @@
+"""
+Block windows for streaming rasters a square at a time.
+
+Usage:
+    for window in iter_block_windows(src.width, src.height, 1024):
+        data = src.read(1, window=window)
+"""
+
+from rasterio.windows import Window
+
+
+def iter_block_windows(width: int, height: int, block_size: int):
+    """Yield Windows that tile a width x height raster in block_size squares."""
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(
+                col_off,
+                row_off,
+                min(block_size, width - col_off),
+                min(block_size, height - row_off),
+            )
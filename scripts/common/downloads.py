@@ -0,0 +1,531 @@
+"""
+Resumable HTTP downloads shared by the LiDAR and Sentinel scripts.
+
+download_file() streams a URL into <out>.part, resuming with an HTTP
+Range request when a partial file is already there, checks the final size
+against what the server announced and only then renames it into place.
+A file at the final path is therefore always complete, and an interrupted
+run picks up where it stopped instead of starting over. An optional verify
+callback (e.g. verify_zip / verify_checksum) checks the finished .part
+before the rename; a file that fails it is discarded and fetched again.
+
+download_many() runs a list of (url, path) jobs over a thread pool that
+shares one requests.Session, so connections to each host are pooled and
+reused (keep-alive) rather than opened per file. It can also cap the
+total bandwidth (RateLimiter, a token bucket shared by all workers) and
+the connections per host, and reports aggregate progress (DownloadProgress)
+instead of one progress line per file. A failing job is reported and the
+queue carries on.
+
+download_segmented() splits one large file into K byte ranges fetched over
+parallel connections and written in place into a preallocated .part
+(finished ranges are recorded in <out>.part.json, so an interrupted run
+only refetches the unfinished ones). It falls back to download_file()
+when the server does not serve ranges.
+
+Usage:
+    jobs = [(url, out_dir / url.rsplit("/", 1)[-1]) for url in urls]
+    for url, path, err in download_many(jobs, workers=8, max_rate=20e6):
+        ...
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # Optional: only needed to check BLAKE3 checksums
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Bytes per read / write
+CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (15, 120)
+
+# Attempts per file after the first, with a growing pause between them
+RETRIES = 3
+RETRY_WAIT = 2.0
+
+# Seconds between aggregate progress lines in download_many()
+PROGRESS_INTERVAL = 10.0
+
+# Smallest byte range worth its own connection in download_segmented()
+MIN_SEGMENT = 8 * 1024 * 1024
+
+# Ask for the bytes as stored: requests decodes a compressed (gzip / deflate)
+# body, which would then match neither Content-Length nor Range offsets
+NO_ENCODING = {"Accept-Encoding": "identity"}
+
+# Errors worth another attempt (the .part file is kept and resumed)
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class IncompleteDownload(RuntimeError):
+    """The body ended before the announced size (retried, then raised)."""
+
+
+class CorruptDownload(RuntimeError):
+    """A full-length download failed verification (discarded, then retried)."""
+
+
+class RateLimiter:
+    """
+    Token bucket shared by threads: at most `rate` bytes/s on average.
+
+    Up to `burst` bytes (default one second's worth) may pass at once;
+    beyond that consume() sleeps the caller until the bucket has refilled.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else self.rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n: int) -> None:
+        """Take n bytes from the bucket, sleeping off any deficit."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class DownloadProgress:
+    """Thread-safe byte / file counters for a batch, printed every `interval` seconds."""
+
+    def __init__(self, n_jobs: int, interval: float = PROGRESS_INTERVAL):
+        self.n_jobs = n_jobs
+        self.interval = interval
+        self.bytes = 0
+        self.done = 0
+        self.failed = 0
+        self.start = self.last_print = time.monotonic()
+        self.lock = threading.Lock()
+
+    def rate(self) -> float:
+        """Average bytes/s since the batch started."""
+        return self.bytes / max(time.monotonic() - self.start, 1e-9)
+
+    def status(self) -> str:
+        return (
+            f"{self.done + self.failed}/{self.n_jobs} files, {self.bytes / 1e6:,.1f} MB "
+            f"at {self.rate() / 1e6:,.1f} MB/s"
+        )
+
+    def add(self, n: int) -> None:
+        """Count n received bytes (the progress callback for download_file)."""
+        with self.lock:
+            self.bytes += n
+            now = time.monotonic()
+            if self.interval and now - self.last_print >= self.interval:
+                self.last_print = now
+                print(f"  ⬇ {self.status()}")
+
+    def finish(self, name: str, error: str | None = None) -> None:
+        """Record one finished job and print its line."""
+        with self.lock:
+            if error is None:
+                self.done += 1
+                print(f"  [{self.done + self.failed}/{self.n_jobs}] {name}")
+            else:
+                self.failed += 1
+                print(f"  [{self.done + self.failed}/{self.n_jobs}] ❌ {name}: {error}")
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """Session keeping up to pool_size keep-alive connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def part_path(out_path: Path) -> Path:
+    """Staging path a download is written to before the final rename."""
+    return out_path.with_name(out_path.name + ".part")
+
+
+def segments_path(out_path: Path) -> Path:
+    """Record of the finished byte ranges of a segmented download."""
+    return out_path.with_name(out_path.name + ".part.json")
+
+
+def content_range_total(header: str | None) -> int | None:
+    """Total size from a Content-Range header ('bytes 0-99/1234' or 'bytes */1234')."""
+    m = re.search(r"/(\d+)\s*$", header or "")
+    return int(m.group(1)) if m else None
+
+
+def fetch_to_part(
+    session: requests.Session,
+    url: str,
+    part: Path,
+    headers: dict | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress=None,
+    limiter: RateLimiter | None = None,
+) -> None:
+    """
+    Append the rest of url to part, resuming from its current size.
+
+    Falls back to a full download when the server ignores the Range
+    header. progress, if given, is called with each chunk's byte count;
+    limiter, if given, throttles reading to its rate.
+    Raises IncompleteDownload when fewer bytes arrive than announced.
+    """
+    offset = part.stat().st_size if part.exists() else 0
+    request_headers = {**(headers or {}), **NO_ENCODING}
+    if offset:
+        request_headers["Range"] = f"bytes={offset}-"
+
+    with session.get(url, headers=request_headers, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code == 416:
+            # Nothing left to send: either the part is already whole or stale
+            if content_range_total(r.headers.get("Content-Range")) == offset:
+                return
+            part.unlink()
+            raise IncompleteDownload(f"Stale partial file discarded for {url}")
+        r.raise_for_status()
+
+        if offset and r.status_code == 206:
+            mode = "ab"
+            total = content_range_total(r.headers.get("Content-Range"))
+        else:
+            # 200: server sent the whole file, so start again
+            mode, offset = "wb", 0
+            total = int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None
+
+        with open(part, mode) as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    if progress is not None:
+                        progress(len(chunk))
+                    if limiter is not None:
+                        limiter.consume(len(chunk))
+
+    size = part.stat().st_size
+    if total is not None and size != total:
+        raise IncompleteDownload(f"{url}: got {size} of {total} bytes")
+
+
+def hash_file(path: Path, algorithm: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """Hex digest of a file; algorithm is a hashlib name or 'blake3'."""
+    if algorithm.lower() == "blake3":
+        if blake3 is None:
+            raise ImportError("BLAKE3 checksums need the blake3 package")
+        h = blake3.blake3()
+    else:
+        h = hashlib.new(algorithm.lower())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_checksum(path: Path, algorithm: str, expected: str) -> None:
+    """Raise CorruptDownload unless the file's digest equals expected."""
+    actual = hash_file(path, algorithm)
+    if actual.lower() != expected.lower():
+        raise CorruptDownload(f"{Path(path).name}: {algorithm} {actual} != expected {expected}")
+
+
+def verify_zip(path: Path) -> None:
+    """Raise CorruptDownload unless the file has a readable ZIP central directory."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            if not zf.infolist():
+                raise CorruptDownload(f"{Path(path).name}: ZIP archive is empty")
+    except zipfile.BadZipFile as e:
+        raise CorruptDownload(f"{Path(path).name}: {e}") from None
+
+
+def download_file(
+    url: str,
+    out_path: Path,
+    session: requests.Session | None = None,
+    headers=None,
+    retries: int = RETRIES,
+    chunk_size: int = CHUNK_SIZE,
+    progress=None,
+    limiter: RateLimiter | None = None,
+    verify=None,
+) -> Path:
+    """
+    Download url to out_path via a resumable .part file.
+
+    Skips the download if out_path exists (only complete files are ever
+    renamed there). Transient errors and short bodies are retried up to
+    retries times, each attempt resuming the partial file. headers may be
+    a dict or a callable returning one, called per attempt (e.g. to put a
+    fresh access token in). verify, if given, is called with the finished
+    .part path and raises CorruptDownload to reject it; the .part is then
+    deleted and the download retried from scratch. Returns out_path.
+    """
+    out_path = Path(out_path)
+    if out_path.exists():
+        return out_path
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    session = session or make_session(1)
+    part = part_path(out_path)
+    if segments_path(out_path).exists():
+        # A preallocated segmented .part has holes: appending to it is unsafe
+        part.unlink(missing_ok=True)
+        segments_path(out_path).unlink()
+
+    for attempt in range(retries + 1):
+        try:
+            attempt_headers = headers() if callable(headers) else headers
+            fetch_to_part(session, url, part, attempt_headers, chunk_size, progress, limiter)
+            if verify is not None:
+                verify(part)
+            break
+        except (IncompleteDownload, CorruptDownload, *TRANSIENT_ERRORS) as e:
+            if isinstance(e, CorruptDownload):
+                # Complete but wrong: resuming would keep the bad bytes
+                part.unlink(missing_ok=True)
+            if attempt == retries:
+                raise
+            wait = RETRY_WAIT * (attempt + 1)
+            print(f"  ⚠️ {out_path.name}: {type(e).__name__}, retrying in {wait:.0f} s")
+            time.sleep(wait)
+
+    os.replace(part, out_path)
+    return out_path
+
+
+def probe_ranges(session: requests.Session, url: str, headers: dict | None = None) -> int | None:
+    """
+    Size of url if the server serves byte ranges of it, else None.
+
+    Asks for the first byte: a 206 reply, or a 200 advertising
+    Accept-Ranges: bytes, counts as range support.
+    """
+    request_headers = {**(headers or {}), **NO_ENCODING, "Range": "bytes=0-0"}
+    with session.get(url, headers=request_headers, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        if r.status_code == 206:
+            return content_range_total(r.headers.get("Content-Range"))
+        if r.headers.get("Accept-Ranges", "").lower() == "bytes" and "Content-Length" in r.headers:
+            return int(r.headers["Content-Length"])
+    return None
+
+
+def split_ranges(size: int, segments: int) -> list[list[int]]:
+    """[start, end] (inclusive) byte ranges splitting size into near-equal segments."""
+    bounds = [size * i // segments for i in range(segments + 1)]
+    return [[bounds[i], bounds[i + 1] - 1] for i in range(segments)]
+
+
+def fetch_segment(
+    session: requests.Session,
+    url: str,
+    part: Path,
+    start: int,
+    end: int,
+    headers: dict | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress=None,
+    limiter: RateLimiter | None = None,
+) -> None:
+    """
+    Write bytes start..end (inclusive) of url at the same offsets in part.
+
+    part must already exist at full size. Raises IncompleteDownload if the
+    server answers with another range or the body is short.
+    """
+    request_headers = {**(headers or {}), **NO_ENCODING, "Range": f"bytes={start}-{end}"}
+    written = 0
+    with session.get(url, headers=request_headers, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code != 206 or not re.match(rf"bytes {start}-{end}/", content_range):
+            raise IncompleteDownload(f"{url}: asked for bytes {start}-{end}, got {r.status_code} {content_range!r}")
+        with open(part, "r+b") as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(len(chunk))
+                    if limiter is not None:
+                        limiter.consume(len(chunk))
+    if written != end - start + 1:
+        raise IncompleteDownload(f"{url}: got {written} of {end - start + 1} bytes for range {start}-{end}")
+
+
+def download_segmented(
+    url: str,
+    out_path: Path,
+    session: requests.Session | None = None,
+    headers=None,
+    segments: int = 4,
+    retries: int = RETRIES,
+    chunk_size: int = CHUNK_SIZE,
+    progress=None,
+    limiter: RateLimiter | None = None,
+    verify=None,
+    min_segment: int = MIN_SEGMENT,
+) -> Path:
+    """
+    Download url to out_path as up to `segments` byte ranges in parallel.
+
+    The .part file is preallocated to the full size and every range is
+    written at its own offset; finished ranges are recorded so a rerun
+    fetches only the rest. Each range is retried on its own, and the file
+    is only renamed into place once every range has arrived in full. That
+    says nothing about the bytes themselves (the preallocated holes are
+    the right size too), so pass verify (see download_file) wherever the
+    content can be checked. Falls back to a single-stream download_file()
+    when the server does not serve ranges, the file is smaller than two
+    segments, or a single-stream .part is already there to resume.
+    Returns out_path.
+    """
+    out_path = Path(out_path)
+    if out_path.exists():
+        return out_path
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    session = session or make_session(segments)
+    part, state_path = part_path(out_path), segments_path(out_path)
+
+    def current_headers():
+        return headers() if callable(headers) else headers
+
+    size = probe_ranges(session, url, current_headers())
+    if size is None or size < 2 * min_segment or (part.exists() and not state_path.exists()):
+        return download_file(url, out_path, session, headers, retries, chunk_size, progress, limiter, verify)
+
+    ranges = split_ranges(size, min(segments, size // min_segment))
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    if state.get("size") != size or state.get("ranges") != ranges or not part.exists():
+        state = {"size": size, "ranges": ranges, "done": []}
+        with open(part, "wb") as f:
+            f.truncate(size)
+        state_path.write_text(json.dumps(state))
+    lock = threading.Lock()
+
+    def fetch(i):
+        start, end = ranges[i]
+        for attempt in range(retries + 1):
+            try:
+                fetch_segment(session, url, part, start, end, current_headers(), chunk_size, progress, limiter)
+                break
+            except (IncompleteDownload, *TRANSIENT_ERRORS) as e:
+                if attempt == retries:
+                    raise
+                wait = RETRY_WAIT * (attempt + 1)
+                print(f"  ⚠️ {out_path.name} bytes {start}-{end}: {type(e).__name__}, retrying in {wait:.0f} s")
+                time.sleep(wait)
+        with lock:
+            state["done"].append(i)
+            state_path.write_text(json.dumps(state))
+
+    todo = [i for i in range(len(ranges)) if i not in state["done"]]
+    with ThreadPoolExecutor(max_workers=max(1, len(todo))) as pool:
+        list(pool.map(fetch, todo))
+
+    missing = sorted(set(range(len(ranges))) - set(state["done"]))
+    if missing:
+        raise IncompleteDownload(f"{url}: byte range(s) {missing} not fetched")
+    if verify is not None:
+        try:
+            verify(part)
+        except CorruptDownload:
+            part.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            raise
+
+    os.replace(part, out_path)
+    state_path.unlink()
+    return out_path
+
+
+def download_many(
+    jobs,
+    workers: int = 4,
+    session: requests.Session | None = None,
+    headers=None,
+    max_rate: float | None = None,
+    per_host: int | None = None,
+    progress_interval: float = PROGRESS_INTERVAL,
+    segments: int = 1,
+):
+    """
+    Download (url, out_path) or (url, out_path, verify) jobs, `workers` at a time.
+
+    All workers share one pooled session. max_rate caps the combined
+    download rate in bytes/s; per_host caps the simultaneous downloads
+    from any one host (e.g. a provider's per-user limit). With segments
+    > 1 each file is fetched as that many parallel byte ranges
+    (download_segmented), so a host sees up to per_host * segments
+    connections. Aggregate progress is printed every progress_interval
+    seconds. A failing job
+    never stops the others. Returns a list of (url, out_path, error) in
+    job order; error is None on success, otherwise the exception text.
+    """
+    jobs = [(url, Path(out_path), *rest) for url, out_path, *rest in jobs]
+    session = session or make_session(min(workers, per_host or workers) * max(1, segments))
+    limiter = RateLimiter(max_rate) if max_rate else None
+    progress = DownloadProgress(len(jobs), progress_interval)
+    host_slots = {}
+    if per_host:
+        for url, *_ in jobs:
+            host_slots.setdefault(urlsplit(url).netloc, threading.BoundedSemaphore(per_host))
+
+    def run(url, out_path, verify=None):
+        kwargs = dict(progress=progress.add, limiter=limiter, verify=verify)
+        if segments > 1:
+            fetch, kwargs["segments"] = download_segmented, segments
+        else:
+            fetch = download_file
+        slot = host_slots.get(urlsplit(url).netloc)
+        if slot is None:
+            return fetch(url, out_path, session, headers, **kwargs)
+        with slot:
+            return fetch(url, out_path, session, headers, **kwargs)
+
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run, *job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            url, out_path = jobs[i][:2]
+            try:
+                future.result()
+                outcomes[i] = (url, out_path, None)
+                progress.finish(out_path.name)
+            except Exception as e:
+                outcomes[i] = (url, out_path, f"{type(e).__name__}: {e}")
+                progress.finish(out_path.name, str(e))
+
+    print(
+        f"Downloads finished: {progress.done} ok, {progress.failed} failed, "
+        f"{progress.bytes / 1e6:,.1f} MB at {progress.rate() / 1e6:,.1f} MB/s"
+    )
+    return [outcomes[i] for i in range(len(jobs))]
@@ -0,0 +1,43 @@
+"""
+Fan independent jobs out over a process pool.
+
+run_units() is how the LiDAR scripts run per-tile / per-footprint work:
+each job is (key, args), failures are collected per job instead of
+stopping the batch, and workers=1 runs everything in-process (easier to
+debug, same results).
+
+Usage:
+    for key, result, err in run_units(clip_tile, jobs, workers=4):
+        ...
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def run_units(func, jobs, workers: int = 1):
+    """
+    Run func(*args) for each (key, args) job, in-process or over a process pool.
+
+    Jobs should open their own files (rasterio datasets, LAS readers), so
+    only paths, AOI frames and numbers cross the process boundary. Returns a list of
+    (key, result, error) in job order; error is None on success, otherwise
+    the exception text. A failing job never stops the others.
+    """
+    outcomes = []
+
+    if workers <= 1:
+        for key, args in jobs:
+            try:
+                outcomes.append((key, func(*args), None))
+            except Exception as e:
+                outcomes.append((key, None, f"{type(e).__name__}: {e}"))
+        return outcomes
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(key, pool.submit(func, *args)) for key, args in jobs]
+        for key, future in futures:
+            try:
+                outcomes.append((key, future.result(), None))
+            except Exception as e:
+                outcomes.append((key, None, f"{type(e).__name__}: {e}"))
+    return outcomes
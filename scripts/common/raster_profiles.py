@@ -0,0 +1,118 @@
+"""
+Shared output profiles for processed rasters.
+
+Every writer goes through cog_writer(), which streams into a tiled,
+compressed GeoTIFF and, on close, rewrites it as a Cloud-Optimized GeoTIFF
+with internal overviews. Windowed reads (src.read(window=...)) then only
+decode the tiles they touch, and overview reads skip full resolution.
+
+Usage:
+    with cog_writer(out_path, meta, "dtm") as dst:
+        dst.write(data, 1, window=window)
+"""
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+
+# Write COGs (True) or plain tiled / compressed GeoTIFFs (False)
+COG_OUTPUT = True
+
+# Internal tile size in pixels (COG requires square, multiple of 16)
+BLOCK_SIZE = 512
+
+# Per-product settings; any key here (or passed to cog_writer) overrides the
+# defaults. Without a "predictor" it follows the dtype: 3 (floating-point)
+# for float rasters, 2 (horizontal differencing) for integer ones, so DTMs
+# and terrain derivatives get 3 unless the source DTM is stored as integers.
+# Hillshade (uint8) and reflectance (uint16) are always integer.
+PRODUCT_PROFILES = {
+    "dtm": {"compress": "deflate", "zlevel": 6, "overview_resampling": "average"},
+    "terrain": {"compress": "deflate", "zlevel": 6, "overview_resampling": "average"},
+    "hillshade": {"compress": "deflate", "predictor": 2, "zlevel": 6, "overview_resampling": "average"},
+    "reflectance": {"compress": "deflate", "predictor": 2, "zlevel": 6, "overview_resampling": "average"},
+}
+
+
+def product_settings(dtype, product: str | None = None, **overrides) -> dict:
+    """
+    Compression / overview settings for one output.
+
+    product picks an entry of PRODUCT_PROFILES; None chooses the predictor
+    from the dtype. overrides replace individual settings for one output.
+    """
+    settings = {"compress": "deflate", "zlevel": 6, "overview_resampling": "average"}
+    if product is not None:
+        settings.update(PRODUCT_PROFILES[product])
+    settings.update(overrides)
+
+    if "predictor" not in settings:
+        settings["predictor"] = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+    return settings
+
+
+def output_profile(meta: dict, settings: dict) -> dict:
+    """Tiled, compressed GeoTIFF profile built on a source meta/profile."""
+    profile = dict(meta)
+    profile.update(
+        {
+            "driver": "GTiff",
+            "tiled": True,
+            "blockxsize": BLOCK_SIZE,
+            "blockysize": BLOCK_SIZE,
+            "compress": settings["compress"],
+            "predictor": settings["predictor"],
+            "zlevel": settings["zlevel"],
+            "BIGTIFF": "IF_SAFER",
+        }
+    )
+    return profile
+
+
+def to_cog(src_path: Path, dst_path: Path, settings: dict) -> None:
+    """Copy a GeoTIFF to a COG with internal overviews."""
+    rasterio.shutil.copy(
+        src_path,
+        dst_path,
+        driver="COG",
+        BLOCKSIZE=BLOCK_SIZE,
+        COMPRESS=settings["compress"].upper(),
+        LEVEL=settings["zlevel"],
+        PREDICTOR="FLOATING_POINT" if settings["predictor"] == 3 else "STANDARD",
+        OVERVIEW_RESAMPLING=settings["overview_resampling"].upper(),
+        BIGTIFF="IF_SAFER",
+    )
+
+
+@contextmanager
+def cog_writer(out_path, meta: dict, product: str | None = None, **overrides):
+    """
+    Open a dataset for writing with the shared output profile.
+
+    Yields a writable rasterio dataset that accepts windowed writes. With
+    COG_OUTPUT, data is written to a temporary tiled GeoTIFF next to
+    out_path and converted to a COG when the block exits; the temporary
+    file is removed either way.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    settings = product_settings(meta["dtype"], product, **overrides)
+    profile = output_profile(meta, settings)
+
+    if not COG_OUTPUT:
+        with rasterio.open(out_path, "w", **profile) as dst:
+            yield dst
+        return
+
+    tmp_path = out_path.with_name(out_path.stem + ".tmp.tif")
+    try:
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            yield dst
+        to_cog(tmp_path, out_path, settings)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
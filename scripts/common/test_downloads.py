@@ -0,0 +1,308 @@
+"""
+Check common.downloads against a local stdlib HTTP server.
+
+The server (TestServer) serves a few random files, honours Range
+requests, gzips bodies for clients that accept it and can be told to
+cut a response short or refuse a path, so the guarantees are exercised
+without a network: the per-host connection cap, the rate cap, retry of a
+truncated body, a 404 that fails only its own job, resuming a .part
+file with a Range request, and segmented downloads (in parallel, resumed
+from the range record, and falling back when ranges are not served).
+
+Example:
+    python test_downloads.py
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common import downloads
+
+# Bytes per served file, and per write (each followed by WRITE_PAUSE seconds)
+FILE_SIZE = 256 * 1024
+WRITE_SIZE = 16 * 1024
+WRITE_PAUSE = 0.002
+
+
+class TestServer(ThreadingHTTPServer):
+    """Threaded HTTP server over an in-memory {path: bytes} dict."""
+
+    daemon_threads = True
+
+    def __init__(self, files: dict):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.files = files
+        self.truncate = set()  # paths whose next response is cut in half
+        self.serve_ranges = True  # False: ignore Range, send whole files
+        self.ranges = []  # Range header of every request, None if absent
+        self.encodings = []  # Accept-Encoding header of every request
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def handle_error(self, request, client_address):
+        # Clients hang up early on purpose (e.g. after a probe's headers)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.ranges.append(self.headers.get("Range"))
+            server.encodings.append(self.headers.get("Accept-Encoding"))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.respond(server)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def respond(self, server):
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        m = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if m and server.serve_ranges:
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else len(body) - 1
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = body[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        else:
+            data = body
+            self.send_response(200)
+        if server.serve_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            # As many servers do for any client that allows it
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+
+        with server.lock:
+            truncate = self.path in server.truncate
+            server.truncate.discard(self.path)
+        if truncate:
+            # Announce the full length, send half, then drop the connection
+            data = data[: len(data) // 2]
+            self.close_connection = True
+        for i in range(0, len(data), WRITE_SIZE):
+            self.wfile.write(data[i : i + WRITE_SIZE])
+            time.sleep(WRITE_PAUSE)
+
+
+def make_files(n: int) -> dict:
+    return {f"/f{i}.bin": os.urandom(FILE_SIZE) for i in range(n)}
+
+
+def check_outputs(server: TestServer, out_dir: Path, results) -> None:
+    """Assert every served file arrived intact and no job failed."""
+    errors = [err for _, _, err in results if err]
+    assert not errors, f"unexpected failures: {errors}"
+    for path, body in server.files.items():
+        assert (out_dir / path[1:]).read_bytes() == body, f"{path}: content differs"
+
+
+def test_per_host_cap(work_dir: Path) -> None:
+    with TestServer(make_files(8)) as server:
+        jobs = [(server.base_url + p, work_dir / p[1:]) for p in server.files]
+        results = downloads.download_many(jobs, workers=6, per_host=2, progress_interval=0)
+        check_outputs(server, work_dir, results)
+        assert server.max_active <= 2, f"{server.max_active} simultaneous requests with per_host=2"
+
+
+def test_rate_cap(work_dir: Path) -> None:
+    max_rate = 400e3
+    with TestServer(make_files(4)) as server:
+        jobs = [(server.base_url + p, work_dir / p[1:]) for p in server.files]
+        start = time.monotonic()
+        results = downloads.download_many(jobs, workers=4, max_rate=max_rate, progress_interval=0)
+        elapsed = time.monotonic() - start
+        check_outputs(server, work_dir, results)
+    # The first second's worth passes as a burst, the rest at max_rate
+    expected = (len(jobs) * FILE_SIZE - max_rate) / max_rate
+    assert elapsed >= 0.9 * expected, f"{elapsed:.2f} s, expected at least {expected:.2f} s at {max_rate:g} B/s"
+
+
+def test_truncated_retry(work_dir: Path) -> None:
+    with TestServer(make_files(2)) as server:
+        server.truncate.add("/f0.bin")
+        jobs = [(server.base_url + p, work_dir / p[1:]) for p in server.files]
+        results = downloads.download_many(jobs, workers=2, progress_interval=0)
+        check_outputs(server, work_dir, results)
+        assert len(server.ranges) == 3, f"{len(server.ranges)} requests for 2 files and 1 retry"
+
+
+def test_404_isolated(work_dir: Path) -> None:
+    with TestServer(make_files(3)) as server:
+        missing = (server.base_url + "/missing.bin", work_dir / "missing.bin")
+        jobs = [(server.base_url + p, work_dir / p[1:]) for p in server.files]
+        results = downloads.download_many([missing, *jobs], workers=2, progress_interval=0)
+        assert results[0][2] and "404" in results[0][2], f"missing file: {results[0][2]}"
+        check_outputs(server, work_dir, results[1:])
+        assert not missing[1].exists() and not downloads.part_path(missing[1]).exists()
+
+
+def test_resume_part(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        out_path = work_dir / "f0.bin"
+        body = server.files["/f0.bin"]
+        downloads.part_path(out_path).write_bytes(body[:1000])
+        downloads.download_file(server.base_url + "/f0.bin", out_path)
+        assert out_path.read_bytes() == body, "resumed file differs"
+        assert server.ranges == ["bytes=1000-"], f"requests: {server.ranges}"
+
+
+def test_resume_after_truncation(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        server.truncate.add("/f0.bin")
+        out_path = work_dir / "f0.bin"
+        downloads.download_file(server.base_url + "/f0.bin", out_path, chunk_size=WRITE_SIZE)
+        assert out_path.read_bytes() == server.files["/f0.bin"], "resumed file differs"
+        assert len(server.ranges) == 2 and server.ranges[1], f"requests: {server.ranges}"
+
+
+def test_identity_encoding(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        out_path = work_dir / "f0.bin"
+        downloads.download_file(server.base_url + "/f0.bin", out_path, retries=0)
+        assert out_path.read_bytes() == server.files["/f0.bin"], "file differs"
+        assert server.encodings == ["identity"], f"Accept-Encoding: {server.encodings}"
+
+
+def test_segmented(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        out_path = work_dir / "f0.bin"
+        downloads.download_segmented(
+            server.base_url + "/f0.bin", out_path, segments=4, min_segment=FILE_SIZE // 8
+        )
+        assert out_path.read_bytes() == server.files["/f0.bin"], "segmented file differs"
+        expected = ["bytes=0-0"] + [f"bytes={a}-{b}" for a, b in downloads.split_ranges(FILE_SIZE, 4)]
+        assert sorted(server.ranges) == sorted(expected), f"requests: {server.ranges}"
+        assert set(server.encodings) == {"identity"}, f"Accept-Encoding: {server.encodings}"
+        assert not downloads.segments_path(out_path).exists(), "range record left behind"
+
+
+def test_segmented_resume(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        out_path = work_dir / "f0.bin"
+        body = server.files["/f0.bin"]
+        # As left by an interrupted run that finished the first two of four ranges
+        ranges = downloads.split_ranges(FILE_SIZE, 4)
+        downloads.part_path(out_path).write_bytes(body[: ranges[2][0]].ljust(FILE_SIZE, b"\0"))
+        downloads.segments_path(out_path).write_text(
+            json.dumps({"size": FILE_SIZE, "ranges": ranges, "done": [0, 1]})
+        )
+        downloads.download_segmented(
+            server.base_url + "/f0.bin", out_path, segments=4, min_segment=FILE_SIZE // 8
+        )
+        assert out_path.read_bytes() == body, "resumed segmented file differs"
+        expected = ["bytes=0-0"] + [f"bytes={a}-{b}" for a, b in ranges[2:]]
+        assert sorted(server.ranges) == sorted(expected), f"requests: {server.ranges}"
+
+
+def test_segmented_fallback(work_dir: Path) -> None:
+    with TestServer(make_files(1)) as server:
+        server.serve_ranges = False
+        out_path = work_dir / "f0.bin"
+        downloads.download_segmented(
+            server.base_url + "/f0.bin", out_path, segments=4, min_segment=FILE_SIZE // 8
+        )
+        assert out_path.read_bytes() == server.files["/f0.bin"], "fallback file differs"
+        # The probe, then one single-stream download
+        assert server.ranges == ["bytes=0-0", None], f"requests: {server.ranges}"
+
+
+def test_segmented_connection_cap(work_dir: Path) -> None:
+    with TestServer(make_files(6)) as server:
+        jobs = [(server.base_url + p, work_dir / p[1:]) for p in server.files]
+        # download_many cannot pass min_segment, so wrap what it calls
+        segmented = downloads.download_segmented
+        downloads.download_segmented = partial(segmented, min_segment=FILE_SIZE // 8)
+        try:
+            results = downloads.download_many(jobs, workers=6, per_host=2, segments=2, progress_interval=0)
+        finally:
+            downloads.download_segmented = segmented
+        assert len(server.ranges) == 3 * len(jobs), f"{len(server.ranges)} requests, expected a probe and 2 ranges per file"
+        check_outputs(server, work_dir, results)
+        assert server.max_active <= 4, f"{server.max_active} simultaneous requests with per_host=2, segments=2"
+
+
+TESTS = (
+    test_per_host_cap,
+    test_rate_cap,
+    test_truncated_retry,
+    test_404_isolated,
+    test_resume_part,
+    test_resume_after_truncation,
+    test_identity_encoding,
+    test_segmented,
+    test_segmented_resume,
+    test_segmented_fallback,
+    test_segmented_connection_cap,
+)
+
+
+def main():
+    # Retries run at once rather than after the production back-off
+    downloads.RETRY_WAIT = 0
+
+    failed = 0
+    root = Path(tempfile.mkdtemp(prefix="test_downloads_"))
+    try:
+        for test in TESTS:
+            work_dir = root / test.__name__
+            work_dir.mkdir()
+            try:
+                test(work_dir)
+                print(f"✅ {test.__name__}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {type(e).__name__}: {e}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Exact-area block aggregation of a fine DTM onto a coarser grid.
+
+Used by process_lidar.resample_to_10m() and the fused tile mode instead of
+GDAL's average resampling. Every output cell summarises exactly the source
+area it covers, nodata (NaN) pixels are left out explicitly, and cells
+that only partly overlap the raster at the right / bottom edge are kept
+(computed from the part that exists) rather than dropped.
+
+- Integer factors (1 m -> 10 m): reshape to (rows, f, cols, f) and reduce.
+- Other factors (e.g. 2 m -> 5 m): area-weighted, with overlap-fraction
+  weights per axis; min / max take every pixel that touches the cell.
+
+Several statistics come out of one read (AGG_STATS), so sub-pixel
+terrain variability (std, min / max) costs no extra pass. "count" is the
+valid source area under each cell, in source pixels.
+"""
+
+import math
+import warnings
+
+import numpy as np
+import rasterio
+from scipy import sparse
+from rasterio.windows import Window
+
+AGG_STATS = ("mean", "min", "max", "std", "count")
+
+# Output rows aggregated per read
+AGG_BLOCK_ROWS = 256
+
+
+def _check_stats(stats) -> None:
+    """Raise ValueError for statistics not in AGG_STATS."""
+    unknown = set(stats) - set(AGG_STATS)
+    if unknown:
+        raise ValueError(f"Unknown aggregation statistic(s): {sorted(unknown)}")
+
+
+def _moments(total, total_sq, area, stats) -> dict:
+    """mean / std / count from area-weighted sums (float64 in, float32 out)."""
+    out = {}
+    has = area > 0
+    mean = np.divide(total, area, out=np.full(area.shape, np.nan), where=has)
+    if "mean" in stats:
+        out["mean"] = mean.astype("float32")
+    if "std" in stats:
+        ex2 = np.divide(total_sq, area, out=np.full(area.shape, np.nan), where=has)
+        out["std"] = np.sqrt(np.maximum(ex2 - mean * mean, 0)).astype("float32")
+    if "count" in stats:
+        out["count"] = area.astype("float32")
+    return out
+
+
+def aggregate_block(block: np.ndarray, factor: int, stats=("mean",)) -> dict:
+    """
+    Reduce factor x factor cells of a float block (NaN = nodata).
+
+    The block is NaN-padded to a multiple of factor, so partial edge cells
+    are kept. Returns {stat: float32 array} of shape ceil(shape / factor);
+    empty cells are NaN (count 0).
+    """
+    _check_stats(stats)
+    h, w = block.shape
+    out_h, out_w = math.ceil(h / factor), math.ceil(w / factor)
+    if (out_h * factor, out_w * factor) != (h, w):
+        block = np.pad(block, ((0, out_h * factor - h), (0, out_w * factor - w)), constant_values=np.nan)
+
+    cells = block.reshape(out_h, factor, out_w, factor)
+    valid = ~np.isnan(cells)
+    values = np.where(valid, cells, 0).astype("float64")
+
+    out = _moments(
+        values.sum(axis=(1, 3)),
+        (values * values).sum(axis=(1, 3)) if "std" in stats else None,
+        valid.sum(axis=(1, 3)).astype("float64"),
+        stats,
+    )
+    with warnings.catch_warnings():
+        # Empty cells are all-NaN slices and come out NaN, as intended
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if "min" in stats:
+            out["min"] = np.nanmin(cells, axis=(1, 3)).astype("float32")
+        if "max" in stats:
+            out["max"] = np.nanmax(cells, axis=(1, 3)).astype("float32")
+    return out
+
+
+def overlap_weights(n_in: int, scale: float, out_start: int, out_stop: int, in_start: int = 0):
+    """
+    Sparse (out_stop - out_start) x n_in matrix of 1-D overlap lengths.
+
+    Output cell j covers source coordinates [j * scale, (j + 1) * scale);
+    source pixel i (offset by in_start) covers [i, i + 1). Also returns the
+    (first, stop) source index range touched by each output cell.
+    """
+    rows, cols, data, ranges = [], [], [], []
+    for j in range(out_start, out_stop):
+        lo, hi = j * scale, min((j + 1) * scale, in_start + n_in)
+        first, stop = int(math.floor(lo)), int(math.ceil(hi))
+        for i in range(first, stop):
+            w = min(i + 1, hi) - max(i, lo)
+            if w > 0:
+                rows.append(j - out_start)
+                cols.append(i - in_start)
+                data.append(w)
+        ranges.append((first - in_start, stop - in_start))
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(out_stop - out_start, n_in))
+    return matrix, ranges
+
+
+def _range_reduce(ufunc, a: np.ndarray, ranges, axis: int) -> np.ndarray:
+    """ufunc.reduceat over possibly overlapping [first, stop) ranges along axis."""
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (0, 1)
+    a = np.pad(a, pad, constant_values=np.nan)
+    idx = np.array([i for first, stop in ranges for i in (first, stop)])
+    return np.take(ufunc.reduceat(a, idx, axis=axis), np.arange(0, len(idx), 2), axis=axis)
+
+
+def aggregate_area(block: np.ndarray, row_w, col_w, row_ranges, col_ranges, stats=("mean",)) -> dict:
+    """
+    Area-weighted statistics of a block for any (non-integer) factor.
+
+    row_w / col_w and the ranges come from overlap_weights() for this
+    block's rows and for the full width.
+    """
+    _check_stats(stats)
+    valid = ~np.isnan(block)
+    values = np.where(valid, block, 0).astype("float64")
+
+    def weigh(a):
+        # Overlap-weighted sum over each output cell: rows, then columns
+        return row_w @ (a @ col_w.T)
+
+    out = _moments(
+        weigh(values),
+        weigh(values * values) if "std" in stats else None,
+        weigh(valid.astype("float64")),
+        stats,
+    )
+    if "min" in stats:
+        out["min"] = _range_reduce(np.fmin, _range_reduce(np.fmin, block, row_ranges, 0), col_ranges, 1)
+    if "max" in stats:
+        out["max"] = _range_reduce(np.fmax, _range_reduce(np.fmax, block, row_ranges, 0), col_ranges, 1)
+    return out
+
+
+def aggregate_raster(
+    in_path,
+    target_res: float,
+    writers: dict,
+    block_rows: int = AGG_BLOCK_ROWS,
+) -> None:
+    """
+    Stream band 1 of in_path through the aggregator in row blocks.
+
+    writers maps an output dataset (open for writing, see aggregate_meta)
+    to the list of statistics it takes as bands, e.g.
+    {mean_dst: ["mean"], stats_dst: ["mean", "std", "count"]}.
+    """
+    stats = sorted({s for band_stats in writers.values() for s in band_stats}, key=AGG_STATS.index)
+
+    with rasterio.open(in_path) as src:
+        scale = target_res / src.res[0]
+        out_h, out_w = aggregate_shape(src, target_res)
+        factor = int(round(scale))
+        integer = abs(scale - factor) < 1e-9
+
+        if not integer:
+            col_w, col_ranges = overlap_weights(src.width, scale, 0, out_w)
+
+        for out_row in range(0, out_h, block_rows):
+            rows = min(block_rows, out_h - out_row)
+            first = int(math.floor(out_row * scale))
+            stop = min(int(math.ceil((out_row + rows) * scale)), src.height)
+            block = src.read(1, window=Window(0, first, src.width, stop - first), masked=True)
+            block = block.astype("float32").filled(np.nan)
+
+            if integer:
+                result = aggregate_block(block, factor, stats)
+            else:
+                row_w, row_ranges = overlap_weights(stop - first, scale, out_row, out_row + rows, first)
+                result = aggregate_area(block, row_w, col_w, row_ranges, col_ranges, stats)
+
+            window = Window(0, out_row, out_w, rows)
+            for dst, band_stats in writers.items():
+                for band, stat in enumerate(band_stats, start=1):
+                    data = result[stat]
+                    if dst.nodata is not None and not np.isnan(dst.nodata):
+                        data = np.where(np.isnan(data), dst.nodata, data)
+                    dst.write(data.astype("float32"), band, window=window)
+
+
+def aggregate_shape(src, target_res: float) -> tuple:
+    """(height, width) of the aggregated grid; partial edge cells included."""
+    scale = target_res / src.res[0]
+    return math.ceil(src.height / scale - 1e-9), math.ceil(src.width / scale - 1e-9)
+
+
+def aggregate_meta(src, target_res: float, count: int = 1) -> dict:
+    """float32 meta for the aggregated grid of src (nodata kept, or NaN)."""
+    out_h, out_w = aggregate_shape(src, target_res)
+    scale = target_res / src.res[0]
+    meta = src.meta.copy()
+    meta.update(
+        {
+            "driver": "GTiff",
+            "height": out_h,
+            "width": out_w,
+            "count": count,
+            "transform": src.transform * rasterio.Affine.scale(scale, scale),
+            "dtype": "float32",
+            "nodata": src.nodata if src.nodata is not None else np.nan,
+        }
+    )
+    return meta
@@ -0,0 +1,198 @@
+"""
+Benchmark the LiDAR derivative pipeline on synthetic DTMs.
+
+For each requested size a synthetic float32 DTM (rolling terrain plus
+nodata holes) is written to a temp directory, then every stage in
+process_lidar is timed in a fresh child process so its peak RSS can be
+measured on its own. Results go to a JSON report for offline comparison
+between runs.
+
+Example:
+    python benchmark_lidar.py --sizes 1000 5000 10000 --out bench.json
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import psutil
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from shapely.geometry import Point
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import process_lidar
+from terrain import TERRAIN_PRODUCTS
+
+STAGES = ("clip", "hillshade", "hillshade_whole", "resample", "fused", "terrain")
+
+# Synthetic tiles are written in row strips of this many pixels
+WRITE_STRIP = 1024
+
+# Synthetic tiles sit in British National Grid, 1 m pixels
+CRS = "EPSG:27700"
+ORIGIN = (480000.0, 290000.0)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KB on Linux, bytes on macOS
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+    return psutil.Process().memory_info().peak_wset / 1024**2
+
+
+def make_synthetic_dtm(path: Path, size: int, nodata: float = -9999.0, seed: int = 0) -> None:
+    """Write a size x size float32 DTM with rolling terrain, noise and nodata holes."""
+    rng = np.random.default_rng(seed)
+    meta = {
+        "driver": "GTiff",
+        "height": size,
+        "width": size,
+        "count": 1,
+        "dtype": "float32",
+        "crs": CRS,
+        "transform": from_origin(ORIGIN[0], ORIGIN[1] + size, 1.0, 1.0),
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+    }
+    x = np.arange(size, dtype="float32")
+    with rasterio.open(path, "w", **meta) as dst:
+        for row_off in range(0, size, WRITE_STRIP):
+            rows = min(WRITE_STRIP, size - row_off)
+            y = np.arange(row_off, row_off + rows, dtype="float32")[:, None]
+            z = (
+                100
+                + 25 * np.sin(x / 410) * np.cos(y / 530)
+                + 5 * np.sin((x + y) / 97)
+                + rng.normal(0, 0.05, (rows, size)).astype("float32")
+            )
+            # Scattered nodata holes, roughly 1 % of the tile
+            holes = np.sin(x / 37) * np.sin(y / 41) > 0.98
+            z[holes] = nodata
+            dst.write(z.astype("float32"), 1, window=Window(0, row_off, size, rows))
+
+
+def make_synthetic_aoi(size: int) -> gpd.GeoDataFrame:
+    """A round AOI covering most of a synthetic tile."""
+    centre = Point(ORIGIN[0] + size / 2, ORIGIN[1] + size / 2)
+    return gpd.GeoDataFrame(geometry=[centre.buffer(size * 0.45)], crs=CRS)
+
+
+def run_stage(stage: str, work_dir: Path, dtm_path: Path, aoi: gpd.GeoDataFrame) -> dict:
+    """Run one stage (in a child process) and report its time and memory."""
+    baseline = peak_rss_mb()
+    clipped = work_dir / "clipped.tif"
+
+    start = time.perf_counter()
+    if stage == "clip":
+        process_lidar.clip_raster_to_aoi(dtm_path, aoi, clipped)
+    elif stage == "hillshade":
+        process_lidar.compute_hillshade(clipped, work_dir / "hillshade.tif")
+    elif stage == "hillshade_whole":
+        process_lidar.compute_hillshade(clipped, work_dir / "hillshade_whole.tif", block_size=None)
+    elif stage == "resample":
+        process_lidar.resample_to_10m(clipped, work_dir / "dtm_10m.tif")
+    elif stage == "fused":
+        process_lidar.fused_tile_products(
+            dtm_path, aoi, work_dir / "fused_hs.tif", work_dir / "fused_10m.tif"
+        )
+    elif stage == "terrain":
+        process_lidar.compute_terrain_derivatives(
+            clipped, {p: work_dir / f"{p}.tif" for p in TERRAIN_PRODUCTS}
+        )
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    seconds = time.perf_counter() - start
+
+    return {"seconds": seconds, "peak_rss_mb": peak_rss_mb(), "baseline_rss_mb": baseline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the LiDAR derivative pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000], help="Tile edge lengths in pixels")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES, help="Stages to time")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage and size")
+    parser.add_argument("--tmpdir", default=None, help="Where to write synthetic tiles (default: system temp)")
+    parser.add_argument("--out", default=None, help="JSON report path (default: benchmark_lidar_<timestamp>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic tiles and outputs")
+    args = parser.parse_args()
+
+    # clip feeds hillshade / resample / terrain, so it always runs first
+    stages = [s for s in STAGES if s in args.stages or s == "clip"]
+
+    out_path = Path(args.out or f"benchmark_lidar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    root = Path(tempfile.mkdtemp(prefix="lidar_bench_", dir=args.tmpdir))
+    results = []
+
+    try:
+        for size in args.sizes:
+            work_dir = root / f"{size}"
+            work_dir.mkdir()
+            dtm_path = work_dir / "dtm.tif"
+            print(f"\n=== {size} x {size} ===")
+            make_synthetic_dtm(dtm_path, size)
+            aoi = make_synthetic_aoi(size)
+
+            for stage in stages:
+                for run in range(args.repeat):
+                    # Fresh process per run, so peak RSS belongs to this stage only
+                    with ProcessPoolExecutor(max_workers=1) as pool:
+                        record = pool.submit(run_stage, stage, work_dir, dtm_path, aoi).result()
+                    record.update(
+                        {
+                            "size": size,
+                            "pixels": size * size,
+                            "stage": stage,
+                            "run": run,
+                            "mpix_per_s": size * size / 1e6 / record["seconds"],
+                        }
+                    )
+                    results.append(record)
+                    print(
+                        f"  {stage:<16} {record['seconds']:8.2f} s "
+                        f"{record['mpix_per_s']:8.1f} Mpix/s "
+                        f"peak {record['peak_rss_mb']:8.1f} MB "
+                        f"(+{record['peak_rss_mb'] - record['baseline_rss_mb']:.1f})"
+                    )
+    finally:
+        if args.keep:
+            print(f"\nSynthetic data kept in: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "cpu_count": psutil.cpu_count(),
+        "hillshade_block_size": process_lidar.HILLSHADE_BLOCK_SIZE,
+        "results": [r for r in results if r["stage"] in args.stages],
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved benchmark report: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
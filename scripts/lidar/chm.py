@@ -0,0 +1,160 @@
+"""
+Canopy height model from a DSM and DEM in one streamed pass.
+
+Replaces the chain of full-raster arcpy steps at the end of
+scripts/raw/lidarprocessbyfootprints.py:
+
+    Minus_3d(DSM, DEM)  ->  Con(< 0.05, 0)  ->  SetNull(> 50)  ->  Con(lake == 1, 0)
+
+chm_block() applies all four to one block; compute_chm() streams aligned
+DSM / DEM / water-mask blocks through it and writes a single output, with
+no intermediate rasters. The DEM and water mask are read through a
+WarpedVRT onto the DSM grid when they are not already on it (nearest
+neighbour for the mask).
+
+Example:
+    python chm.py Chazy_DSM.tif Chazy_DEM.tif Chazy_Canopy.tif --water F:/lidar/ADK_lakes.tif
+"""
+
+import argparse
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.blocks import iter_block_windows
+from common.raster_profiles import cog_writer
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# Heights below this are noise and set to 0 (m)
+CHM_FLOOR = 0.05
+
+# Heights above this are outliers and set to nodata (m)
+CHM_CEILING = 50.0
+
+# Water-mask value marking water (set to 0 height)
+WATER_VALUE = 1
+
+CHM_BLOCK_SIZE = 1024
+
+NODATA = -9999.0
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def chm_block(
+    dsm: np.ndarray,
+    dem: np.ndarray,
+    water: np.ndarray | None = None,
+    floor: float = CHM_FLOOR,
+    ceiling: float | None = CHM_CEILING,
+) -> np.ndarray:
+    """
+    DSM - DEM with noise floor, outlier ceiling and water mask, as float32.
+
+    dsm / dem use NaN for nodata; water is a boolean mask (True = water).
+    Heights < floor become 0, heights > ceiling NaN, and water cells 0
+    whatever their height, in that order (as in the arcpy chain).
+    """
+    chm = np.subtract(dsm, dem, dtype="float32")
+    chm[chm < floor] = 0
+    if ceiling is not None:
+        chm[chm > ceiling] = np.nan
+    if water is not None:
+        chm[water] = 0
+    return chm
+
+
+def aligned_reader(src, ref, resampling=Resampling.nearest):
+    """src itself if it is on ref's grid, else a WarpedVRT of it onto that grid."""
+    if src.crs == ref.crs and src.transform == ref.transform and src.shape == ref.shape:
+        return src
+    return WarpedVRT(
+        src,
+        crs=ref.crs,
+        transform=ref.transform,
+        width=ref.width,
+        height=ref.height,
+        resampling=resampling,
+    )
+
+
+def read_nan(src, window) -> np.ndarray:
+    """Band 1 of a window as float32 with nodata as NaN."""
+    return src.read(1, window=window, masked=True).astype("float32").filled(np.nan)
+
+
+def compute_chm(
+    dsm_path: Path,
+    dem_path: Path,
+    out_path: Path,
+    water_path: Path | None = None,
+    floor: float = CHM_FLOOR,
+    ceiling: float | None = CHM_CEILING,
+    water_value=WATER_VALUE,
+    block_size: int = CHM_BLOCK_SIZE,
+) -> Path:
+    """
+    Stream DSM / DEM (/ water mask) blocks through chm_block() into out_path.
+
+    The output is on the DSM grid. The DEM is resampled bilinearly onto it
+    if needed; water cells are those equal to water_value in water_path.
+    """
+    with ExitStack() as stack:
+        dsm_src = stack.enter_context(rasterio.open(dsm_path))
+        dem_src = stack.enter_context(rasterio.open(dem_path))
+        dem_src = stack.enter_context(aligned_reader(dem_src, dsm_src, Resampling.bilinear))
+        water_src = None
+        if water_path is not None:
+            water_src = stack.enter_context(rasterio.open(water_path))
+            water_src = stack.enter_context(aligned_reader(water_src, dsm_src))
+
+        meta = dsm_src.meta.copy()
+        meta.update(driver="GTiff", dtype="float32", count=1, nodata=NODATA)
+
+        with cog_writer(out_path, meta, "dtm") as dst:
+            for window in iter_block_windows(dsm_src.width, dsm_src.height, block_size):
+                water = None
+                if water_src is not None:
+                    water = water_src.read(1, window=window) == water_value
+                chm = chm_block(read_nan(dsm_src, window), read_nan(dem_src, window), water, floor, ceiling)
+                chm[np.isnan(chm)] = NODATA
+                dst.write(chm, 1, window=window)
+
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Canopy height model from DSM and DEM")
+    parser.add_argument("dsm", help="DSM raster")
+    parser.add_argument("dem", help="DEM raster")
+    parser.add_argument("out", help="Output CHM raster")
+    parser.add_argument("--water", default=None, help="Water mask raster (cells == --water-value set to 0)")
+    parser.add_argument("--water-value", type=int, default=WATER_VALUE, help="Water-mask value marking water")
+    parser.add_argument("--floor", type=float, default=CHM_FLOOR, help="Heights below this are set to 0")
+    parser.add_argument("--ceiling", type=float, default=CHM_CEILING, help="Heights above this are set to nodata")
+    parser.add_argument("--block-size", type=int, default=CHM_BLOCK_SIZE, help="Block size in pixels")
+    args = parser.parse_args()
+
+    compute_chm(
+        Path(args.dsm),
+        Path(args.dem),
+        Path(args.out),
+        water_path=Path(args.water) if args.water else None,
+        floor=args.floor,
+        ceiling=args.ceiling,
+        water_value=args.water_value,
+        block_size=args.block_size,
+    )
+    print(f"✅ CHM written to: {args.out}")
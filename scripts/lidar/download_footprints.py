@@ -0,0 +1,55 @@
+"""
+Download the LiDAR footprints listed in a URL text file, in parallel.
+
+Same input as the scripts in scripts/raw (one URL per line, e.g.
+Chazy.txt) and the same layout (files named after the last URL part).
+Downloads are resumable: an interrupted file is kept as <name>.part and
+continued with a Range request on the next run, and only complete,
+size-checked files get their final name.
+
+Example:
+    python download_footprints.py Chazy.txt --out-dir F:/lidar/Chazy/footprints --workers 8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.downloads import download_many
+
+
+def read_url_list(path: Path) -> list[str]:
+    """Non-empty, non-comment lines of a URL list file."""
+    lines = Path(path).read_text().splitlines()
+    return [ln.strip() for ln in lines if ln.strip() and not ln.lstrip().startswith("#")]
+
+
+def footprint_jobs(urls, out_dir: Path) -> list[tuple[str, Path]]:
+    """(url, local path) pairs, named after the last part of each URL."""
+    return [(url, Path(out_dir) / url.rsplit("/", 1)[-1]) for url in urls]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel, resumable LiDAR footprint download")
+    parser.add_argument("url_list", help="Text file with one footprint URL per line")
+    parser.add_argument("--out-dir", required=True, help="Download directory")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--max-rate", type=float, default=None, help="Total bandwidth cap in MB/s")
+    parser.add_argument("--segments", type=int, default=1, help="Parallel byte ranges per file")
+    args = parser.parse_args()
+
+    urls = read_url_list(Path(args.url_list))
+    jobs = footprint_jobs(urls, Path(args.out_dir))
+    todo = [j for j in jobs if not j[1].exists()]
+    print(f"{len(jobs)} footprints listed, {len(jobs) - len(todo)} already downloaded")
+
+    max_rate = args.max_rate * 1e6 if args.max_rate else None
+    failures = [(url, err) for url, _, err in download_many(todo, workers=args.workers, max_rate=max_rate, segments=args.segments) if err]
+    if failures:
+        print(f"\n❌ {len(failures)} footprint(s) failed:")
+        for url, err in failures:
+            print(f"  {url}: {err}")
+        sys.exit(1)
+    print("✅ All footprints downloaded")
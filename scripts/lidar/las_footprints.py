@@ -0,0 +1,378 @@
+"""
+Per-footprint LAS processing over a process pool, then a streaming mosaic.
+
+Open, parallel version of scripts/raw/lidarprocessbyfootprints.py:
+
+1. Each footprint (one LAS/LAZ file) is rasterised by its own worker to
+   DEM / DSM / CH tiles. The worker also reads the points of neighbouring
+   footprints within HALO_CELLS of its edge, so cells on a footprint
+   boundary see every point that falls in them and adjacent tiles agree
+   on their shared edge (no seam artefacts). Optional gap filling runs on
+   the haloed grid too, so the halo is raised to at least the fill radius.
+2. Each worker writes into its own scratch directory and moves finished
+   tiles into place, so workers never share a file (the arcpy version
+   reused one tmp.lasd, which ruled out parallel runs). Existing tiles are
+   skipped, as before.
+3. The DEM and DSM tiles are merged into one raster each, a row strip at
+   a time, so the full mosaic is never held in memory.
+4. The canopy mosaic is taken from the DEM / DSM mosaics in one streamed
+   chm.compute_chm() pass (noise floor, outlier ceiling and optional
+   water mask), in place of the arcpy mosaic + Con / SetNull chain. The
+   per-footprint CH tiles go through the same pass with the same
+   settings, so tiles and mosaic agree.
+
+Example:
+    python las_footprints.py F:/lidar/Chazy/footprints --name Chazy --out-dir F:/lidar/Chazy --workers 8
+"""
+
+import argparse
+import math
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window, from_bounds
+
+from las_rasterise import (
+    CELL_SIZE,
+    CHUNK_SIZE,
+    DEM_CLASSES,
+    DSM_CLASSES,
+    NODATA,
+    accumulate_grids,
+    find_las_files,
+    grid_for_bounds,
+    las_bounds,
+    las_crs,
+    write_grid,
+)
+from chm import CHM_CEILING, CHM_FLOOR, compute_chm
+from gapfill import fill_gaps
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.parallel import run_units
+from common.raster_profiles import cog_writer
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# Neighbour points read around each footprint, in cells
+HALO_CELLS = 2
+
+# Output subdirectory and file suffix per product (as in the arcpy script)
+PRODUCT_DIRS = {"dem": ("DEM", "DEM"), "dsm": ("DSM", "DSM"), "chm": ("Canopy", "CH")}
+
+# Rows per strip when mosaicking
+MOSAIC_STRIP = 1024
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def footprint_tile_paths(out_dir: Path, las_path: Path) -> dict:
+    """Per-footprint output tiles, keyed by product."""
+    stem = Path(las_path).stem
+    return {k: Path(out_dir) / d / f"{stem}_{suffix}.tif" for k, (d, suffix) in PRODUCT_DIRS.items()}
+
+
+def footprint_neighbours(las_paths, halo: float) -> dict:
+    """
+    Map each footprint to the files whose header extent lies within halo of it.
+
+    Uses header bounds only; the footprint itself is included.
+    """
+    bounds = {p: las_bounds([p]) for p in las_paths}
+    neighbours = {}
+    for p, (x0, y0, x1, y1) in bounds.items():
+        neighbours[p] = [
+            q
+            for q, (a0, b0, a1, b1) in bounds.items()
+            if a0 <= x1 + halo and a1 >= x0 - halo and b0 <= y1 + halo and b1 >= y0 - halo
+        ]
+    return neighbours
+
+
+def footprint_tile(
+    las_path: Path,
+    neighbour_paths,
+    out_dir: Path,
+    scratch_root: Path,
+    cell_size: float = CELL_SIZE,
+    dem_classes=DEM_CLASSES,
+    dsm_classes=DSM_CLASSES,
+    crs=None,
+    halo_cells: int = HALO_CELLS,
+    chunk_size: int = CHUNK_SIZE,
+    fill_radius: float = 0,
+    water_path: Path | None = None,
+    chm_floor: float = CHM_FLOOR,
+    chm_ceiling: float | None = CHM_CEILING,
+) -> dict:
+    """
+    Rasterise one footprint (plus neighbour halo) to DEM / DSM / CH tiles.
+
+    The grid is snapped to multiples of cell_size, so every footprint's tile
+    lies on one global grid. Points are binned on the grid grown by
+    halo_cells and the result cropped back to the footprint, which makes
+    the edge cells complete. With fill_radius, halo_cells is raised to at
+    least ceil(fill_radius) so filled edge cells see all their donors. Tiles
+    are written under scratch_root/<stem> and moved into out_dir only once
+    all three exist. The CH tile comes from the DEM / DSM tiles via
+    compute_chm() (water_path, chm_floor, chm_ceiling as there).
+
+    Returns the footprint_tile_paths() dict.
+    """
+    out_paths = footprint_tile_paths(out_dir, las_path)
+    if all(p.exists() for p in out_paths.values()):
+        print(f"  {Path(las_path).name}: tiles exist, skipping")
+        return out_paths
+
+    halo_cells = max(halo_cells, math.ceil(fill_radius))
+    transform, width, height = grid_for_bounds(las_bounds([las_path]), cell_size)
+    halo = halo_cells * cell_size
+    grown = transform * rasterio.Affine.translation(-halo_cells, -halo_cells)
+    grids = accumulate_grids(
+        neighbour_paths,
+        grown,
+        width + 2 * halo_cells,
+        height + 2 * halo_cells,
+        {"dem": (dem_classes, ("min",)), "dsm": (dsm_classes, ("max",))},
+        chunk_size,
+    )
+    dem = grids["dem"]["min"]
+    dsm = grids["dsm"]["max"]
+    if fill_radius > 0:
+        dem = fill_gaps(dem, fill_radius)
+        dsm = fill_gaps(dsm, fill_radius)
+    core = (slice(halo_cells, halo_cells + height), slice(halo_cells, halo_cells + width))
+    dem = dem[core]
+    dsm = dsm[core]
+
+    # Worker-private scratch; nothing lands in out_dir half-written
+    scratch = Path(scratch_root) / Path(las_path).stem
+    scratch.mkdir(parents=True, exist_ok=True)
+    try:
+        staged = {k: scratch / p.name for k, p in out_paths.items()}
+        write_grid(staged["dem"], dem, transform, crs)
+        write_grid(staged["dsm"], dsm, transform, crs)
+        compute_chm(staged["dsm"], staged["dem"], staged["chm"], water_path, chm_floor, chm_ceiling)
+        for k, path in out_paths.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged[k], path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"  ✅ {Path(las_path).name} (halo {halo:g} m, {len(neighbour_paths) - 1} neighbour(s))")
+    return out_paths
+
+
+def mosaic_tiles(tile_paths, out_path: Path, strip_rows: int = MOSAIC_STRIP) -> Path:
+    """
+    Merge aligned float32 tiles into one raster, strip by strip.
+
+    Tiles must share CRS, cell size and grid (true for footprint_tile()
+    output). Where tiles overlap, the first valid value wins; overlapping
+    cells hold identical values anyway because of the halo.
+    """
+    tiles = []
+    for p in tile_paths:
+        with rasterio.open(p) as src:
+            tiles.append((Path(p), src.bounds))
+            crs, res = src.crs, src.res[0]
+    if not tiles:
+        raise ValueError(f"No tiles to mosaic for {out_path}")
+
+    left = min(b.left for _, b in tiles)
+    bottom = min(b.bottom for _, b in tiles)
+    right = max(b.right for _, b in tiles)
+    top = max(b.top for _, b in tiles)
+    transform = rasterio.Affine(res, 0, left, 0, -res, top)
+    width = int(round((right - left) / res))
+    height = int(round((top - bottom) / res))
+
+    meta = {
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "count": 1,
+        "dtype": "float32",
+        "crs": crs,
+        "transform": transform,
+        "nodata": NODATA,
+    }
+    with cog_writer(out_path, meta, "dtm") as dst:
+        for row_off in range(0, height, strip_rows):
+            rows = min(strip_rows, height - row_off)
+            strip = Window(0, row_off, width, rows)
+            strip_top = transform.f - row_off * res
+            strip_bottom = strip_top - rows * res
+            out = np.full((rows, width), np.nan, dtype="float32")
+
+            for path, b in tiles:
+                if b.bottom >= strip_top or b.top <= strip_bottom:
+                    continue
+                with rasterio.open(path) as src:
+                    # Overlap of tile and strip, in tile pixels and strip pixels
+                    ov = (b.left, max(b.bottom, strip_bottom), b.right, min(b.top, strip_top))
+                    src_win = from_bounds(*ov, transform=src.transform).round_offsets().round_lengths()
+                    data = src.read(1, window=src_win, masked=True).filled(np.nan).astype("float32")
+                    r0 = int(round((strip_top - ov[3]) / res))
+                    c0 = int(round((ov[0] - left) / res))
+                    target = out[r0 : r0 + data.shape[0], c0 : c0 + data.shape[1]]
+                    empty = np.isnan(target)
+                    target[empty] = data[empty]
+
+            out[np.isnan(out)] = NODATA
+            dst.write(out, 1, window=strip)
+
+    return out_path
+
+
+def process_footprints(
+    las_paths,
+    out_dir: Path,
+    name: str,
+    cell_size: float = CELL_SIZE,
+    dem_classes=DEM_CLASSES,
+    dsm_classes=DSM_CLASSES,
+    crs=None,
+    halo_cells: int = HALO_CELLS,
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    scratch_dir: Path | None = None,
+    fill_radius: float = 0,
+    water_path: Path | None = None,
+    chm_floor: float = CHM_FLOOR,
+    chm_ceiling: float | None = CHM_CEILING,
+):
+    """
+    Rasterise every footprint in parallel, then mosaic DEM, DSM and canopy.
+
+    Writes per-footprint tiles under out_dir/{DEM,DSM,Canopy} and the
+    mosaics as out_dir/{name}_DEM.tif and _DSM.tif. The CH tiles and
+    _Canopy.tif (from the two mosaics) both come from compute_chm()
+    (water_path, chm_floor, chm_ceiling as there). If any footprint
+    fails, the mosaic and canopy stages are skipped, so a rerun that
+    fixes it builds them complete.
+    Returns a list of (las_path, error) for footprints that failed.
+    """
+    las_paths = [Path(p) for p in las_paths]
+    if not las_paths:
+        raise ValueError("No LAS/LAZ files given.")
+    out_dir = Path(out_dir)
+    scratch_root = Path(scratch_dir) if scratch_dir else out_dir / "_scratch"
+    crs = crs or las_crs(las_paths)
+    if halo_cells < math.ceil(fill_radius):
+        # Tiles only match a whole-area fill if the halo holds every donor
+        halo_cells = math.ceil(fill_radius)
+        print(f"Halo raised to {halo_cells} cell(s) to cover the fill radius")
+
+    neighbours = footprint_neighbours(las_paths, halo_cells * cell_size)
+    jobs = [
+        (
+            p,
+            (
+                p,
+                neighbours[p],
+                out_dir,
+                scratch_root,
+                cell_size,
+                dem_classes,
+                dsm_classes,
+                crs,
+                halo_cells,
+                chunk_size,
+                fill_radius,
+                water_path,
+                chm_floor,
+                chm_ceiling,
+            ),
+        )
+        for p in las_paths
+    ]
+
+    print(f"Rasterising {len(jobs)} footprint(s) with {workers} worker(s)...")
+    failures = []
+    tiles = {k: [] for k in PRODUCT_DIRS}
+    for las_path, paths, err in run_units(footprint_tile, jobs, workers):
+        if err is not None:
+            print(f"  ❌ {las_path.name}: {err}")
+            failures.append((las_path, err))
+            continue
+        for k, p in paths.items():
+            tiles[k].append(p)
+
+    # Workers clear their own scratch; drop the (now empty) root too
+    try:
+        scratch_root.rmdir()
+    except OSError:
+        pass
+
+    if failures:
+        # An existing mosaic is never rebuilt, so do not write one with holes
+        print(f"⚠️ {len(failures)} footprint(s) failed; skipping the mosaics and canopy until they succeed")
+        return failures
+
+    mosaics = {k: out_dir / f"{name}_{d}.tif" for k, (d, _) in PRODUCT_DIRS.items()}
+    for k in ("dem", "dsm"):
+        if mosaics[k].exists():
+            print(f"{mosaics[k].name} exists, skipping mosaic")
+            continue
+        print(f"Mosaicing {PRODUCT_DIRS[k][0]}...")
+        mosaic_tiles(tiles[k], mosaics[k])
+        print(f"  ✅ {mosaics[k]}")
+
+    if mosaics["chm"].exists():
+        print(f"{mosaics['chm'].name} exists, skipping canopy")
+    else:
+        print("Canopy heights from DSM - DEM...")
+        compute_chm(mosaics["dsm"], mosaics["dem"], mosaics["chm"], water_path, chm_floor, chm_ceiling)
+        print(f"  ✅ {mosaics['chm']}")
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-footprint LAS to DEM/DSM/CHM with a mosaic stage")
+    parser.add_argument("inputs", nargs="+", help="LAS/LAZ files or directories")
+    parser.add_argument("--name", required=True, help="Mosaic name prefix, e.g. the area name")
+    parser.add_argument("--out-dir", default=".", help="Output directory")
+    parser.add_argument("--cell-size", type=float, default=CELL_SIZE, help="Cell size in map units")
+    parser.add_argument("--dem-classes", type=int, nargs="+", default=list(DEM_CLASSES), help="Ground class codes")
+    parser.add_argument("--dsm-classes", type=int, nargs="+", default=list(DSM_CLASSES), help="Surface class codes")
+    parser.add_argument("--crs", default=None, help="Override the LAS header CRS, e.g. EPSG:26918")
+    parser.add_argument("--halo", type=int, default=HALO_CELLS, help="Neighbour halo in cells (at least the fill radius)")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel footprint workers")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Points read per chunk")
+    parser.add_argument("--scratch-dir", default=None, help="Scratch root (default: <out-dir>/_scratch)")
+    parser.add_argument("--fill-radius", type=float, default=0, help="Fill empty cells within this many cells (0 = off)")
+    parser.add_argument("--water", default=None, help="Water mask raster; water cells get canopy height 0")
+    parser.add_argument("--chm-floor", type=float, default=CHM_FLOOR, help="Canopy heights below this are set to 0")
+    parser.add_argument("--chm-ceiling", type=float, default=CHM_CEILING, help="Canopy heights above this are nodata")
+    args = parser.parse_args()
+
+    failures = process_footprints(
+        find_las_files(args.inputs),
+        Path(args.out_dir),
+        args.name,
+        cell_size=args.cell_size,
+        dem_classes=args.dem_classes,
+        dsm_classes=args.dsm_classes,
+        crs=args.crs,
+        halo_cells=args.halo,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        scratch_dir=args.scratch_dir,
+        fill_radius=args.fill_radius,
+        water_path=Path(args.water) if args.water else None,
+        chm_floor=args.chm_floor,
+        chm_ceiling=args.chm_ceiling,
+    )
+    if failures:
+        sys.exit(1)
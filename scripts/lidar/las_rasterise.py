@@ -0,0 +1,369 @@
+"""
+Rasterise LAS/LAZ point clouds to DEM / DSM / CHM GeoTIFFs without arcpy.
+
+Open replacement for the LasDatasetToRaster steps in scripts/raw:
+
+- DEM: lowest point per cell from the ground classes (BINNING MINIMUM, 2 and 9)
+- DSM: highest point per cell from the surface classes (BINNING MAXIMUM)
+- CHM: DSM - DEM, negative heights set to 0 (Con(VALUE > 0))
+
+Points are streamed in fixed-size chunks (laspy chunk_iterator) and
+accumulated into per-cell min / max / mean / count grids with vectorised
+scatter updates, so memory is set by the grid and CHUNK_SIZE, not by the
+number of points. Files whose header bounds miss the grid are never read.
+Cells with no points are left as nodata unless fill_radius is set, in
+which case gapfill.fill_gaps() fills DEM and DSM voids (IDW over the
+nearest cells) before the CHM is taken.
+
+Example:
+    python las_rasterise.py F:/lidar/Chazy/footprints --name Chazy --cell-size 2
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import laspy
+import numpy as np
+from rasterio.transform import from_origin
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.raster_profiles import cog_writer
+from gapfill import fill_gaps
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# ASPRS class codes, as used by the arcpy scripts in scripts/raw
+DEM_CLASSES = (2, 9)
+DSM_CLASSES = (0, 1, 2, 3, 4, 5, 9)
+
+CELL_SIZE = 1.0
+
+# Points read per chunk
+CHUNK_SIZE = 2_000_000
+
+NODATA = -9999.0
+
+# Per-cell statistics accumulate_grids() can build
+GRID_STATS = ("min", "max", "mean", "count")
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def find_las_files(paths) -> list[Path]:
+    """Expand files and directories into a sorted list of .las / .laz files."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(f for f in p.iterdir() if f.suffix.lower() in (".las", ".laz"))
+        else:
+            files.append(p)
+    return sorted(files)
+
+
+def las_bounds(las_paths) -> tuple:
+    """(xmin, ymin, xmax, ymax) over the headers of all files (no points read)."""
+    mins, maxs = [], []
+    for path in las_paths:
+        with laspy.open(path) as reader:
+            mins.append(reader.header.mins[:2])
+            maxs.append(reader.header.maxs[:2])
+    xmin, ymin = np.min(mins, axis=0)
+    xmax, ymax = np.max(maxs, axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def las_crs(las_paths):
+    """CRS from the first file header that declares one, else None."""
+    for path in las_paths:
+        with laspy.open(path) as reader:
+            crs = reader.header.parse_crs()
+        if crs is not None:
+            return crs.to_wkt()
+    return None
+
+
+def grid_for_bounds(bounds, cell_size: float):
+    """
+    Raster grid covering bounds, snapped to multiples of cell_size.
+
+    Cells are half-open ([left, right) in x, (bottom, top] in y), so a point
+    on a cell boundary always lands in the same global cell whichever grid
+    it is binned on; the grid grows by a cell where a bound sits exactly
+    on a right / bottom boundary. Returns (transform, width, height).
+    """
+    xmin, ymin, xmax, ymax = bounds
+    left = np.floor(xmin / cell_size) * cell_size
+    right = (np.floor(xmax / cell_size) + 1) * cell_size
+    top = np.ceil(ymax / cell_size) * cell_size
+    bottom = (np.ceil(ymin / cell_size) - 1) * cell_size
+    width = int(round((right - left) / cell_size))
+    height = int(round((top - bottom) / cell_size))
+    return from_origin(left, top, cell_size, cell_size), width, height
+
+
+def header_intersects(path, bounds) -> bool:
+    """True if the LAS header extent overlaps bounds (xmin, ymin, xmax, ymax)."""
+    with laspy.open(path) as reader:
+        (x0, y0), (x1, y1) = reader.header.mins[:2], reader.header.maxs[:2]
+    return x0 <= bounds[2] and x1 >= bounds[0] and y0 <= bounds[3] and y1 >= bounds[1]
+
+
+def iter_point_chunks(las_paths, chunk_size: int = CHUNK_SIZE, classes=None, bounds=None):
+    """
+    Yield (x, y, z, classification) arrays, at most chunk_size points at a time.
+
+    classes keeps only those class codes; bounds skips files whose header
+    extent misses it (points are not clipped, cell_index() does that).
+    """
+    for path in las_paths:
+        if bounds is not None and not header_intersects(path, bounds):
+            continue
+        with laspy.open(path) as reader:
+            for points in reader.chunk_iterator(chunk_size):
+                cls = np.asarray(points.classification)
+                keep = np.isin(cls, classes) if classes is not None else slice(None)
+                yield (
+                    np.asarray(points.x)[keep],
+                    np.asarray(points.y)[keep],
+                    np.asarray(points.z, dtype="float32")[keep],
+                    cls[keep],
+                )
+
+
+def cell_index(x, y, transform, width: int, height: int):
+    """Flat cell index for each point, and a mask of points inside the grid."""
+    cell_size = transform.a
+    col = np.floor((x - transform.c) / cell_size).astype(np.int64)
+    row = np.floor((transform.f - y) / cell_size).astype(np.int64)
+    inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+    return row * width + col, inside
+
+
+def accumulate_grids(
+    las_paths,
+    transform,
+    width: int,
+    height: int,
+    layers: dict,
+    chunk_size: int = CHUNK_SIZE,
+) -> dict:
+    """
+    Stream points once and build per-cell statistics for several class filters.
+
+    layers maps a layer name to (class_codes, stats), stats drawn from
+    GRID_STATS, e.g. {"dem": ((2, 9), ("min",)), "dsm": (DSM_CLASSES, ("max", "count"))}.
+    Each chunk updates every layer in place, so only the grids and one
+    chunk are ever in memory.
+
+    Returns {layer: {stat: (height, width) array}}; min / max / mean are
+    float32 with NaN in empty cells, count is uint32.
+    """
+    n = width * height
+    acc = {}
+    for name, (classes, stats) in layers.items():
+        unknown = set(stats) - set(GRID_STATS)
+        if unknown:
+            raise ValueError(f"Unknown grid statistic(s): {sorted(unknown)}")
+        grids = {}
+        if "min" in stats:
+            grids["min"] = np.full(n, np.inf, dtype="float32")
+        if "max" in stats:
+            grids["max"] = np.full(n, -np.inf, dtype="float32")
+        if "mean" in stats:
+            grids["sum"] = np.zeros(n, dtype="float64")
+        if "mean" in stats or "count" in stats:
+            grids["count"] = np.zeros(n, dtype="uint32")
+        acc[name] = (np.asarray(classes), grids)
+
+    # Only read the classes some layer asks for
+    wanted = np.unique(np.concatenate([classes for classes, _ in acc.values()]))
+    grid_bounds = (transform.c, transform.f - height * transform.a, transform.c + width * transform.a, transform.f)
+
+    for x, y, z, cls in iter_point_chunks(las_paths, chunk_size, wanted, grid_bounds):
+        idx, inside = cell_index(x, y, transform, width, height)
+        for classes, grids in acc.values():
+            sel = inside & np.isin(cls, classes)
+            cells, values = idx[sel], z[sel]
+            if "min" in grids:
+                np.minimum.at(grids["min"], cells, values)
+            if "max" in grids:
+                np.maximum.at(grids["max"], cells, values)
+            if "sum" in grids:
+                np.add.at(grids["sum"], cells, values)
+            if "count" in grids:
+                np.add.at(grids["count"], cells, 1)
+
+    out = {}
+    for name, (classes, grids) in acc.items():
+        stats = layers[name][1]
+        result = {}
+        for stat in ("min", "max"):
+            if stat in stats:
+                g = grids[stat]
+                g[np.isinf(g)] = np.nan
+                result[stat] = g.reshape(height, width)
+        if "mean" in stats:
+            count = grids["count"]
+            mean = np.full(n, np.nan, dtype="float32")
+            np.divide(grids["sum"], count, out=mean, where=count > 0, casting="unsafe")
+            result["mean"] = mean.reshape(height, width)
+        if "count" in stats:
+            result["count"] = grids["count"].reshape(height, width)
+        out[name] = result
+    return out
+
+
+def rasterise_las(
+    las_paths,
+    cell_size: float = CELL_SIZE,
+    dem_classes=DEM_CLASSES,
+    dsm_classes=DSM_CLASSES,
+    bounds=None,
+    chunk_size: int = CHUNK_SIZE,
+    extra_stats=(),
+):
+    """
+    Bin points into DEM (minimum) and DSM (maximum) grids in one pass.
+
+    bounds defaults to the union of the file headers. extra_stats adds
+    "mean" / "count" grids for both layers. Returns (grids, transform),
+    grids as {"dem": {"min": ...}, "dsm": {"max": ...}} from accumulate_grids().
+    """
+    if bounds is None:
+        bounds = las_bounds(las_paths)
+    transform, width, height = grid_for_bounds(bounds, cell_size)
+
+    layers = {
+        "dem": (dem_classes, ("min", *extra_stats)),
+        "dsm": (dsm_classes, ("max", *extra_stats)),
+    }
+    grids = accumulate_grids(las_paths, transform, width, height, layers, chunk_size)
+    return grids, transform
+
+
+def canopy_height(dem: np.ndarray, dsm: np.ndarray) -> np.ndarray:
+    """DSM - DEM with negative heights set to 0; NaN where either is empty."""
+    chm = dsm - dem
+    chm[chm < 0] = 0
+    return chm
+
+
+def write_grid(path: Path, data: np.ndarray, transform, crs, nodata: float = NODATA) -> None:
+    """
+    Write one grid as a COG.
+
+    Float grids (NaN = empty) use the DTM profile and nodata; integer
+    grids such as point counts are written as-is with no nodata.
+    """
+    meta = {
+        "driver": "GTiff",
+        "height": data.shape[0],
+        "width": data.shape[1],
+        "count": 1,
+        "dtype": data.dtype.name,
+        "crs": crs,
+        "transform": transform,
+        "nodata": None,
+    }
+    if np.issubdtype(data.dtype, np.floating):
+        meta.update(dtype="float32", nodata=nodata)
+        data = np.where(np.isnan(data), nodata, data).astype("float32")
+        product = "dtm"
+    else:
+        product = None
+    with cog_writer(path, meta, product) as dst:
+        dst.write(data, 1)
+
+
+def las_to_surfaces(
+    las_paths,
+    out_dir: Path,
+    name: str,
+    cell_size: float = CELL_SIZE,
+    dem_classes=DEM_CLASSES,
+    dsm_classes=DSM_CLASSES,
+    crs=None,
+    chunk_size: int = CHUNK_SIZE,
+    extra_stats=(),
+    fill_radius: float = 0,
+) -> dict:
+    """
+    Rasterise las_paths and write {name}_DEM/_DSM/_CHM.tif into out_dir.
+
+    crs overrides the CRS read from the LAS headers (e.g. 'EPSG:26918').
+    extra_stats ("mean", "count") also writes {name}_DEM_mean.tif etc.
+    fill_radius > 0 fills empty DEM / DSM cells within that many cells of data.
+    Returns {"dem": path, "dsm": path, "chm": path, "dem_mean": path, ...}.
+    """
+    las_paths = [Path(p) for p in las_paths]
+    if not las_paths:
+        raise ValueError("No LAS/LAZ files given.")
+    crs = crs or las_crs(las_paths)
+    if crs is None:
+        print("  ⚠️ No CRS in LAS headers and none given; writing without CRS")
+
+    print(f"Rasterising {len(las_paths)} LAS file(s) at {cell_size} m...")
+    grids, transform = rasterise_las(
+        las_paths, cell_size, dem_classes, dsm_classes, chunk_size=chunk_size, extra_stats=extra_stats
+    )
+    dem = grids["dem"]["min"]
+    dsm = grids["dsm"]["max"]
+    if fill_radius > 0:
+        dem = fill_gaps(dem, fill_radius)
+        dsm = fill_gaps(dsm, fill_radius)
+
+    out_dir = Path(out_dir)
+    out_paths = {k: out_dir / f"{name}_{k.upper()}.tif" for k in ("dem", "dsm", "chm")}
+    write_grid(out_paths["dem"], dem, transform, crs)
+    write_grid(out_paths["dsm"], dsm, transform, crs)
+    write_grid(out_paths["chm"], canopy_height(dem, dsm), transform, crs)
+
+    for layer in ("dem", "dsm"):
+        for stat in extra_stats:
+            path = out_dir / f"{name}_{layer.upper()}_{stat}.tif"
+            write_grid(path, grids[layer][stat], transform, crs)
+            out_paths[f"{layer}_{stat}"] = path
+
+    for k, path in out_paths.items():
+        print(f"  ✅ {k.upper()}: {path}")
+    return out_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rasterise LAS/LAZ to DEM, DSM and CHM")
+    parser.add_argument("inputs", nargs="+", help="LAS/LAZ files or directories")
+    parser.add_argument("--name", required=True, help="Output name prefix, e.g. the area name")
+    parser.add_argument("--out-dir", default=".", help="Output directory")
+    parser.add_argument("--cell-size", type=float, default=CELL_SIZE, help="Cell size in map units")
+    parser.add_argument("--dem-classes", type=int, nargs="+", default=list(DEM_CLASSES), help="Ground class codes")
+    parser.add_argument("--dsm-classes", type=int, nargs="+", default=list(DSM_CLASSES), help="Surface class codes")
+    parser.add_argument("--crs", default=None, help="Override the LAS header CRS, e.g. EPSG:26918")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Points read per chunk")
+    parser.add_argument(
+        "--stats",
+        nargs="+",
+        default=[],
+        choices=["mean", "count"],
+        help="Also write per-cell mean elevation / point count for the DEM and DSM classes",
+    )
+    parser.add_argument("--fill-radius", type=float, default=0, help="Fill empty cells within this many cells (0 = off)")
+    args = parser.parse_args()
+
+    las_to_surfaces(
+        find_las_files(args.inputs),
+        Path(args.out_dir),
+        args.name,
+        cell_size=args.cell_size,
+        dem_classes=args.dem_classes,
+        dsm_classes=args.dsm_classes,
+        crs=args.crs,
+        chunk_size=args.chunk_size,
+        extra_stats=args.stats,
+        fill_radius=args.fill_radius,
+    )
@@ -1,11 +1,30 @@
+import argparse
+import hashlib
+import json
 import os
+import sys
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack
 from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
 import rasterio
-from rasterio.mask import mask
-from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common import raster_profiles
+from common.blocks import iter_block_windows
+from common.parallel import run_units
+from common.raster_profiles import cog_writer
+from aggregate import AGG_STATS, aggregate_block, aggregate_meta, aggregate_raster
+from terrain import TERRAIN_PRODUCTS, terrain_block
+from pyramid import PYRAMID_LEVELS, build_dtm_pyramid, pyramid_paths
+from scratch import fits_in_memory, iter_strips, scratch_arrays, strip_with_halo
+from tile_index import tiles_for_aoi
 
 # ----------------------------------------------------------------------
 # CONFIG
@@ -16,15 +35,40 @@ PROJECT_ROOT = Path(r"C:\EGM704\data_sets\egm704_project")
 RAW_LIDAR_DIR = PROJECT_ROOT / "data" / "raw" / "lidar_2022"
 RAW_AOI = PROJECT_ROOT / "data" / "raw" / "aoi" / "aoi_sites.gpkg"
 OUT_DIR = PROJECT_ROOT / "data" / "processed" / "lidar"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
-# Each tile code must have a file RAW_LIDAR_DIR / f"{tile_code}.tif"
+# Each tile code must have a file RAW_LIDAR_DIR / f"{tile_code}.tif".
+# A site mapped to None takes every tile its AOI intersects, looked up in
+# the tile index (see tile_index.py).
 SITE_TILE_MAP = {
     "desborough_bng": ["SP88sw", "SP78se"],
     "wicksteed_bng": ["SP87ne"],
     "rewild_harb_bng": ["SP78nw", "SP79sw", "SP79se", "SP78ne"],
 }
 
+# Hillshade is streamed in square blocks of this many pixels (None = whole tile)
+HILLSHADE_BLOCK_SIZE = 1024
+
+# Tile-sized float32 arrays a whole-tile pass holds at once (DTM, gradients,
+# slope / aspect, temporaries); beyond the memory budget (see scratch.py)
+# they are memmapped on disk instead
+HILLSHADE_WORKING_ARRAYS = 10
+TERRAIN_WORKING_ARRAYS = 16
+
+# Derivative parameters used by process_sites (also part of the build cache key)
+HILLSHADE_AZIMUTH = 315
+HILLSHADE_ALTITUDE = 45
+TARGET_RES = 10
+
+# Records what each output was built from, so reruns skip up-to-date outputs
+MANIFEST_PATH = OUT_DIR / "build_manifest.json"
+
+# R-tree of tile bounds in RAW_LIDAR_DIR, refreshed on use
+TILE_INDEX_PATH = RAW_LIDAR_DIR / "tile_index.sqlite"
+
+# Raster whose CRS / pixel origin the DTM pyramid snaps to, e.g. the stack
+# from stack_s2_clipped_bands.py (None = DTM CRS, origin at 0, 0)
+PYRAMID_REF = None
+
 # ----------------------------------------------------------------------
 # FUNCTIONS
 # ----------------------------------------------------------------------
@@ -54,68 +98,244 @@ def load_aoi_for_site(site_name: str, aoi_path: Path = RAW_AOI) -> gpd.GeoDataFr
 
 
 def clip_raster_to_aoi(
-    raster_path: Path, aoi_gdf: gpd.GeoDataFrame, out_path: Path
+    raster_path: Path,
+    aoi_gdf: gpd.GeoDataFrame,
+    out_path: Path,
+    block_size: int = HILLSHADE_BLOCK_SIZE,
 ) -> None:
-    """Clip a raster to the AOI and save to out_path."""
-    with rasterio.open(raster_path) as src:
-        # Reproject AOI to raster CRS if needed
-        if aoi_gdf.crs != src.crs:
-            aoi_gdf = aoi_gdf.to_crs(src.crs)
+    """
+    Clip a raster to the AOI and save to out_path.
 
-        geoms = [aoi_gdf.geometry.values[0]]
+    Only the AOI's pixel window is read, block by block, and the polygon
+    mask is rasterised per block, so the cost follows the AOI area rather
+    than the tile area. Pixels outside the polygon are set to nodata (0 if
+    the raster has none), as rasterio.mask does.
+    """
+    with rasterio.open(raster_path) as src:
+        crop, geoms = aoi_crop_window(src, aoi_gdf)
+        fill = src.nodata if src.nodata is not None else 0
 
-        out_image, out_transform = mask(src, geoms, crop=True)
         out_meta = src.meta.copy()
         out_meta.update(
             {
-                "height": out_image.shape[1],
-                "width": out_image.shape[2],
-                "transform": out_transform,
+                "driver": "GTiff",
+                "height": crop.height,
+                "width": crop.width,
+                "transform": src.window_transform(crop),
             }
         )
 
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        with rasterio.open(out_path, "w", **out_meta) as dst:
-            dst.write(out_image)
+        with cog_writer(out_path, out_meta, "dtm") as dst:
+            for window in iter_block_windows(crop.width, crop.height, block_size):
+                read_window = Window(
+                    crop.col_off + window.col_off,
+                    crop.row_off + window.row_off,
+                    window.width,
+                    window.height,
+                )
+                data = src.read(window=read_window)
+                outside = geometry_mask(
+                    geoms,
+                    out_shape=data.shape[1:],
+                    transform=src.window_transform(read_window),
+                )
+                data[:, outside] = fill
+                dst.write(data, window=window)
 
     print(f"Saved clipped raster: {out_path}")
 
 
-def compute_hillshade(dem_path: Path, out_path: Path, azimuth=315, altitude=45):
-    """Simple hillshade from DTM using numpy (per tile)."""
-    with rasterio.open(dem_path) as src:
-        dem = src.read(1).astype("float32")
-        dem[dem == src.nodata] = np.nan
+def aoi_crop_window(src, aoi_gdf: gpd.GeoDataFrame):
+    """
+    Pixel window of src covering the AOI, as rasterio.mask(crop=True) would cut it.
 
-        # Cellsize (assume square pixels)
-        x_res = src.transform.a
-        y_res = -src.transform.e  # usually negative in transform
+    Returns (window, geoms) with geoms in the raster CRS.
+    """
+    # Reproject AOI to raster CRS if needed
+    if aoi_gdf.crs != src.crs:
+        aoi_gdf = aoi_gdf.to_crs(src.crs)
+
+    geoms = [aoi_gdf.geometry.values[0]]
+    try:
+        window = geometry_window(src, geoms)
+    except WindowError:
+        raise ValueError("Input shapes do not overlap raster.")
+
+    window = Window(int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+    return window, geoms
+
+
+def read_block_with_halo(src, window: Window, halo: int = 1, crop: Window | None = None, geoms=None):
+    """
+    Read band 1 for a window plus a halo of neighbouring pixels.
+
+    The halo is clipped at the raster edge, so gradients computed on the
+    returned block match a whole-raster np.gradient exactly (central
+    differences at block seams, one-sided at the true raster edge).
 
-        # Gradients
-        dzdx, dzdy = np.gradient(dem, x_res, y_res)
+    With crop set, window is relative to that crop window of src and the
+    halo is clipped to the crop instead; pixels outside geoms are set to NaN
+    as if the block came from the AOI-clipped file.
 
-        az = np.deg2rad(azimuth)
-        alt = np.deg2rad(altitude)
+    Returns (dem, inner): dem is float32 with nodata set to NaN, inner is a
+    pair of slices selecting the requested window out of dem.
+    """
+    if crop is None:
+        crop = Window(0, 0, src.width, src.height)
+
+    row0 = max(window.row_off - halo, 0)
+    col0 = max(window.col_off - halo, 0)
+    row1 = min(window.row_off + window.height + halo, crop.height)
+    col1 = min(window.col_off + window.width + halo, crop.width)
 
-        slope = np.arctan(np.hypot(dzdx, dzdy))
-        aspect = np.arctan2(-dzdx, dzdy)
+    read_window = Window(crop.col_off + col0, crop.row_off + row0, col1 - col0, row1 - row0)
+    dem = src.read(1, window=read_window)
+    dem = dem.astype("float32")
+    if src.nodata is not None:
+        dem[dem == src.nodata] = np.nan
 
-        # Hillshade formula
-        hs = (
-            np.sin(alt) * np.cos(slope)
-            + np.cos(alt) * np.sin(slope) * np.cos(az - aspect)
+    if geoms is not None:
+        outside = geometry_mask(
+            geoms, out_shape=dem.shape, transform=src.window_transform(read_window)
         )
+        dem[outside] = np.nan
 
-        # Normalise to 0–255, guarding against all-NaN / constant cases
-        hs_min = np.nanmin(hs)
-        hs_max = np.nanmax(hs)
-        if np.isfinite(hs_min) and np.isfinite(hs_max) and hs_max != hs_min:
-            hs_norm = (hs - hs_min) / (hs_max - hs_min)
-        else:
-            hs_norm = np.zeros_like(hs)
+    inner = (
+        slice(window.row_off - row0, window.row_off - row0 + window.height),
+        slice(window.col_off - col0, window.col_off - col0 + window.width),
+    )
+    return dem, inner
+
+
+def read_to_scratch(src, empty, crop: Window | None = None, geoms=None) -> np.ndarray:
+    """
+    Band 1 of src (or its crop window, masked to geoms) into a scratch array.
+
+    empty is the allocator from scratch.scratch_arrays(). The DTM is read
+    in strips, so it never has to fit in RAM; nodata becomes NaN.
+    """
+    if crop is None:
+        crop = Window(0, 0, src.width, src.height)
+    dem = empty((crop.height, crop.width), "float32")
+    for row_off, n_rows in iter_strips(crop.height):
+        window = Window(0, row_off, crop.width, n_rows)
+        dem[row_off : row_off + n_rows] = read_block_with_halo(src, window, halo=0, crop=crop, geoms=geoms)[0]
+    return dem
+
+
+def hillshade_block(dem: np.ndarray, x_res: float, y_res: float, azimuth=315, altitude=45):
+    """Cos-incidence hillshade (-1..1, NaN where dem is NaN) for a DEM array."""
+    # Gradients
+    dzdx, dzdy = np.gradient(dem, x_res, y_res)
+
+    az = np.deg2rad(azimuth)
+    alt = np.deg2rad(altitude)
 
-        hs_byte = (hs_norm * 255).astype("uint8")
-        hs_byte[np.isnan(hs)] = 0  # nodata as 0 (black)
+    slope = np.arctan(np.hypot(dzdx, dzdy))
+    aspect = np.arctan2(-dzdx, dzdy)
+
+    # Hillshade formula
+    return (
+        np.sin(alt) * np.cos(slope)
+        + np.cos(alt) * np.sin(slope) * np.cos(az - aspect)
+    )
+
+
+def scale_hillshade(hs: np.ndarray, hs_min: float, hs_max: float) -> np.ndarray:
+    """Stretch hillshade values to 1 byte, guarding against all-NaN / constant cases."""
+    if np.isfinite(hs_min) and np.isfinite(hs_max) and hs_max != hs_min:
+        hs_norm = (hs - hs_min) / (hs_max - hs_min)
+    else:
+        hs_norm = np.zeros_like(hs)
+
+    nodata = np.isnan(hs)
+    hs_norm[nodata] = 0
+    hs_norm = np.clip(hs_norm, 0, 1)
+    hs_byte = (hs_norm * 255).astype("uint8")
+    hs_byte[nodata] = 0  # nodata as 0 (black)
+    return hs_byte
+
+
+def hillshade_range(
+    dem_paths,
+    azimuth=315,
+    altitude=45,
+    block_size: int = HILLSHADE_BLOCK_SIZE,
+    aoi: gpd.GeoDataFrame | None = None,
+) -> tuple[float, float]:
+    """
+    Streaming first pass: min/max hillshade over one or more DTMs.
+
+    Pass every clipped tile of a site to get one shared stretch, so
+    adjacent tiles render at the same brightness. With aoi set, raw tiles
+    are read through the AOI crop window and mask instead, so no clipped
+    file is needed. Only block-sized arrays are held in memory. Returns
+    (nan, nan) if no valid pixels are found.
+    """
+    hs_min, hs_max = np.inf, -np.inf
+    for dem_path in dem_paths:
+        with rasterio.open(dem_path) as src:
+            x_res = src.transform.a
+            y_res = -src.transform.e
+            crop, geoms = None, None
+            if aoi is not None:
+                crop, geoms = aoi_crop_window(src, aoi)
+            width = src.width if crop is None else crop.width
+            height = src.height if crop is None else crop.height
+            for window in iter_block_windows(width, height, block_size):
+                dem, inner = read_block_with_halo(src, window, crop=crop, geoms=geoms)
+                hs = hillshade_block(dem, x_res, y_res, azimuth, altitude)[inner]
+                if np.isnan(hs).all():
+                    continue
+                hs_min = min(hs_min, float(np.nanmin(hs)))
+                hs_max = max(hs_max, float(np.nanmax(hs)))
+
+    if not np.isfinite(hs_min):
+        return float("nan"), float("nan")
+    return hs_min, hs_max
+
+
+def compute_hillshade(
+    dem_path: Path,
+    out_path: Path,
+    azimuth=315,
+    altitude=45,
+    block_size: int | None = HILLSHADE_BLOCK_SIZE,
+    stretch="tile",
+    scratch_dir: Path | None = None,
+    memory_budget: int | None = None,
+):
+    """
+    Simple hillshade from DTM using numpy (per tile).
+
+    With block_size set, the DTM is streamed in block_size x block_size
+    windows with a one-pixel halo, and each block is written straight to
+    out_path, so peak memory depends on the block size rather than the tile
+    size. block_size=None reads the whole tile in one go; if that working
+    set exceeds memory_budget (see scratch.py), the DTM and hillshade are
+    held in memmap files under scratch_dir and computed in strips instead.
+
+    stretch controls the mapping to 0–255:
+    - "tile": min/max of this tile (needs a first pass over the blocks)
+    - "fixed": cos-incidence mapped directly to 0–255, shadows clipped to 0
+    - (min, max): a precomputed range, e.g. from hillshade_range() over
+      all tiles of a site
+    """
+    if isinstance(stretch, str) and stretch not in ("tile", "fixed"):
+        raise ValueError(f"Unknown hillshade stretch: {stretch!r}")
+
+    if stretch == "fixed":
+        hs_range = (0.0, 1.0)
+    elif stretch == "tile":
+        hs_range = None
+    else:
+        hs_range = tuple(stretch)
+
+    with rasterio.open(dem_path) as src:
+        # Cellsize (assume square pixels)
+        x_res = src.transform.a
+        y_res = -src.transform.e  # usually negative in transform
 
         profile = src.profile
         profile.update(
@@ -123,43 +343,438 @@ def compute_hillshade(dem_path: Path, out_path: Path, azimuth=315, altitude=45):
             count=1,
             nodata=0,
         )
-
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        with rasterio.open(out_path, "w", **profile) as dst:
-            dst.write(hs_byte, 1)
+
+        if block_size is None and fits_in_memory(src.shape, HILLSHADE_WORKING_ARRAYS, memory_budget):
+            dem, _ = read_block_with_halo(src, Window(0, 0, src.width, src.height))
+            hs = hillshade_block(dem, x_res, y_res, azimuth, altitude)
+            if hs_range is None:
+                hs_range = (np.nanmin(hs), np.nanmax(hs))
+
+            with cog_writer(out_path, profile, "hillshade") as dst:
+                dst.write(scale_hillshade(hs, *hs_range), 1)
+        elif block_size is None:
+            print(f"  ⚠️ {Path(dem_path).name}: whole-tile hillshade exceeds the memory budget, using memmap scratch")
+            with scratch_arrays(scratch_dir) as empty:
+                dem = read_to_scratch(src, empty)
+                hs = empty(src.shape, "float32")
+                for row_off, n_rows in iter_strips(src.height):
+                    block, inner = strip_with_halo(dem, row_off, n_rows)
+                    hs[row_off : row_off + n_rows] = hillshade_block(block, x_res, y_res, azimuth, altitude)[inner]
+                if hs_range is None:
+                    hs_range = (np.nanmin(hs), np.nanmax(hs))
+
+                with cog_writer(out_path, profile, "hillshade") as dst:
+                    for row_off, n_rows in iter_strips(src.height):
+                        strip = np.array(hs[row_off : row_off + n_rows])
+                        dst.write(scale_hillshade(strip, *hs_range), 1, window=Window(0, row_off, src.width, n_rows))
+        else:
+            # Pass 1 (tile stretch only): tile-wide min/max from the blocks
+            if hs_range is None:
+                hs_range = hillshade_range([dem_path], azimuth, altitude, block_size)
+
+            # Pass 2: compute each block and write it out
+            with cog_writer(out_path, profile, "hillshade") as dst:
+                for window in iter_block_windows(src.width, src.height, block_size):
+                    dem, inner = read_block_with_halo(src, window)
+                    hs = hillshade_block(dem, x_res, y_res, azimuth, altitude)[inner]
+                    dst.write(scale_hillshade(hs, *hs_range), 1, window=window)
 
     print(f"Saved hillshade: {out_path}")
 
 
-def resample_to_10m(in_path: Path, out_path: Path, target_res: float = 10) -> None:
-    """Resample 1 m DTM to 10 m (mean), matching Sentinel-2 scale."""
+def resample_to_10m(
+    in_path: Path,
+    out_path: Path,
+    target_res: float = 10,
+    stats_path: Path | None = None,
+    stats=AGG_STATS,
+) -> None:
+    """
+    Aggregate a 1 m DTM to target_res (exact-area mean), matching Sentinel-2 scale.
+
+    Nodata pixels are left out of every cell and partial cells at the
+    right / bottom edge are kept (see aggregate.py). With stats_path set,
+    the same pass also writes a multi-band raster of `stats`, one band per
+    statistic, named in the band descriptions.
+    """
     with rasterio.open(in_path) as src:
-        # Assume square pixels; src.res[0] is pixel size
-        scale = target_res / src.res[0]
-        new_height = int(src.height / scale)
-        new_width = int(src.width / scale)
+        mean_meta = aggregate_meta(src, target_res)
+        stats_meta = aggregate_meta(src, target_res, count=len(stats))
+
+    with ExitStack() as stack:
+        writers = {stack.enter_context(cog_writer(out_path, mean_meta, "dtm")): ["mean"]}
+        if stats_path is not None:
+            stats_dst = stack.enter_context(cog_writer(stats_path, stats_meta, "dtm"))
+            stats_dst.descriptions = tuple(stats)
+            writers[stats_dst] = list(stats)
+        aggregate_raster(in_path, target_res, writers)
+
+    print(f"Saved resampled DTM ({target_res:g} m): {out_path}")
+    if stats_path is not None:
+        print(f"Saved {target_res:g} m DTM statistics ({', '.join(stats)}): {stats_path}")
+
+
+def compute_terrain_derivatives(
+    dem_path: Path,
+    out_paths: dict,
+    aoi: gpd.GeoDataFrame | None = None,
+    altitude=45,
+    block_size: int | None = HILLSHADE_BLOCK_SIZE,
+    scratch_dir: Path | None = None,
+    memory_budget: int | None = None,
+) -> None:
+    """
+    Write terrain covariates (see terrain.py) for one DTM in a single pass.
+
+    out_paths maps each wanted product in TERRAIN_PRODUCTS to its output
+    path. Every block is read once with a one-pixel halo and all products
+    come from one shared gradient pass over it. With aoi set, dem_path is
+    read through the AOI crop window and mask, as in the fused mode.
+    hillshade_multi is written as uint8 with the fixed cos-incidence
+    stretch; the rest are float32 with NaN nodata. block_size=None takes
+    the whole DTM as one block, or, beyond memory_budget, reads it into a
+    memmap under scratch_dir and derives the products in strips.
+    """
+    products = tuple(out_paths)
+
+    with rasterio.open(dem_path) as src:
+        crop, geoms = None, None
+        if aoi is not None:
+            crop, geoms = aoi_crop_window(src, aoi)
+        else:
+            crop = Window(0, 0, src.width, src.height)
+
+        x_res = src.transform.a
+        y_res = -src.transform.e
+
+        base = src.meta.copy()
+        base.update(
+            {
+                "driver": "GTiff",
+                "count": 1,
+                "height": crop.height,
+                "width": crop.width,
+                "transform": src.window_transform(crop),
+            }
+        )
+
+        with ExitStack() as stack:
+            dsts = {}
+            for product, path in out_paths.items():
+                meta = dict(base)
+                if product == "hillshade_multi":
+                    meta.update(dtype=rasterio.uint8, nodata=0)
+                    dsts[product] = stack.enter_context(cog_writer(path, meta, "hillshade"))
+                else:
+                    meta.update(dtype="float32", nodata=np.nan)
+                    dsts[product] = stack.enter_context(cog_writer(path, meta, "terrain"))
+
+            shape = (crop.height, crop.width)
+            if block_size is None and not fits_in_memory(shape, TERRAIN_WORKING_ARRAYS, memory_budget):
+                print(f"  ⚠️ {Path(dem_path).name}: whole-tile terrain pass exceeds the memory budget, using memmap scratch")
+                dem_all = read_to_scratch(src, stack.enter_context(scratch_arrays(scratch_dir)), crop, geoms)
+                dem_blocks = (
+                    (Window(0, row_off, crop.width, n_rows), *strip_with_halo(dem_all, row_off, n_rows))
+                    for row_off, n_rows in iter_strips(crop.height)
+                )
+            else:
+                size = block_size or max(shape)
+                dem_blocks = (
+                    (window, *read_block_with_halo(src, window, crop=crop, geoms=geoms))
+                    for window in iter_block_windows(crop.width, crop.height, size)
+                )
+
+            for window, dem, inner in dem_blocks:
+                blocks = terrain_block(dem, inner, x_res, y_res, products, altitude=altitude)
+                for product, data in blocks.items():
+                    if product == "hillshade_multi":
+                        data = scale_hillshade(data, 0.0, 1.0)
+                    dsts[product].write(data, 1, window=window)
+
+    for path in out_paths.values():
+        print(f"Saved terrain derivative: {path}")
+
+
+def fused_tile_products(
+    dtm_path: Path,
+    aoi_gdf: gpd.GeoDataFrame,
+    hillshade_path: Path,
+    dtm_10m_path: Path,
+    clipped_path: Path | None = None,
+    azimuth=315,
+    altitude=45,
+    target_res: float = 10,
+    stretch="tile",
+    block_size: int = HILLSHADE_BLOCK_SIZE,
+    stats_path: Path | None = None,
+    stats=AGG_STATS,
+) -> None:
+    """
+    Clip, hillshade and 10 m mean-resample one raw tile from a single read.
+
+    The AOI crop window is streamed in row strips (a multiple of the 10 m
+    factor high, with a one-row halo); each strip feeds the hillshade and
+    the block aggregate (aggregate_block) directly, and is only written as
+    a clipped 1 m DTM if clipped_path is given. stats_path adds the
+    multi-statistic 10 m raster, as in resample_to_10m. target_res must be
+    an integer multiple of the tile resolution. stretch is as for
+    compute_hillshade; "tile" costs an extra stats read over the AOI window.
+    """
+    if isinstance(stretch, str) and stretch not in ("tile", "fixed"):
+        raise ValueError(f"Unknown hillshade stretch: {stretch!r}")
 
-        transform = src.transform * rasterio.Affine.scale(scale, scale)
+    with rasterio.open(dtm_path) as src:
+        crop, geoms = aoi_crop_window(src, aoi_gdf)
 
-        kwargs = src.meta.copy()
-        kwargs.update(
+        factor = int(round(target_res / src.res[0]))
+        if factor < 1 or not np.isclose(target_res / src.res[0], factor):
+            raise ValueError(
+                f"Fused mode needs an integer resample factor, got {target_res} / {src.res[0]}"
+            )
+
+        if stretch == "fixed":
+            hs_range = (0.0, 1.0)
+        elif stretch == "tile":
+            hs_range = hillshade_range([dtm_path], azimuth, altitude, block_size, aoi=aoi_gdf)
+        else:
+            hs_range = tuple(stretch)
+
+        x_res = src.transform.a
+        y_res = -src.transform.e
+        height, width = crop.height, crop.width
+        crop_transform = src.window_transform(crop)
+        fill = src.nodata if src.nodata is not None else 0
+
+        clip_meta = src.meta.copy()
+        clip_meta.update(
+            {"driver": "GTiff", "height": height, "width": width, "transform": crop_transform}
+        )
+
+        hs_profile = clip_meta.copy()
+        hs_profile.update(dtype=rasterio.uint8, count=1, nodata=0)
+
+        # Partial 10 m cells at the right/bottom edge are kept, as in resample_to_10m
+        agg_nodata = src.nodata if src.nodata is not None else np.nan
+        agg_meta = clip_meta.copy()
+        agg_meta.update(
             {
-                "height": new_height,
-                "width": new_width,
-                "transform": transform,
+                "height": -(-height // factor),
+                "width": -(-width // factor),
+                "transform": crop_transform * rasterio.Affine.scale(factor, factor),
+                "dtype": "float32",
+                "nodata": agg_nodata,
             }
         )
+        stats_meta = dict(agg_meta, count=len(stats))
+
+        strip = max(block_size // factor, 1) * factor
+
+        with ExitStack() as stack:
+            outputs = [hillshade_path, dtm_10m_path] + ([clipped_path] if clipped_path else [])
+            for path in outputs:
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+            hs_dst = stack.enter_context(cog_writer(hillshade_path, hs_profile, "hillshade"))
+            agg_dst = stack.enter_context(cog_writer(dtm_10m_path, agg_meta, "dtm"))
+            clip_dst = None
+            if clipped_path is not None:
+                clip_dst = stack.enter_context(cog_writer(clipped_path, clip_meta, "dtm"))
+            stats_dst = None
+            if stats_path is not None:
+                stats_dst = stack.enter_context(cog_writer(stats_path, stats_meta, "dtm"))
+                stats_dst.descriptions = tuple(stats)
+
+            for row_off in range(0, height, strip):
+                window = Window(0, row_off, width, min(strip, height - row_off))
+                dem, inner = read_block_with_halo(src, window, crop=crop, geoms=geoms)
+                block = dem[inner]
+
+                hs = hillshade_block(dem, x_res, y_res, azimuth, altitude)[inner]
+                hs_dst.write(scale_hillshade(hs, *hs_range), 1, window=window)
+
+                if clip_dst is not None:
+                    clipped = np.where(np.isnan(block), fill, block).astype(clip_meta["dtype"])
+                    clip_dst.write(clipped, 1, window=window)
+
+                # factor x factor cell statistics, ignoring nodata; the mean is
+                # always needed for the 10 m DTM, whatever the stats band list
+                block_stats = sorted({"mean", *stats}, key=AGG_STATS.index) if stats_dst else ("mean",)
+                agg = aggregate_block(block, factor, block_stats)
+                agg_window = Window(0, row_off // factor, agg_meta["width"], agg["mean"].shape[0])
+                for dst, band_stats in ((agg_dst, ["mean"]), (stats_dst, stats)):
+                    if dst is None:
+                        continue
+                    for band, stat in enumerate(band_stats, start=1):
+                        data = agg[stat]
+                        if not np.isnan(agg_nodata):
+                            data = np.where(np.isnan(data), agg_nodata, data)
+                        dst.write(data, band, window=agg_window)
+
+    if clipped_path is not None:
+        print(f"Saved clipped raster: {clipped_path}")
+    print(f"Saved hillshade: {hillshade_path}")
+    print(f"Saved resampled DTM ({target_res:g} m): {dtm_10m_path}")
+    if stats_path is not None:
+        print(f"Saved {target_res:g} m DTM statistics ({', '.join(stats)}): {stats_path}")
+
+
+# numpy dtype name -> GDAL data type name, for VRTRasterBand dataType
+GDAL_TYPE_NAMES = {
+    "uint8": "Byte",
+    "int8": "Int8",
+    "uint16": "UInt16",
+    "int16": "Int16",
+    "uint32": "UInt32",
+    "int32": "Int32",
+    "uint64": "UInt64",
+    "int64": "Int64",
+    "float32": "Float32",
+    "float64": "Float64",
+}
+
+
+def build_site_vrt(tile_paths, aoi_gdf: gpd.GeoDataFrame, vrt_path: Path) -> Path:
+    """
+    Write a GDAL VRT mosaicking the tiles whose bounds intersect the AOI.
+
+    Tiles must share CRS, pixel size, dtype and grid alignment (true for the
+    EA composite tiles). Tiles outside the AOI bounds are left out, so they
+    are never opened by the clip / hillshade / resample steps that read the
+    VRT. Returns vrt_path.
+    """
+    tiles = []
+    for tile_path in tile_paths:
+        with rasterio.open(tile_path) as src:
+            aoi_local = aoi_gdf.to_crs(src.crs) if aoi_gdf.crs != src.crs else aoi_gdf
+            left, bottom, right, top = aoi_local.total_bounds
+            b = src.bounds
+            if left >= b.right or right <= b.left or bottom >= b.top or top <= b.bottom:
+                print(f"Skipping tile outside AOI: {tile_path}")
+                continue
+            tiles.append(
+                {
+                    "path": Path(tile_path),
+                    "crs": src.crs,
+                    "res": src.res,
+                    "dtype": src.dtypes[0],
+                    "nodata": src.nodata,
+                    "bounds": b,
+                    "shape": (src.height, src.width),
+                }
+            )
 
-        data = src.read(
-            out_shape=(src.count, new_height, new_width),
-            resampling=Resampling.average,
+    if not tiles:
+        raise ValueError(f"No tiles intersect the AOI for {vrt_path.name}")
+
+    ref = tiles[0]
+    for t in tiles[1:]:
+        if (t["crs"], t["res"], t["dtype"]) != (ref["crs"], ref["res"], ref["dtype"]):
+            raise ValueError(f"Tile {t['path']} does not match {ref['path']} (CRS/res/dtype)")
+    if ref["dtype"] not in GDAL_TYPE_NAMES:
+        raise ValueError(f"Unsupported tile dtype for a VRT mosaic: {ref['dtype']}")
+
+    x_res, y_res = ref["res"]
+    left = min(t["bounds"].left for t in tiles)
+    top = max(t["bounds"].top for t in tiles)
+    right = max(t["bounds"].right for t in tiles)
+    bottom = min(t["bounds"].bottom for t in tiles)
+    width = int(round((right - left) / x_res))
+    height = int(round((top - bottom) / y_res))
+
+    root = ET.Element("VRTDataset", rasterXSize=str(width), rasterYSize=str(height))
+    ET.SubElement(root, "SRS").text = ref["crs"].to_wkt()
+    ET.SubElement(root, "GeoTransform").text = f"{left!r}, {x_res!r}, 0, {top!r}, 0, {-y_res!r}"
+    band = ET.SubElement(root, "VRTRasterBand", dataType=GDAL_TYPE_NAMES[ref["dtype"]], band="1")
+    if ref["nodata"] is not None:
+        ET.SubElement(band, "NoDataValue").text = repr(ref["nodata"])
+
+    for t in tiles:
+        x_off = (t["bounds"].left - left) / x_res
+        y_off = (top - t["bounds"].top) / y_res
+        if not (np.isclose(x_off, round(x_off)) and np.isclose(y_off, round(y_off))):
+            raise ValueError(f"Tile {t['path']} is not aligned to the mosaic grid")
+
+        rows, cols = t["shape"]
+        source = ET.SubElement(band, "ComplexSource")
+        ET.SubElement(source, "SourceFilename", relativeToVRT="0").text = str(t["path"].resolve())
+        ET.SubElement(source, "SourceBand").text = "1"
+        ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(cols), ySize=str(rows))
+        ET.SubElement(
+            source,
+            "DstRect",
+            xOff=str(int(round(x_off))),
+            yOff=str(int(round(y_off))),
+            xSize=str(cols),
+            ySize=str(rows),
         )
+        if t["nodata"] is not None:
+            ET.SubElement(source, "NODATA").text = repr(t["nodata"])
+
+    vrt_path.parent.mkdir(parents=True, exist_ok=True)
+    ET.ElementTree(root).write(vrt_path, encoding="utf-8")
+    print(f"Saved site mosaic VRT ({len(tiles)} tile(s)): {vrt_path}")
+    return vrt_path
+
+
+def load_manifest(manifest_path: Path = MANIFEST_PATH) -> dict:
+    """Load the build manifest, or an empty one if it does not exist yet."""
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}, "outputs": {}}
+
+
+def save_manifest(manifest: dict, manifest_path: Path = MANIFEST_PATH) -> None:
+    """Write the build manifest atomically (temp file + rename)."""
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def file_digest(path: Path, manifest: dict) -> str:
+    """
+    SHA-256 of a file's contents.
+
+    Digests are remembered in the manifest against size and mtime, so an
+    unchanged multi-GB tile is only hashed once.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    entry = manifest["files"].get(str(path))
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+
+    manifest["files"][str(path)] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": h.hexdigest(),
+    }
+    return h.hexdigest()
 
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        with rasterio.open(out_path, "w", **kwargs) as dst:
-            dst.write(data)
 
-    print(f"Saved resampled DTM (10 m): {out_path}")
+def build_key(input_digests, aoi_gdf: gpd.GeoDataFrame, params: dict) -> str:
+    """Content key for a set of outputs: input hashes + AOI geometry + parameters."""
+    payload = {
+        "inputs": sorted(input_digests),
+        "aoi": hashlib.sha256(aoi_gdf.geometry.values[0].wkb).hexdigest(),
+        "aoi_crs": aoi_gdf.crs.to_wkt() if aoi_gdf.crs is not None else None,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def is_fresh(manifest: dict, unit_id: str, key: str, out_paths) -> bool:
+    """True if unit_id was last built with key and all its outputs still exist."""
+    entry = manifest["outputs"].get(unit_id)
+    return bool(entry) and entry["key"] == key and all(Path(p).exists() for p in out_paths)
 
 
 # ----------------------------------------------------------------------
@@ -167,43 +782,473 @@ def resample_to_10m(in_path: Path, out_path: Path, target_res: float = 10) -> No
 # ----------------------------------------------------------------------
 
 
-def process_site(site_name: str, tile_codes) -> None:
+def tile_source_path(tile_code: str) -> Path:
+    """Raw DTM for a tile code, raising if it is missing."""
+    dtm_path = RAW_LIDAR_DIR / f"{tile_code}.tif"
+    if not dtm_path.exists():
+        raise FileNotFoundError(f"Expected LiDAR file not found: {dtm_path}")
+    return dtm_path
+
+
+def tile_output_paths(site_name: str, tile_code: str) -> dict:
+    """Output paths for one tile of a site, keyed by product."""
+    stem = OUT_DIR / site_name / f"{site_name}_{tile_code}"
+    return {
+        "clipped": Path(f"{stem}_DTM_1m_clipped.tif"),
+        "hillshade": Path(f"{stem}_hillshade_1m.tif"),
+        "dtm_10m": Path(f"{stem}_DTM_10m.tif"),
+        "dtm_10m_stats": Path(f"{stem}_DTM_10m_stats.tif"),
+        **{f"pyramid_{res:g}m": path for res, path in pyramid_paths(stem).items()},
+        **{product: Path(f"{stem}_{product}_1m.tif") for product in TERRAIN_PRODUCTS},
+    }
+
+
+def tile_pyramid_paths(paths: dict) -> dict:
+    """{res: path} of the pyramid levels in a tile_output_paths() dict."""
+    return {res: paths[f"pyramid_{res:g}m"] for res in PYRAMID_LEVELS}
+
+
+def clip_tile(site_name: str, tile_code: str, dtm_path: Path, aoi: gpd.GeoDataFrame) -> Path:
+    """Work unit: clip one LiDAR tile to a site AOI, return the clipped path."""
+    print(f"Using DTM for tile_code='{tile_code}': {dtm_path}")
+
+    clipped_path = tile_output_paths(site_name, tile_code)["clipped"]
+    clip_raster_to_aoi(dtm_path, aoi, clipped_path)
+    return clipped_path
+
+
+def derive_tile(
+    site_name: str,
+    tile_code: str,
+    clipped_path: Path,
+    stretch="tile",
+    derivatives=(),
+    agg_stats=(),
+    pyramid: bool = False,
+    pyramid_ref: Path | None = PYRAMID_REF,
+) -> None:
+    """Work unit: hillshade, 10 m resample, terrain derivatives and DTM pyramid for one clipped tile."""
+    paths = tile_output_paths(site_name, tile_code)
+    compute_hillshade(
+        clipped_path,
+        paths["hillshade"],
+        azimuth=HILLSHADE_AZIMUTH,
+        altitude=HILLSHADE_ALTITUDE,
+        stretch=stretch,
+    )
+    resample_to_10m(
+        clipped_path,
+        paths["dtm_10m"],
+        target_res=TARGET_RES,
+        stats_path=paths["dtm_10m_stats"] if agg_stats else None,
+        stats=agg_stats,
+    )
+    if derivatives:
+        compute_terrain_derivatives(
+            clipped_path,
+            {product: paths[product] for product in derivatives},
+            altitude=HILLSHADE_ALTITUDE,
+        )
+    if pyramid:
+        build_dtm_pyramid(clipped_path, tile_pyramid_paths(paths), pyramid_ref)
+
+
+def fused_tile(
+    site_name: str,
+    tile_code: str,
+    dtm_path: Path,
+    aoi: gpd.GeoDataFrame,
+    stretch="tile",
+    keep_clipped: bool = False,
+    derivatives=(),
+    agg_stats=(),
+    pyramid: bool = False,
+    pyramid_ref: Path | None = PYRAMID_REF,
+) -> None:
     """
-    Process one site that may span multiple LiDAR tiles.
+    Work unit: all products for one raw tile via fused_tile_products().
+
+    The DTM pyramid is built from the clipped DTM, so pyramid needs
+    keep_clipped.
+    """
+    print(f"Using DTM for tile_code='{tile_code}': {dtm_path}")
+    paths = tile_output_paths(site_name, tile_code)
+    fused_tile_products(
+        dtm_path,
+        aoi,
+        paths["hillshade"],
+        paths["dtm_10m"],
+        clipped_path=paths["clipped"] if keep_clipped else None,
+        azimuth=HILLSHADE_AZIMUTH,
+        altitude=HILLSHADE_ALTITUDE,
+        target_res=TARGET_RES,
+        stretch=stretch,
+        stats_path=paths["dtm_10m_stats"] if agg_stats else None,
+        stats=agg_stats,
+    )
+    if derivatives:
+        compute_terrain_derivatives(
+            dtm_path,
+            {product: paths[product] for product in derivatives},
+            aoi=aoi,
+            altitude=HILLSHADE_ALTITUDE,
+        )
+    if pyramid:
+        build_dtm_pyramid(paths["clipped"], tile_pyramid_paths(paths), pyramid_ref)
 
-    For each tile:
-    - Clip tile to AOI  ->  *_DTM_1m_clipped.tif
-    - Generate hillshade (1 m) -> *_hillshade_1m.tif
-    - Resample DTM to 10 m -> *_DTM_10m.tif
 
-    No mosaicking – outputs are per-tile.
+def process_sites(
+    site_tile_map: dict,
+    stretch="site",
+    workers: int = 1,
+    fused: bool = False,
+    keep_clipped: bool = True,
+    mosaic: bool = False,
+    incremental: bool = True,
+    derivatives=(),
+    agg_stats=(),
+    pyramid: bool = False,
+    pyramid_ref: Path | None = PYRAMID_REF,
+) -> list:
     """
-    print(f"\n=== Processing site '{site_name}' ===")
-    aoi = load_aoi_for_site(site_name)
+    Process several sites, fanning the (site, tile) units out over workers.
+
+    Stages run as clip -> (site hillshade range) -> hillshade + resample,
+    with every unit of a stage submitted to the same pool. With fused=True
+    the clip stage is skipped: the site range is read through the AOI
+    window of the raw tiles and each tile's products come from one pass
+    (fused_tile_products); keep_clipped controls whether the 1 m clipped
+    DTM is still written. With mosaic=True each site's tiles are first
+    joined in a VRT (build_site_vrt) and the site becomes a single
+    (site, "mosaic") unit, giving one seamless set of outputs per site.
+    derivatives lists TERRAIN_PRODUCTS to write alongside the hillshade;
+    agg_stats lists AGG_STATS for a multi-band *_DTM_10m_stats.tif.
+    pyramid=True adds *_DTM_<res>m_pyramid.tif for each of PYRAMID_LEVELS,
+    snapped to the grid of pyramid_ref (see pyramid.py); with fused=True
+    it needs keep_clipped.
+
+    With incremental=True, units whose outputs were last built from the
+    same input content, AOI geometry and parameters (see build_key) are
+    skipped; with stretch="site" a site is rebuilt as a whole because its
+    tiles share one range. The manifest lives at MANIFEST_PATH.
+
+    Sites mapped to None get their tiles from the tile index by AOI
+    intersection (tiles_for_aoi).
+
+    Failures are reported per unit and the remaining units carry on.
+    Returns a list of (site, tile, stage, error) for the units that failed.
+    """
+    if pyramid and fused and not keep_clipped:
+        raise ValueError("The DTM pyramid is built from the clipped DTM: keep_clipped must be set with fused=True")
+
+    failures = []
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    site_tile_map = dict(site_tile_map)
 
-    site_out_dir = OUT_DIR / site_name
-    site_out_dir.mkdir(parents=True, exist_ok=True)
+    aois = {}
+    for site_name, tile_codes in site_tile_map.items():
+        print(f"\n=== Processing site '{site_name}' ===")
+        try:
+            aois[site_name] = load_aoi_for_site(site_name)
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+            failures.extend((site_name, t, "aoi", err) for t in tile_codes or ["*"])
+            continue
 
-    for tile_code in tile_codes:
-        dtm_path = RAW_LIDAR_DIR / f"{tile_code}.tif"
-        if not dtm_path.exists():
-            raise FileNotFoundError(f"Expected LiDAR file not found: {dtm_path}")
+        if tile_codes is None:
+            try:
+                site_tile_map[site_name] = tiles_for_aoi(aois[site_name], RAW_LIDAR_DIR, TILE_INDEX_PATH)
+            except Exception as e:
+                failures.append((site_name, "*", "index", f"{type(e).__name__}: {e}"))
+                del aois[site_name]
+                continue
+            print(f"Tiles from index: {', '.join(site_tile_map[site_name]) or '(none)'}")
 
-        print(f"Using DTM for tile_code='{tile_code}': {dtm_path}")
+    # 0. Locate the raw tiles, or join each site's tiles in a VRT
+    sources = {}
+    inputs = {}
+    for site_name, tile_codes in site_tile_map.items():
+        if site_name not in aois:
+            continue
+        tile_paths = []
+        for tile_code in tile_codes:
+            try:
+                tile_paths.append(tile_source_path(tile_code))
+            except FileNotFoundError as e:
+                failures.append((site_name, tile_code, "locate", f"{type(e).__name__}: {e}"))
+                continue
+            if not mosaic:
+                sources[(site_name, tile_code)] = tile_paths[-1]
+                inputs[(site_name, tile_code)] = tile_paths[-1:]
 
-        # 1. Clip to 1 m DTM
-        clipped_path = site_out_dir / f"{site_name}_{tile_code}_DTM_1m_clipped.tif"
-        clip_raster_to_aoi(dtm_path, aoi, clipped_path)
+        if mosaic and tile_paths:
+            vrt_path = OUT_DIR / site_name / f"{site_name}_tiles.vrt"
+            try:
+                sources[(site_name, "mosaic")] = build_site_vrt(tile_paths, aois[site_name], vrt_path)
+                inputs[(site_name, "mosaic")] = tile_paths
+            except Exception as e:
+                failures.append((site_name, "mosaic", "mosaic", f"{type(e).__name__}: {e}"))
 
-        # 2. Hillshade at 1 m
-        hillshade_path = site_out_dir / f"{site_name}_{tile_code}_hillshade_1m.tif"
-        compute_hillshade(clipped_path, hillshade_path)
+    units = list(sources)
 
-        # 3. Resample to 10 m
-        dtm_10m_path = site_out_dir / f"{site_name}_{tile_code}_DTM_10m.tif"
-        resample_to_10m(clipped_path, dtm_10m_path)
+    # Skip units whose outputs are already up to date
+    manifest = load_manifest()
+    params = {
+        "azimuth": HILLSHADE_AZIMUTH,
+        "altitude": HILLSHADE_ALTITUDE,
+        "target_res": TARGET_RES,
+        "stretch": stretch,
+        "fused": fused,
+        "mosaic": mosaic,
+        "derivatives": sorted(derivatives),
+        "agg_stats": list(agg_stats),
+        "resampler": "exact-area",
+        "pyramid": list(PYRAMID_LEVELS) if pyramid else None,
+        "pyramid_ref": str(pyramid_ref) if pyramid and pyramid_ref else None,
+        "cog": raster_profiles.COG_OUTPUT,
+        "profiles": raster_profiles.PRODUCT_PROFILES,
+    }
+    unit_keys, unit_outputs = {}, {}
+    for key in units:
+        paths = tile_output_paths(*key)
+        unit_outputs[key] = [paths["hillshade"], paths["dtm_10m"]]
+        unit_outputs[key] += [paths[product] for product in derivatives]
+        if agg_stats:
+            unit_outputs[key].append(paths["dtm_10m_stats"])
+        if pyramid:
+            unit_outputs[key] += list(tile_pyramid_paths(paths).values())
+        if keep_clipped or not fused:
+            unit_outputs[key].append(paths["clipped"])
+
+    for site_name in aois:
+        site_units = [key for key in units if key[0] == site_name]
+        digests = {key: [file_digest(p, manifest) for p in inputs[key]] for key in site_units}
+        groups = [site_units] if stretch == "site" else [[key] for key in site_units]
+        for group in groups:
+            group_digests = [d for key in group for d in digests[key]]
+            for key in group:
+                unit_keys[key] = build_key(group_digests, aois[site_name], params)
+            if incremental and all(
+                is_fresh(manifest, "/".join(key), unit_keys[key], unit_outputs[key])
+                for key in group
+            ):
+                for key in group:
+                    print(f"Up to date, skipping {'/'.join(key)}")
+                    del sources[key]
+
+    # 1. Clip to 1 m DTM (fused: read straight from the sources)
+    if not fused:
+        jobs = [(key, (*key, path, aois[key[0]])) for key, path in sources.items()]
+        sources = {}
+        for key, clipped_path, err in run_units(clip_tile, jobs, workers):
+            if err:
+                failures.append((*key, "clip", err))
+            else:
+                sources[key] = clipped_path
+
+    # 2. Shared hillshade stretch per site, reduced from per-tile ranges
+    site_stretch = {}
+    if stretch == "site":
+        jobs = []
+        for key, path in sources.items():
+            aoi = aois[key[0]] if fused else None
+            jobs.append(
+                (key, ([path], HILLSHADE_AZIMUTH, HILLSHADE_ALTITUDE, HILLSHADE_BLOCK_SIZE, aoi))
+            )
+        for (site_name, tile_code), hs_range, err in run_units(hillshade_range, jobs, workers):
+            if err:
+                # Not part of the site range, so not derived with it either
+                failures.append((site_name, tile_code, "stretch", err))
+                del sources[(site_name, tile_code)]
+                continue
+            lo, hi = site_stretch.get(site_name, (np.inf, -np.inf))
+            if np.isfinite(hs_range[0]):
+                site_stretch[site_name] = (min(lo, hs_range[0]), max(hi, hs_range[1]))
+        for site_name, (lo, hi) in site_stretch.items():
+            print(f"Site hillshade range for '{site_name}': {lo:.4f} – {hi:.4f}")
+
+    # 3. Hillshade at 1 m and resample to 10 m
+    jobs = []
+    for key, path in sources.items():
+        if stretch == "site":
+            tile_stretch = site_stretch.get(key[0], (np.nan, np.nan))
+        else:
+            tile_stretch = stretch
+        if fused:
+            jobs.append(
+                (
+                    key,
+                    (
+                        *key,
+                        path,
+                        aois[key[0]],
+                        tile_stretch,
+                        keep_clipped,
+                        tuple(derivatives),
+                        tuple(agg_stats),
+                        pyramid,
+                        pyramid_ref,
+                    ),
+                )
+            )
+        else:
+            jobs.append(
+                (key, (*key, path, tile_stretch, tuple(derivatives), tuple(agg_stats), pyramid, pyramid_ref))
+            )
+    for key, _, err in run_units(fused_tile if fused else derive_tile, jobs, workers):
+        if err:
+            failures.append((*key, "derive", err))
+
+    # Record what the successful units were built from
+    failed_units = {(site_name, tile_code) for site_name, tile_code, _, _ in failures}
+    for key in units:
+        unit_id = "/".join(key)
+        if key in failed_units:
+            manifest["outputs"].pop(unit_id, None)
+        elif key in sources:
+            manifest["outputs"][unit_id] = {
+                "key": unit_keys[key],
+                "outputs": [str(p) for p in unit_outputs[key]],
+            }
+    save_manifest(manifest)
+
+    n_units = len(failed_units | set(units))
+    print(f"\n{n_units - len(failed_units)}/{n_units} unit(s) processed")
+    for site_name, tile_code, stage, err in failures:
+        print(f"  FAILED {site_name}/{tile_code} at {stage}: {err}")
+
+    return failures
+
+
+def process_site(
+    site_name: str,
+    tile_codes,
+    stretch="site",
+    workers: int = 1,
+    fused: bool = False,
+    keep_clipped: bool = True,
+    mosaic: bool = False,
+    incremental: bool = True,
+    derivatives=(),
+    agg_stats=(),
+    pyramid: bool = False,
+    pyramid_ref: Path | None = PYRAMID_REF,
+) -> list:
+    """
+    Process one site that may span multiple LiDAR tiles.
+
+    For each tile:
+    - Clip tile to AOI  ->  *_DTM_1m_clipped.tif
+    - Generate hillshade (1 m) -> *_hillshade_1m.tif
+    - Resample DTM to 10 m -> *_DTM_10m.tif
+    - Optional 10 m statistics -> *_DTM_10m_stats.tif
+    - Optional terrain derivatives -> *_<product>_1m.tif
+    - Optional DTM pyramid on the reference grid -> *_DTM_<res>m_pyramid.tif
+
+    Outputs are per-tile unless mosaic=True, in which case the tiles are
+    read through one site VRT and written as *_mosaic_*. With
+    stretch="site" (default) all clipped tiles are scanned first so every
+    hillshade in the site shares one min/max stretch; "tile" and "fixed"
+    are passed to compute_hillshade.
+    Returns the failed units, see process_sites().
+    """
+    return process_sites(
+        {site_name: tile_codes},
+        stretch=stretch,
+        workers=workers,
+        fused=fused,
+        keep_clipped=keep_clipped,
+        mosaic=mosaic,
+        incremental=incremental,
+        derivatives=derivatives,
+        agg_stats=agg_stats,
+        pyramid=pyramid,
+        pyramid_ref=pyramid_ref,
+    )
 
 
 if __name__ == "__main__":
-    for site_name, tile_codes in SITE_TILE_MAP.items():
-        process_site(site_name, tile_codes)
+    parser = argparse.ArgumentParser(description="Clip, hillshade and resample LiDAR DTM tiles per site")
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size for (site, tile) units")
+    parser.add_argument(
+        "--stretch",
+        default="site",
+        choices=["site", "tile", "fixed"],
+        help="Hillshade stretch: shared per site, per tile, or fixed cos-incidence",
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Read each tile's AOI window once and write all products from it",
+    )
+    parser.add_argument(
+        "--no-clipped",
+        action="store_true",
+        help="With --fused, skip writing the *_DTM_1m_clipped.tif intermediate",
+    )
+    parser.add_argument(
+        "--mosaic",
+        action="store_true",
+        help="Join each site's tiles in a VRT and write one seamless output per site",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every output even if the build manifest says it is up to date",
+    )
+    parser.add_argument(
+        "--derivatives",
+        nargs="*",
+        default=[],
+        choices=TERRAIN_PRODUCTS,
+        help="Terrain covariates to write per tile from one gradient pass",
+    )
+    parser.add_argument(
+        "--agg-stats",
+        nargs="*",
+        default=[],
+        choices=AGG_STATS,
+        help="Statistics for a multi-band *_DTM_10m_stats.tif from the 10 m aggregation pass",
+    )
+    parser.add_argument(
+        "--pyramid",
+        action="store_true",
+        help=f"Also write DTM levels at {', '.join(f'{r:g}' for r in PYRAMID_LEVELS)} m snapped to --pyramid-ref",
+    )
+    parser.add_argument(
+        "--pyramid-ref",
+        default=PYRAMID_REF,
+        help="Raster (e.g. the S2 stack) whose CRS / pixel origin the pyramid snaps to",
+    )
+    parser.add_argument(
+        "--sites",
+        nargs="+",
+        default=None,
+        help="AOI layers to process (default: SITE_TILE_MAP); sites not in the map use the tile index",
+    )
+    parser.add_argument(
+        "--use-index",
+        action="store_true",
+        help="Pick every site's tiles from the tile index by AOI, ignoring SITE_TILE_MAP lists",
+    )
+    args = parser.parse_args()
+
+    site_tile_map = {s: SITE_TILE_MAP.get(s) for s in args.sites} if args.sites else dict(SITE_TILE_MAP)
+    if args.use_index:
+        site_tile_map = dict.fromkeys(site_tile_map)
+
+    failed = process_sites(
+        site_tile_map,
+        stretch=args.stretch,
+        workers=args.workers,
+        fused=args.fused,
+        keep_clipped=not args.no_clipped,
+        mosaic=args.mosaic,
+        incremental=not args.force,
+        derivatives=args.derivatives,
+        agg_stats=args.agg_stats,
+        pyramid=args.pyramid,
+        pyramid_ref=Path(args.pyramid_ref) if args.pyramid_ref else None,
+    )
+    if failed:
+        sys.exit(1)
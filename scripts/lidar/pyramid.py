@@ -0,0 +1,251 @@
+"""
+Multi-resolution DTM pyramid snapped to a reference (e.g. Sentinel-2) grid.
+
+resample_to_10m() keeps the clipped tile's own origin, so its 10 m cells
+sit at an arbitrary offset from the Sentinel-2 10 / 20 / 60 m pixels and
+every fusion step needs another resample. build_dtm_pyramid() instead
+writes one DTM per level (2, 5, 10, 20, 60 m by default) on a grid whose
+origin is snapped to a reference raster (e.g. the stack written by
+stack_s2_clipped_bands.py), so each level lines up pixel-for-pixel with
+the optical bands of the same resolution.
+
+The levels come out of one cascaded, strip-wise pass over a base grid
+whose cell is the greatest common divisor of the levels (1 m for the
+defaults):
+- the base is read from the DTM directly when the DTM is already on a
+  sub-grid of it, else through one GDAL average warp into the reference
+  CRS;
+- every level is then summed from the coarsest level already built that
+  nests in it (2 <- 1, 5 <- 1, 10 <- 5, 20 <- 10, 60 <- 20 m), carrying
+  the valid area alongside the value sum. All factors are integers, so
+  each level is the exact area-weighted mean of the base with nodata left
+  out, whichever chain it came through.
+
+The pyramid extent is snapped outward to the coarsest level, so all levels
+cover the same area and every coarse cell nests in the finer grids.
+
+Example:
+    python pyramid.py site_SP88sw_DTM_1m_clipped.tif --ref desborough_s2_stack.tif
+"""
+
+import argparse
+import math
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+
+# scripts/common holds the helpers shared with the sentinel scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.raster_profiles import cog_writer
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# Pyramid resolutions in metres, finest first; each must divide the coarsest
+PYRAMID_LEVELS = (2, 5, 10, 20, 60)
+
+# Coarsest-level rows per strip (8 x 60 m = 480 m of DTM per read)
+PYRAMID_STRIP_ROWS = 8
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def reference_grid(src, ref_path: Path | None = None) -> tuple:
+    """
+    (crs, x0, y0) of the grid to snap to.
+
+    With ref_path, the CRS and pixel origin of that raster (e.g. the S2
+    stack); without, src's own CRS with the origin at (0, 0).
+    """
+    if ref_path is None:
+        return src.crs, 0.0, 0.0
+    with rasterio.open(ref_path) as ref:
+        return ref.crs, ref.transform.c, ref.transform.f
+
+
+def check_levels(levels) -> tuple:
+    """
+    (levels sorted finest first, base cell size).
+
+    The base is the greatest common divisor of the levels, to the
+    millimetre. Raises ValueError unless every level divides the coarsest.
+    """
+    levels = tuple(sorted(float(r) for r in levels))
+    if not levels or levels[0] <= 0:
+        raise ValueError(f"Pyramid levels must be positive: {levels}")
+    coarsest = levels[-1]
+    for res in levels:
+        ratio = coarsest / res
+        if abs(ratio - round(ratio)) > 1e-9:
+            raise ValueError(f"Pyramid level {res:g} m does not divide the coarsest level ({coarsest:g} m)")
+    base = math.gcd(*(round(res * 1000) for res in levels)) / 1000
+    return levels, base
+
+
+def snapped_extent(bounds, x0: float, y0: float, cell: float) -> tuple:
+    """(left, top, width_m, height_m) of bounds grown outward to cell multiples from (x0, y0)."""
+    xmin, ymin, xmax, ymax = bounds
+    left = x0 + math.floor((xmin - x0) / cell + 1e-9) * cell
+    right = x0 + math.ceil((xmax - x0) / cell - 1e-9) * cell
+    bottom = y0 + math.floor((ymin - y0) / cell + 1e-9) * cell
+    top = y0 + math.ceil((ymax - y0) / cell - 1e-9) * cell
+    return left, top, right - left, top - bottom
+
+
+def direct_factor(src, crs, left: float, top: float, res: float) -> int | None:
+    """
+    Integer factor from src pixels to the res grid at (left, top), or None.
+
+    None means src is not on a sub-grid of it (other CRS, pixel size or
+    origin) and has to be warped.
+    """
+    src_res = src.transform.a
+    if src.crs != crs or abs(src_res + src.transform.e) > 1e-9 or src.transform.b or src.transform.d:
+        return None
+    factor = res / src_res
+    col_off = (left - src.transform.c) / src_res
+    row_off = (src.transform.f - top) / src_res
+    if any(abs(v - round(v)) > 1e-6 for v in (factor, col_off, row_off)):
+        return None
+    return int(round(factor))
+
+
+def block_sum(a: np.ndarray, factor: int) -> np.ndarray:
+    """Sum of each factor x factor block (shape must be a multiple of factor)."""
+    h, w = a.shape
+    return a.reshape(h // factor, factor, w // factor, factor).sum(axis=(1, 3))
+
+
+def parent_level(res: float, built) -> float:
+    """Coarsest already-built cell size that nests in res (the base always does)."""
+    return max(p for p in built if abs(res / p - round(res / p)) < 1e-9)
+
+
+def build_dtm_pyramid(
+    dtm_path: Path,
+    out_paths: dict,
+    ref_path: Path | None = None,
+    strip_rows: int = PYRAMID_STRIP_ROWS,
+) -> dict:
+    """
+    Write one DTM per resolution in out_paths ({res_m: path}) on the reference grid.
+
+    Levels are built finest first, each from the coarsest earlier level
+    nesting in it (or the base grid), in strips of strip_rows
+    coarsest-level rows. Outputs are float32 with the DTM's
+    nodata (or NaN). Returns out_paths.
+    """
+    levels, base = check_levels(out_paths)
+    paths = {float(res): Path(path) for res, path in out_paths.items()}
+    coarsest = levels[-1]
+
+    with ExitStack() as stack:
+        src = stack.enter_context(rasterio.open(dtm_path))
+        crs, x0, y0 = reference_grid(src, ref_path)
+        bounds = src.bounds if src.crs == crs else transform_bounds(src.crs, crs, *src.bounds)
+        left, top, width_m, height_m = snapped_extent(bounds, x0, y0, coarsest)
+        nodata = src.nodata if src.nodata is not None else np.nan
+
+        factor = direct_factor(src, crs, left, top, base)
+        if factor is None:
+            # Off-grid or another CRS: one average warp onto the base grid
+            reader = stack.enter_context(
+                WarpedVRT(
+                    src,
+                    crs=crs,
+                    transform=Affine(base, 0, left, 0, -base, top),
+                    width=round(width_m / base),
+                    height=round(height_m / base),
+                    resampling=Resampling.average,
+                )
+            )
+            src_res, col_off, row_off = base, 0, 0
+        else:
+            reader = src
+            src_res = src.transform.a
+            col_off = round((left - src.transform.c) / src_res)
+            row_off = round((src.transform.f - top) / src_res)
+
+        dsts = {}
+        for res in levels:
+            meta = src.meta.copy()
+            meta.update(
+                {
+                    "driver": "GTiff",
+                    "crs": crs,
+                    "transform": Affine(res, 0, left, 0, -res, top),
+                    "width": round(width_m / res),
+                    "height": round(height_m / res),
+                    "count": 1,
+                    "dtype": "float32",
+                    "nodata": nodata,
+                }
+            )
+            dsts[res] = stack.enter_context(cog_writer(paths[res], meta, "dtm"))
+
+        n_rows = round(height_m / coarsest)
+        for strip in range(0, n_rows, strip_rows):
+            strip_top = strip * coarsest
+            strip_h = min(strip_rows, n_rows - strip) * coarsest
+
+            window = Window(
+                col_off,
+                row_off + round(strip_top / src_res),
+                round(width_m / src_res),
+                round(strip_h / src_res),
+            )
+            block = reader.read(1, window=window, masked=True, boundless=factor is not None)
+            block = block.astype("float32").filled(np.nan)
+            # (value sum, valid area) per cell, on the base grid
+            valid = ~np.isnan(block)
+            sums = {base: (np.where(valid, block, 0).astype("float64"), valid.astype("float64"))}
+            if factor not in (None, 1):
+                sums[base] = tuple(block_sum(a, factor) for a in sums[base])
+
+            for res in levels:
+                if res not in sums:
+                    parent = parent_level(res, sums)
+                    sums[res] = tuple(block_sum(a, round(res / parent)) for a in sums[parent])
+                total, area = sums[res]
+                data = np.divide(total, area, out=np.full(area.shape, np.nan), where=area > 0)
+                data = data.astype("float32")
+                if not np.isnan(nodata):
+                    data[np.isnan(data)] = nodata
+                dsts[res].write(data, 1, window=Window(0, round(strip_top / res), *data.shape[::-1]))
+
+    for res in levels:
+        print(f"Saved pyramid DTM ({res:g} m): {paths[res]}")
+    return out_paths
+
+
+def pyramid_paths(stem: Path, levels=PYRAMID_LEVELS) -> dict:
+    """{res: <stem>_DTM_<res>m_pyramid.tif} for each level."""
+    return {res: Path(f"{stem}_DTM_{res:g}m_pyramid.tif") for res in levels}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DTM pyramid snapped to a reference grid")
+    parser.add_argument("dtm", help="Input DTM (e.g. *_DTM_1m_clipped.tif)")
+    parser.add_argument("--ref", default=None, help="Reference raster whose CRS / origin to snap to (e.g. S2 stack)")
+    parser.add_argument(
+        "--levels", nargs="+", type=float, default=list(PYRAMID_LEVELS), help="Resolutions in metres"
+    )
+    parser.add_argument("--out-dir", default=None, help="Output directory (default: next to the DTM)")
+    args = parser.parse_args()
+
+    dtm = Path(args.dtm)
+    out_dir = Path(args.out_dir) if args.out_dir else dtm.parent
+    stem = dtm.stem.removesuffix("_DTM_1m_clipped").removesuffix("_DTM_1m")
+    build_dtm_pyramid(dtm, pyramid_paths(out_dir / stem, args.levels), Path(args.ref) if args.ref else None)
+    print("✅ Pyramid complete")
@@ -0,0 +1,109 @@
+"""
+Memory budget and disk-backed scratch arrays for whole-tile DTM passes.
+
+A whole-tile hillshade or terrain pass holds the DTM plus several
+same-sized float32 intermediates (gradients, slope, aspect, temporaries),
+so a large tile can need many times its own size in RAM and kill the
+worker. fits_in_memory() estimates that working set against a budget;
+when it does not fit, the caller allocates the big arrays with
+scratch_arrays() instead. Those are numpy.memmap files on SCRATCH_DIR
+(ideally a fast local SSD), and the gradients are then computed strip by
+strip over them, so only a strip's worth of temporaries is ever in RAM.
+Oversized tiles become slower (disk-backed) rather than failing.
+
+Usage:
+    if not fits_in_memory((h, w), n_arrays=10):
+        with scratch_arrays() as empty:
+            dem = empty((h, w))
+            ...
+"""
+
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import psutil
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# Directory for memmap scratch files (None = the system temp directory)
+SCRATCH_DIR = None
+
+# Working-set limit in bytes for in-memory passes (None = MEMORY_FRACTION
+# of the RAM available when the pass starts)
+MEMORY_BUDGET = None
+MEMORY_FRACTION = 0.5
+
+# Rows per strip when computing over scratch arrays
+SCRATCH_STRIP_ROWS = 512
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def memory_budget(budget: int | None = None) -> int:
+    """budget, else MEMORY_BUDGET, else MEMORY_FRACTION of available RAM, in bytes."""
+    if budget is None:
+        budget = MEMORY_BUDGET
+    if budget is None:
+        budget = int(psutil.virtual_memory().available * MEMORY_FRACTION)
+    return int(budget)
+
+
+def working_set(shape, n_arrays: int, dtype="float32") -> int:
+    """Bytes held by n_arrays arrays of shape and dtype."""
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize * n_arrays
+
+
+def fits_in_memory(shape, n_arrays: int, budget: int | None = None, dtype="float32") -> bool:
+    """True if n_arrays arrays of shape fit within memory_budget(budget)."""
+    return working_set(shape, n_arrays, dtype) <= memory_budget(budget)
+
+
+@contextmanager
+def scratch_arrays(scratch_dir: Path | None = None):
+    """
+    Yield empty(shape, dtype="float32") returning disk-backed arrays.
+
+    Each array is a numpy.memmap over an anonymous temporary file in
+    scratch_dir (default SCRATCH_DIR / system temp); the files are
+    removed when the block exits.
+    """
+    scratch_dir = scratch_dir if scratch_dir is not None else SCRATCH_DIR
+    if scratch_dir is not None:
+        Path(scratch_dir).mkdir(parents=True, exist_ok=True)
+    files = []
+
+    def empty(shape, dtype="float32") -> np.memmap:
+        f = tempfile.TemporaryFile(prefix="lidar_scratch_", suffix=".dat", dir=scratch_dir)
+        files.append(f)
+        return np.memmap(f, dtype=dtype, mode="w+", shape=tuple(shape))
+
+    try:
+        yield empty
+    finally:
+        for f in files:
+            f.close()
+
+
+def iter_strips(height: int, rows: int = SCRATCH_STRIP_ROWS):
+    """Yield (row_off, n_rows) strips covering height rows."""
+    for row_off in range(0, height, rows):
+        yield row_off, min(rows, height - row_off)
+
+
+def strip_with_halo(arr: np.ndarray, row_off: int, n_rows: int, halo: int = 1):
+    """
+    Rows [row_off, row_off + n_rows) of arr plus a halo, clipped at the edges.
+
+    Returns (block, inner) as process_lidar.read_block_with_halo() does for
+    a full-width window, so gradients over block match the whole array.
+    """
+    row0 = max(row_off - halo, 0)
+    row1 = min(row_off + n_rows + halo, arr.shape[0])
+    inner = (slice(row_off - row0, row_off - row0 + n_rows), slice(0, arr.shape[1]))
+    return np.asarray(arr[row0:row1]), inner
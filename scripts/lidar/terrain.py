@@ -0,0 +1,128 @@
+"""
+Terrain derivatives from one gradient pass over a DTM block.
+
+terrain_block() takes a float32 DEM block (NaN = nodata) that carries a
+one-pixel halo and returns any of TERRAIN_PRODUCTS for the inner pixels:
+
+- slope            degrees
+- aspect           degrees clockwise from north, downslope; -1 where flat
+- hillshade_multi  mean cos-incidence over MULTI_AZIMUTHS (-1..1)
+- curvature        -(d2z/dx2 + d2z/dy2) * 100, ArcGIS sign (positive = convex)
+- tpi              centre minus mean of the 8 neighbours (3x3)
+- roughness        max - min of the 3x3 neighbourhood
+
+The gradients are computed once and shared: slope, aspect and every
+hillshade direction reuse the same sin/cos arrays, and the 3x3 products
+read shifted views of one halo-padded block instead of copying it.
+Neighbourhood products are NaN at the true raster edge.
+"""
+
+import numpy as np
+
+TERRAIN_PRODUCTS = ("slope", "aspect", "hillshade_multi", "curvature", "tpi", "roughness")
+
+# Light directions (degrees) averaged for the multi-directional hillshade
+MULTI_AZIMUTHS = (225, 270, 315, 360)
+
+
+def pad_to_halo(dem: np.ndarray, inner, halo: int = 1) -> np.ndarray:
+    """NaN-pad a block whose halo was clipped at the raster edge to a full halo."""
+    rows, cols = inner
+    top = halo - rows.start
+    left = halo - cols.start
+    bottom = halo - (dem.shape[0] - rows.stop)
+    right = halo - (dem.shape[1] - cols.stop)
+    if top == left == bottom == right == 0:
+        return dem
+    return np.pad(dem, ((top, bottom), (left, right)), constant_values=np.nan)
+
+
+def neighbour_views(win: np.ndarray):
+    """The 9 shifted views of a 1-pixel-haloed block, centre first."""
+    h, w = win.shape[0] - 2, win.shape[1] - 2
+    offsets = [(1, 1)] + [(r, c) for r in range(3) for c in range(3) if (r, c) != (1, 1)]
+    return [win[r : r + h, c : c + w] for r, c in offsets]
+
+
+def terrain_block(
+    dem: np.ndarray,
+    inner,
+    x_res: float,
+    y_res: float,
+    products=TERRAIN_PRODUCTS,
+    altitude=45,
+    azimuths=MULTI_AZIMUTHS,
+) -> dict:
+    """
+    Compute the requested products for the inner window of a haloed block.
+
+    dem, inner are as returned by process_lidar.read_block_with_halo().
+    Returns {product: float32 array} shaped like dem[inner].
+    """
+    unknown = set(products) - set(TERRAIN_PRODUCTS)
+    if unknown:
+        raise ValueError(f"Unknown terrain product(s): {sorted(unknown)}")
+
+    out = {}
+    needs_gradient = {"slope", "aspect", "hillshade_multi"} & set(products)
+
+    if needs_gradient:
+        # One gradient pass: rows run south, so dz/dnorth = -dz/drow
+        dz_drow, dz_dcol = np.gradient(dem, y_res, x_res)
+        dz_drow = dz_drow[inner]
+        dz_dcol = dz_dcol[inner]
+
+        grad = np.hypot(dz_dcol, dz_drow)
+        slope = np.arctan(grad)
+
+        if "slope" in products:
+            out["slope"] = np.degrees(slope).astype("float32")
+
+        # Downslope direction as compass angle
+        aspect = np.arctan2(-dz_dcol, dz_drow)
+
+        if "aspect" in products:
+            aspect_deg = np.degrees(aspect) % 360
+            aspect_deg[grad == 0] = -1
+            out["aspect"] = aspect_deg.astype("float32")
+
+        if "hillshade_multi" in products:
+            alt = np.deg2rad(altitude)
+            flat_term = np.sin(alt) * np.cos(slope)
+            tilt_term = np.cos(alt) * np.sin(slope)
+            cos_aspect = np.cos(aspect)
+            sin_aspect = np.sin(aspect)
+
+            # cos(az - aspect) = cos az cos aspect + sin az sin aspect
+            hs = np.zeros_like(slope)
+            for az in np.deg2rad(azimuths):
+                hs += flat_term + tilt_term * (np.cos(az) * cos_aspect + np.sin(az) * sin_aspect)
+            hs /= len(azimuths)
+            out["hillshade_multi"] = hs.astype("float32")
+
+    if {"curvature", "tpi", "roughness"} & set(products):
+        win = pad_to_halo(dem, inner)
+        centre, *neighbours = neighbour_views(win)
+        # neighbours order: NW, N, NE, W, E, SW, S, SE
+        nw, n, ne, w, e, sw, s, se = neighbours
+
+        if "curvature" in products:
+            zxx = (w - 2 * centre + e) / (x_res * x_res)
+            zyy = (n - 2 * centre + s) / (y_res * y_res)
+            out["curvature"] = (-(zxx + zyy) * 100).astype("float32")
+
+        if "tpi" in products:
+            total = np.zeros_like(centre)
+            for v in neighbours:
+                total += v
+            out["tpi"] = (centre - total / 8).astype("float32")
+
+        if "roughness" in products:
+            hi = centre.copy()
+            lo = centre.copy()
+            for v in neighbours:
+                np.maximum(hi, v, out=hi)
+                np.minimum(lo, v, out=lo)
+            out["roughness"] = (hi - lo).astype("float32")
+
+    return out
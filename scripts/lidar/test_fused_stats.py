@@ -0,0 +1,75 @@
+"""
+Check that fused_tile_products matches the separate clip + resample path.
+
+Runs both on a small synthetic tile (see benchmark_lidar) for a few
+stats band lists, including ones without "mean", and compares the 10 m
+DTM and the stats raster band by band.
+
+Example:
+    python test_fused_stats.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+import process_lidar
+from benchmark_lidar import make_synthetic_aoi, make_synthetic_dtm
+
+# Tile edge in pixels; not a multiple of 10 so partial 10 m cells are covered
+SIZE = 257
+
+STATS_CASES = (("max",), ("min", "std"), ("mean", "count"))
+
+
+def compare(a_path: Path, b_path: Path) -> None:
+    """Assert two rasters share grid, band names and (masked) values."""
+    with rasterio.open(a_path) as a, rasterio.open(b_path) as b:
+        assert a.shape == b.shape and a.transform == b.transform, f"{b_path.name}: grid differs"
+        assert a.descriptions == b.descriptions, f"{b_path.name}: {a.descriptions} != {b.descriptions}"
+        a_data = a.read(masked=True)
+        b_data = b.read(masked=True)
+    assert (a_data.mask == b_data.mask).all(), f"{b_path.name}: nodata differs"
+    assert np.allclose(a_data.compressed(), b_data.compressed(), equal_nan=True), f"{b_path.name}: values differ"
+
+
+def test_fused_stats(work_dir: Path) -> None:
+    dtm_path = work_dir / "dtm.tif"
+    make_synthetic_dtm(dtm_path, SIZE)
+    aoi = make_synthetic_aoi(SIZE)
+
+    clipped = work_dir / "clipped.tif"
+    process_lidar.clip_raster_to_aoi(dtm_path, aoi, clipped)
+
+    for stats in STATS_CASES:
+        name = "_".join(stats)
+        process_lidar.resample_to_10m(
+            clipped, work_dir / f"{name}_10m.tif", stats_path=work_dir / f"{name}_stats.tif", stats=stats
+        )
+        process_lidar.fused_tile_products(
+            dtm_path,
+            aoi,
+            work_dir / f"{name}_fused_hs.tif",
+            work_dir / f"{name}_fused_10m.tif",
+            stats_path=work_dir / f"{name}_fused_stats.tif",
+            stats=stats,
+        )
+        compare(work_dir / f"{name}_10m.tif", work_dir / f"{name}_fused_10m.tif")
+        compare(work_dir / f"{name}_stats.tif", work_dir / f"{name}_fused_stats.tif")
+        print(f"✅ fused stats {', '.join(stats)}")
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="fused_stats_") as tmp:
+        try:
+            test_fused_stats(Path(tmp))
+        except AssertionError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Persistent spatial index of the LiDAR tiles in a directory.
+
+The bounds of every raster (.tif) and point-cloud (.las / .laz) tile are
+kept in a small SQLite file with an R*Tree table, so "which tiles touch
+this AOI?" is answered from the index in milliseconds without opening a
+single tile. This lets process_lidar pick a site's tiles from its AOI
+instead of a hand-maintained SITE_TILE_MAP entry.
+
+update_tile_index() is incremental: only files that are new or whose
+size / mtime changed are opened, and entries for deleted files are
+dropped. tiles_for_aoi() refreshes the index, then does an R-tree bbox
+query per CRS and an exact polygon test on the candidates.
+
+Example:
+    python tile_index.py C:/EGM704/.../lidar_2022 --aoi aoi_sites.gpkg --layer desborough_bng
+"""
+
+import argparse
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+
+import geopandas as gpd
+import rasterio
+from shapely.geometry import box
+
+# Rasters only as process_lidar loads them (tile_source_path: <code>.tif)
+RASTER_SUFFIXES = (".tif",)
+LAS_SUFFIXES = (".las", ".laz")
+
+# Index file name, kept next to the tiles it describes
+INDEX_NAME = "tile_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    code TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    crs TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS tile_rtree USING rtree(id, minx, maxx, miny, maxy);
+"""
+
+
+def tile_kind(path: Path) -> str | None:
+    """'raster', 'las' or None for files the index ignores."""
+    if path.suffix in RASTER_SUFFIXES:
+        return "raster"
+    if path.suffix.lower() in LAS_SUFFIXES:
+        return "las"
+    return None
+
+
+def read_tile_extent(path: Path, kind: str):
+    """(bounds, crs_wkt) from the raster profile or LAS header."""
+    if kind == "raster":
+        with rasterio.open(path) as src:
+            return tuple(src.bounds), src.crs.to_wkt() if src.crs else None
+
+    # Imported here so raster-only users (process_lidar) do not need laspy
+    import laspy
+
+    with laspy.open(path) as reader:
+        header = reader.header
+        crs = header.parse_crs()
+        bounds = (*header.mins[:2], *header.maxs[:2])
+        return tuple(float(v) for v in bounds), crs.to_wkt() if crs else None
+
+
+def open_index(index_path: Path) -> sqlite3.Connection:
+    """Connection to the index, creating its tables if needed."""
+    con = sqlite3.connect(index_path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def update_tile_index(tile_dir: Path, index_path: Path | None = None) -> Path:
+    """
+    Bring the index for tile_dir up to date and return its path.
+
+    Only files that are new or changed (size / mtime_ns) are opened.
+    """
+    tile_dir = Path(tile_dir)
+    index_path = Path(index_path) if index_path else tile_dir / INDEX_NAME
+
+    on_disk = {}
+    for f in tile_dir.iterdir():
+        kind = tile_kind(f)
+        if kind is not None and f.is_file():
+            st = f.stat()
+            on_disk[f.name] = (f, kind, st.st_size, st.st_mtime_ns)
+
+    with closing(open_index(index_path)) as con, con:
+        rows = con.execute("SELECT id, name, size, mtime_ns FROM tiles")
+        indexed = {name: (tid, size, mtime) for tid, name, size, mtime in rows}
+
+        stale = [
+            tid
+            for name, (tid, size, mtime) in indexed.items()
+            if name not in on_disk or on_disk[name][2:] != (size, mtime)
+        ]
+        con.executemany("DELETE FROM tiles WHERE id = ?", [(t,) for t in stale])
+        con.executemany("DELETE FROM tile_rtree WHERE id = ?", [(t,) for t in stale])
+
+        added = 0
+        stale_names = {name for name, (tid, _, _) in indexed.items() if tid in stale}
+        for name, (f, kind, size, mtime) in on_disk.items():
+            if name in indexed and name not in stale_names:
+                continue
+            try:
+                (minx, miny, maxx, maxy), crs = read_tile_extent(f, kind)
+            except Exception as e:
+                print(f"  ⚠️ Skipping unreadable tile {name}: {e}")
+                continue
+            cur = con.execute(
+                "INSERT INTO tiles (name, code, kind, crs, size, mtime_ns, minx, miny, maxx, maxy) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, f.stem, kind, crs, size, mtime, minx, miny, maxx, maxy),
+            )
+            con.execute(
+                "INSERT INTO tile_rtree (id, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)",
+                (cur.lastrowid, minx, maxx, miny, maxy),
+            )
+            added += 1
+
+    if added or stale:
+        print(f"Tile index {index_path.name}: {added} tile(s) (re)indexed, {len(stale)} dropped")
+    return index_path
+
+
+def query_tile_index(index_path: Path, bounds, kind: str | None = None, crs: str | None = None) -> list[dict]:
+    """
+    Tiles whose bounds intersect bounds (xmin, ymin, xmax, ymax).
+
+    kind / crs (WKT, as stored) narrow the result. Bbox test only.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    sql = (
+        "SELECT t.name, t.code, t.kind, t.crs, t.minx, t.miny, t.maxx, t.maxy "
+        "FROM tile_rtree r JOIN tiles t ON t.id = r.id "
+        "WHERE r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?"
+    )
+    params = [xmax, xmin, ymax, ymin]
+    if kind is not None:
+        sql += " AND t.kind = ?"
+        params.append(kind)
+    if crs is not None:
+        sql += " AND t.crs IS ?"
+        params.append(crs)
+
+    with closing(sqlite3.connect(index_path)) as con:
+        rows = con.execute(sql, params).fetchall()
+    keys = ("name", "code", "kind", "crs", "minx", "miny", "maxx", "maxy")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def tiles_for_aoi(
+    aoi_gdf: gpd.GeoDataFrame,
+    tile_dir: Path,
+    index_path: Path | None = None,
+    kind: str = "raster",
+    update: bool = True,
+) -> list[str]:
+    """
+    Sorted codes (file stems) of the tiles of one kind that intersect the AOI.
+
+    The AOI is reprojected to each CRS present in the index; R-tree
+    candidates are then tested exactly against the AOI geometry.
+    """
+    tile_dir = Path(tile_dir)
+    index_path = Path(index_path) if index_path else tile_dir / INDEX_NAME
+    if update or not index_path.exists():
+        update_tile_index(tile_dir, index_path)
+
+    with closing(sqlite3.connect(index_path)) as con:
+        crs_list = [row[0] for row in con.execute("SELECT DISTINCT crs FROM tiles WHERE kind = ?", (kind,))]
+
+    codes = set()
+    for crs in crs_list:
+        if crs is None:
+            print("  ⚠️ Tiles without a CRS are not matched to AOIs")
+            continue
+        geom = aoi_gdf.to_crs(crs).union_all()
+        for t in query_tile_index(index_path, geom.bounds, kind, crs):
+            if geom.intersects(box(t["minx"], t["miny"], t["maxx"], t["maxy"])):
+                codes.add(t["code"])
+    return sorted(codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / query the LiDAR tile index")
+    parser.add_argument("tile_dir", help="Directory holding the tiles")
+    parser.add_argument("--index", default=None, help=f"Index file (default: <tile_dir>/{INDEX_NAME})")
+    parser.add_argument("--aoi", default=None, help="AOI GeoPackage to query with")
+    parser.add_argument("--layer", default=None, help="AOI layer name")
+    parser.add_argument("--kind", default="raster", choices=["raster", "las"], help="Tile kind to return")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index_path = update_tile_index(Path(args.tile_dir), args.index)
+    print(f"Index up to date: {index_path} ({time.perf_counter() - start:.2f} s)")
+
+    if args.aoi:
+        aoi = gpd.read_file(args.aoi, layer=args.layer)
+        start = time.perf_counter()
+        codes = tiles_for_aoi(aoi, Path(args.tile_dir), index_path, args.kind, update=False)
+        print(f"{len(codes)} tile(s) intersect the AOI ({(time.perf_counter() - start) * 1000:.1f} ms):")
+        for code in codes:
+            print(f"  {code}")
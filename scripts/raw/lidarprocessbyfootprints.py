@@ -7,13 +7,16 @@ Created on Wed Feb 13 12:36:38 2019
 
 import sys
 #import time
-import urllib.request, urllib.parse, urllib.error
+from pathlib import Path
 import os
 #from urllib.parse import urljoin
 #from pathlib import Path
 import arcpy 
 from arcpy.sa import *
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.downloads import download_many
+
 arcpy.Delete_management("in_memory")
 arcpy.env.overwriteOutput = True
 arcpy.CheckOutExtension('3D')
@@ -49,21 +52,6 @@ if not os.path.exists(outCnpy):
 
 
 
-#Progress bar for download
-def reporthook(blocknum, blocksize, totalsize):
-    readsofar = blocknum * blocksize
-    if totalsize > 0:
-        percent = readsofar * 1e2 / totalsize
-        s = "\r%5.1f%% %*d / %d" % (
-            percent, len(str(totalsize)), readsofar, totalsize)
-        sys.stderr.write(s)
-        if readsofar >= totalsize: # near the end
-            sys.stderr.write("\n")
-    else: # total size is unknown
-        sys.stderr.write("read %d\n" % (readsofar,))
-#download saver
-def save(url, filename):
-    urllib.request.urlretrieve(url, filename, reporthook)
     
 #Download footprints
 DOWNLOADS_DIR = os.path.join(basepth,'footprints')
@@ -72,15 +60,10 @@ if not os.path.exists(DOWNLOADS_DIR):
 
 lines = open(fp).read().splitlines()
 print("%d number of footprints to download"%len(lines))
-for ur in lines:
-    # Split on the rightmost / and take everything on the right side of that
-    name = ur.rsplit('/', 1)[-1]
-    #print(name)
-    # Combine the name and the downloads directory to get the local filename
-    fil = os.path.join(DOWNLOADS_DIR, name)
-    if not os.path.exists(fil):
-        save(ur, fil)
-    else: print("%s exists"%name)
+jobs = [(ur, os.path.join(DOWNLOADS_DIR, ur.rsplit('/', 1)[-1])) for ur in lines]
+#Parallel, resumable; partial files are kept as .part and continued
+for ur, fil, err in download_many(jobs, workers=8):
+    if err: print("%s failed: %s"%(ur, err))
     
 #Process LIDAR
 sr = r'H:/GIS_data/ForestModeling/ADK/NAD_1983_UTM_Zone_18N.prj'
@@ -10,7 +10,10 @@ import arcpy.sa
 from arcpy.sa import *
 import os
 import sys
-import urllib.request, urllib.parse, urllib.error
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.downloads import download_many
 
 
 arcpy.Delete_management("in_memory")
@@ -39,21 +42,6 @@ if not arcpy.Exists(gdb):
     print(gdbN + " created")
 else: print(gdbN + " exists")
 
-#Progress bar for download
-def reporthook(blocknum, blocksize, totalsize):
-    readsofar = blocknum * blocksize
-    if totalsize > 0:
-        percent = readsofar * 1e2 / totalsize
-        s = "\r%5.1f%% %*d / %d" % (
-            percent, len(str(totalsize)), readsofar, totalsize)
-        sys.stderr.write(s)
-        if readsofar >= totalsize: # near the end
-            sys.stderr.write("\n")
-    else: # total size is unknown
-        sys.stderr.write("read %d\n" % (readsofar,))
-#download saver
-def save(url, filename):
-    urllib.request.urlretrieve(url, filename, reporthook)
 
 #Download footprints
 DOWNLOADS_DIR = os.path.join(basepth,'footprints');wd = DOWNLOADS_DIR
@@ -61,14 +49,10 @@ if not os.path.exists(DOWNLOADS_DIR):
     os.mkdir(DOWNLOADS_DIR)
 lines = open(fp).read().splitlines()
 print("%d footprints to download"%len(lines))
-for ur in lines:
-    # Split on the rightmost / and take everything on the right side of that
-    name = ur.rsplit('/', 1)[-1]
-    # Combine the name and the downloads directory to get the local filename
-    fil = os.path.join(DOWNLOADS_DIR, name)
-    if not os.path.exists(fil):
-        save(ur, fil)
-    else: print("%s exists"%name)
+jobs = [(ur, os.path.join(DOWNLOADS_DIR, ur.rsplit('/', 1)[-1])) for ur in lines]
+#Parallel, resumable; partial files are kept as .part and continued
+for ur, fil, err in download_many(jobs, workers=8):
+    if err: print("%s failed: %s"%(ur, err))
     
 ## Execute CreateLasDataset
 #lasD = os.path.join(outLAS, nm+'.lasd')#; print lasD
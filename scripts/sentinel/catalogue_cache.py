@@ -0,0 +1,318 @@
+"""
+Persistent local cache of CDSE catalogue (OData / STAC) search results.
+
+Every Sentinel search used to ask the remote catalogue again, even for an
+AOI and date window it had answered the run before. cached_search() keeps
+the answers in a small SQLite file (CATALOGUE_CACHE):
+
+- products: each product record (full JSON) with its sensing start time
+  and footprint, per dataset (API + collection + any extra filters);
+- coverage: the (bbox, time interval) windows already searched in full
+  for each dataset.
+
+A search for a bbox and window fetches only the parts of the window not
+yet covered by an earlier search of an equal or larger bbox, stores the
+products, and answers from the cache: products of the dataset whose start
+lies in the window and whose footprint intersects the bbox, newest first.
+A window that is already covered comes back without any network access.
+
+Gaps are always fetched in full (all pages), so a cached answer is never
+a truncated one; apply result limits to what cached_search() returns.
+Windows closer to now than SETTLE_DAYS are not recorded as covered, since
+recent products are still being ingested; they are searched again (and
+the new products added) on every run.
+
+Example:
+    products = cached_search("odata", "SENTINEL-1", bbox, start, end, fetch)
+    python catalogue_cache.py               # list cached datasets
+"""
+
+import argparse
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from shapely import wkt
+from shapely.geometry import box, mapping, shape
+
+# ----------------------------------------------------------------------
+# CONFIG
+# ----------------------------------------------------------------------
+
+# Cache file, shared by all the Sentinel scripts
+CATALOGUE_CACHE = Path.home() / ".cdse_catalogue.sqlite"
+
+# Windows ending less than this many days ago are searched again each run
+SETTLE_DAYS = 3
+
+# Results per page when fetching a gap
+PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    dataset TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start TEXT NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    geometry TEXT,
+    record TEXT NOT NULL,
+    PRIMARY KEY (dataset, id)
+);
+CREATE INDEX IF NOT EXISTS products_start ON products (dataset, start);
+CREATE TABLE IF NOT EXISTS coverage (
+    dataset TEXT NOT NULL,
+    minx REAL NOT NULL, miny REAL NOT NULL, maxx REAL NOT NULL, maxy REAL NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_dataset ON coverage (dataset);
+"""
+
+# Time resolution of stored times and interval ends
+TICK = timedelta(milliseconds=1)
+
+# ----------------------------------------------------------------------
+# FUNCTIONS
+# ----------------------------------------------------------------------
+
+
+def parse_time(value) -> datetime:
+    """UTC datetime from an ISO 8601 string (Z / offset / naive = UTC) or datetime."""
+    t = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    t = t.astimezone(timezone.utc)
+    return t.replace(microsecond=t.microsecond // 1000 * 1000)
+
+
+def format_time(t: datetime) -> str:
+    """Millisecond UTC literal, e.g. 2025-05-01T00:00:00.000Z (sorts as text)."""
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def dataset_key(api: str, collection: str, filters: dict | None = None) -> str:
+    """Key for one kind of search: API, collection and the extra filters applied."""
+    return json.dumps([api, collection, filters or {}], sort_keys=True)
+
+
+def product_fields(api: str, record: dict):
+    """(id, start datetime, footprint geometry or None) of an OData or STAC record."""
+    if api == "stac":
+        props = record.get("properties") or {}
+        start = props.get("start_datetime") or props.get("datetime")
+        return record["id"], parse_time(start), shape(record["geometry"]) if record.get("geometry") else None
+
+    geom = None
+    if record.get("GeoFootprint"):
+        geom = shape(record["GeoFootprint"])
+    elif record.get("Footprint"):
+        # geography'SRID=4326;POLYGON ((...))'
+        geom = wkt.loads(record["Footprint"].split(";", 1)[-1].rstrip("'"))
+    return record["Id"], parse_time(record["ContentDate"]["Start"]), geom
+
+
+def open_cache(cache_path: Path | None = None) -> sqlite3.Connection:
+    """Connection to the cache, creating its tables if needed."""
+    cache_path = Path(cache_path) if cache_path else CATALOGUE_CACHE
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(cache_path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def covered_intervals(con, dataset: str, bbox, start: datetime, end: datetime) -> list:
+    """Merged [(start, end)] within the window covered by searches of bboxes containing bbox."""
+    minx, miny, maxx, maxy = bbox
+    rows = con.execute(
+        "SELECT start, end FROM coverage WHERE dataset = ? "
+        "AND minx <= ? AND miny <= ? AND maxx >= ? AND maxy >= ? AND start <= ? AND end >= ? "
+        "ORDER BY start",
+        (dataset, minx, miny, maxx, maxy, format_time(end), format_time(start)),
+    )
+    merged = []
+    for s, e in rows:
+        s, e = parse_time(s), parse_time(e)
+        if merged and s <= merged[-1][1] + TICK:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [(s, e) for s, e in merged]
+
+
+def missing_intervals(covered, start: datetime, end: datetime) -> list:
+    """[(start, end)] parts of the closed window [start, end] not in covered (merged, sorted)."""
+    gaps = []
+    t = start
+    for s, e in covered:
+        if s > t:
+            gaps.append((t, min(s - TICK, end)))
+        t = max(t, e + TICK)
+        if t > end:
+            break
+    if t <= end:
+        gaps.append((t, end))
+    return gaps
+
+
+def add_coverage(con, dataset: str, bbox, start: datetime, end: datetime) -> None:
+    """Record [start, end] as searched for bbox, merged with touching windows of the same bbox."""
+    minx, miny, maxx, maxy = bbox
+    key = (dataset, minx, miny, maxx, maxy)
+    same_box = "dataset = ? AND minx = ? AND miny = ? AND maxx = ? AND maxy = ?"
+    rows = con.execute(
+        f"SELECT rowid, start, end FROM coverage WHERE {same_box} AND start <= ? AND end >= ?",
+        (*key, format_time(end + TICK), format_time(start - TICK)),
+    ).fetchall()
+    for rowid, s, e in rows:
+        start, end = min(start, parse_time(s)), max(end, parse_time(e))
+    con.executemany("DELETE FROM coverage WHERE rowid = ?", [(r[0],) for r in rows])
+    con.execute(
+        "INSERT INTO coverage (dataset, minx, miny, maxx, maxy, start, end) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (*key, format_time(start), format_time(end)),
+    )
+
+
+def store_products(con, dataset: str, api: str, records, bbox) -> int:
+    """
+    Insert or update records; returns how many were stored.
+
+    Records without a footprint are filed under the searched bbox.
+    """
+    rows = []
+    for record in records:
+        pid, start, geom = product_fields(api, record)
+        bounds = geom.bounds if geom is not None else tuple(bbox)
+        rows.append(
+            (
+                dataset,
+                pid,
+                format_time(start),
+                *bounds,
+                json.dumps(mapping(geom)) if geom is not None else None,
+                json.dumps(record),
+            )
+        )
+    con.executemany(
+        "INSERT OR REPLACE INTO products (dataset, id, start, minx, miny, maxx, maxy, geometry, record) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def query_products(con, dataset: str, bbox, start: datetime, end: datetime) -> list[dict]:
+    """Cached records starting in [start, end] whose footprint intersects bbox, newest first."""
+    minx, miny, maxx, maxy = bbox
+    rows = con.execute(
+        "SELECT geometry, record FROM products WHERE dataset = ? AND start >= ? AND start <= ? "
+        "AND minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ? ORDER BY start DESC",
+        (dataset, format_time(start), format_time(end), maxx, minx, maxy, miny),
+    )
+    area = box(minx, miny, maxx, maxy)
+    return [json.loads(record) for geom, record in rows if geom is None or shape(json.loads(geom)).intersects(area)]
+
+
+def cached_search(
+    api: str,
+    collection: str,
+    bbox,
+    start,
+    end,
+    fetch,
+    filters: dict | None = None,
+    cache_path: Path | None = None,
+    refresh: bool = False,
+) -> list[dict]:
+    """
+    Catalogue records of collection over bbox in [start, end], via the cache.
+
+    api is "odata" or "stac" (how records are read). fetch(start, end)
+    must return every record of the search for bbox within that window
+    (times are passed as millisecond UTC literals); it is called once per
+    uncovered gap. filters names whatever else the fetch filters on (e.g.
+    product type, cloud cover) so differently filtered searches are kept
+    apart. refresh=True searches the whole window again.
+    """
+    bbox = tuple(float(v) for v in bbox)
+    start, end = parse_time(start), parse_time(end)
+    dataset = dataset_key(api, collection, filters)
+    settled = parse_time(datetime.now(timezone.utc) - timedelta(days=SETTLE_DAYS))
+
+    with closing(open_cache(cache_path)) as con:
+        covered = [] if refresh else covered_intervals(con, dataset, bbox, start, end)
+        gaps = missing_intervals(covered, start, end)
+        stored = 0
+        for gap_start, gap_end in gaps:
+            records = fetch(format_time(gap_start), format_time(gap_end))
+            with con:
+                stored += store_products(con, dataset, api, records, bbox)
+                if gap_start <= settled:
+                    add_coverage(con, dataset, bbox, gap_start, min(gap_end, settled))
+        products = query_products(con, dataset, bbox, start, end)
+
+    if gaps:
+        print(f"Catalogue cache: searched {len(gaps)} uncovered window(s), {stored} record(s) stored")
+    else:
+        print(f"Catalogue cache: answered offline ({len(products)} record(s))")
+    return products
+
+
+def odata_all(get, url: str, params: dict) -> list[dict]:
+    """Every record of an OData query, following @odata.nextLink; get(url, params=...) -> Response."""
+    params = {"$top": PAGE_SIZE, **params}
+    records = []
+    while url:
+        r = get(url, params=params)
+        r.raise_for_status()
+        data = r.json()
+        records.extend(data.get("value", []))
+        # The next link carries the query (and $skip) itself
+        url, params = data.get("@odata.nextLink"), None
+    return records
+
+
+def stac_all(post, get, url: str, body: dict) -> list[dict]:
+    """Every feature of a STAC item search, following rel=next links (POST or GET)."""
+    body = {"limit": PAGE_SIZE, **body}
+    features = []
+    r = post(url, json=body)
+    while True:
+        r.raise_for_status()
+        data = r.json()
+        features.extend(data.get("features", []))
+        link = next((lk for lk in data.get("links", []) if lk.get("rel") == "next" and lk.get("href")), None)
+        if link is None or not data.get("features"):
+            return features
+        if link.get("method", "GET").upper() == "POST":
+            next_body = {**body, **link["body"]} if link.get("merge") else link.get("body", body)
+            r = post(link["href"], json=next_body)
+        else:
+            r = get(link["href"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect / clear the CDSE catalogue cache")
+    parser.add_argument("--cache", default=None, help=f"Cache file (default: {CATALOGUE_CACHE})")
+    parser.add_argument("--clear", action="store_true", help="Delete all cached products and coverage")
+    args = parser.parse_args()
+
+    with closing(open_cache(args.cache)) as con, con:
+        if args.clear:
+            con.execute("DELETE FROM products")
+            con.execute("DELETE FROM coverage")
+            print("✅ Catalogue cache cleared")
+        datasets = con.execute(
+            "SELECT d.dataset, (SELECT COUNT(*) FROM products p WHERE p.dataset = d.dataset) "
+            "FROM (SELECT dataset FROM products UNION SELECT dataset FROM coverage) d"
+        ).fetchall()
+        for dataset, n in datasets:
+            api, collection, filters = json.loads(dataset)
+            print(f"{api} {collection} {filters or ''}: {n} product(s)")
+            windows = con.execute(
+                "SELECT minx, miny, maxx, maxy, start, end FROM coverage WHERE dataset = ? ORDER BY start",
+                (dataset,),
+            )
+            for minx, miny, maxx, maxy, s, e in windows:
+                print(f"  covered {s} .. {e} over ({minx:g}, {miny:g}, {maxx:g}, {maxy:g})")
@@ -0,0 +1,258 @@
+"""
+Shared Copernicus Data Space (CDSE) client: cached tokens, one session.
+
+Every Sentinel script used to POST the password grant once per run and
+never looked at expires_in, so a long download batch started failing with
+401 once the ~10 minute access token ran out. CDSEClient instead:
+
+- caches the access and refresh tokens on disk (TOKEN_CACHE) with their
+  expiry times, so reruns reuse a still-valid token;
+- refreshes REFRESH_MARGIN seconds before expiry, using the refresh token
+  when it is still valid and the password grant (CDSE_USER / CDSE_PASS)
+  otherwise;
+- retries a request once with a fresh token if it comes back 401;
+- sends catalogue, STAC and zipper calls through one pooled
+  requests.Session, so connections are kept alive between calls;
+- downloads batches of products concurrently (download()), within the
+  CDSE per-user limit and an optional total bandwidth cap. Products are
+  staged as .part files, resumed with Range requests after an
+  interruption, and only renamed into place once their length, OData
+  checksum (product_verifier) and ZIP directory check out.
+
+Usage:
+    client = CDSEClient()
+    r = client.get(CATALOGUE_URL, params=params)
+    client.download([(ZIPPER_URL.format(id=pid), out_dir / f"{name}.zip", product_verifier(product))])
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+# scripts/common holds the helpers shared with the lidar scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.downloads import (
+    TIMEOUT,
+    CorruptDownload,
+    blake3,
+    download_many,
+    make_session,
+    verify_checksum,
+    verify_zip,
+)
+
+# CDSE endpoints
+TOKEN_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
+CATALOGUE_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
+STAC_SEARCH_URL = "https://catalogue.dataspace.copernicus.eu/stac/search"
+ZIPPER_URL = "https://zipper.dataspace.copernicus.eu/odata/v1/Products({id})/$value"
+CLIENT_ID = "cdse-public"
+
+# Where tokens are cached between runs (holds credentials: keep it private)
+TOKEN_CACHE = Path.home() / ".cdse_token.json"
+
+# Refresh this many seconds before a token expires
+REFRESH_MARGIN = 60
+
+# Concurrent downloads CDSE allows per user (and so per download host)
+CDSE_MAX_DOWNLOADS = 4
+
+# OData checksum algorithms to verify with, in order of preference
+CHECKSUM_ALGORITHMS = ("MD5", "BLAKE3")
+
+
+def product_checksum(product: dict | None):
+    """(algorithm, value) from an OData product's Checksum list, or None."""
+    available = {c.get("Algorithm", "").upper(): c.get("Value") for c in (product or {}).get("Checksum") or []}
+    for algorithm in CHECKSUM_ALGORITHMS:
+        if available.get(algorithm) and (algorithm != "BLAKE3" or blake3 is not None):
+            return algorithm, available[algorithm]
+    return None
+
+
+def product_verifier(product: dict | None = None):
+    """
+    verify(path) for download_file: ZIP central directory, plus the
+    catalogue checksum when the product record carries one.
+    """
+    checksum = product_checksum(product)
+
+    def verify(path: Path) -> None:
+        verify_zip(path)
+        if checksum is not None:
+            verify_checksum(path, *checksum)
+
+    return verify
+
+
+def check_existing(jobs) -> list[Path]:
+    """
+    Output paths of jobs that are already downloaded and readable.
+
+    Zips written by older versions of these scripts (straight to the final
+    path) may be truncated; those are deleted so they are fetched again.
+    """
+    done = []
+    for _, out_path, *_ in jobs:
+        out_path = Path(out_path)
+        if not out_path.exists():
+            continue
+        try:
+            verify_zip(out_path)
+            done.append(out_path)
+        except CorruptDownload as e:
+            print(f"⚠️ Removing corrupt download: {e}")
+            out_path.unlink()
+    return done
+
+
+class CDSEClient:
+    """Authenticated access to the CDSE APIs; see the module docstring."""
+
+    def __init__(
+        self,
+        username: str | None = None,
+        password: str | None = None,
+        cache_path: Path | None = TOKEN_CACHE,
+        session: requests.Session | None = None,
+        pool_size: int = 8,
+    ):
+        self.username = username or os.environ.get("CDSE_USER")
+        self.password = password or os.environ.get("CDSE_PASS")
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.session = session or make_session(pool_size)
+        self._lock = threading.Lock()
+        self._tokens = self._load_cache()
+
+    def _load_cache(self) -> dict:
+        """Cached tokens for this user, or {} if missing / unreadable / another user."""
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            cached = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return cached if cached.get("username") == self.username else {}
+
+    def _save_cache(self) -> None:
+        """Write the tokens to cache_path (owner-only, replaced atomically)."""
+        if self.cache_path is None:
+            return
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._tokens, f)
+        os.replace(tmp, self.cache_path)
+
+    def _grant(self, data: dict) -> None:
+        """POST a token grant and keep the result with absolute expiry times."""
+        now = time.time()
+        resp = self.session.post(TOKEN_URL, data={"client_id": CLIENT_ID, **data}, timeout=TIMEOUT)
+        resp.raise_for_status()
+        info = resp.json()
+        self._tokens = {
+            "username": self.username,
+            "access_token": info["access_token"],
+            "expires_at": now + info.get("expires_in", 0),
+            "refresh_token": info.get("refresh_token"),
+            "refresh_expires_at": now + info.get("refresh_expires_in", 0),
+        }
+        self._save_cache()
+
+    def _password_grant(self) -> None:
+        if not self.username or not self.password:
+            raise RuntimeError(
+                "CDSE_USER or CDSE_PASS environment variables not set. "
+                "Set them with `setx` and restart your terminal."
+            )
+        self._grant({"grant_type": "password", "username": self.username, "password": self.password})
+
+    def _fresh(self, token_key: str, expiry_key: str) -> bool:
+        """True if the token is there and valid for more than REFRESH_MARGIN seconds."""
+        return bool(self._tokens.get(token_key)) and self._tokens.get(expiry_key, 0) - time.time() > REFRESH_MARGIN
+
+    def token(self, force: bool = False) -> str:
+        """
+        A valid access token, refreshing it if it is (nearly) expired.
+
+        force=True discards the current access token first (e.g. after a 401).
+        """
+        with self._lock:
+            if force:
+                self._tokens.pop("access_token", None)
+            if not self._fresh("access_token", "expires_at"):
+                if self._fresh("refresh_token", "refresh_expires_at"):
+                    try:
+                        self._grant({"grant_type": "refresh_token", "refresh_token": self._tokens["refresh_token"]})
+                    except requests.HTTPError:
+                        # Refresh token revoked or rejected: log in again
+                        self._password_grant()
+                else:
+                    self._password_grant()
+            return self._tokens["access_token"]
+
+    @property
+    def expires_in(self) -> float:
+        """Seconds until the current access token expires (0 if none)."""
+        if not self._tokens.get("access_token"):
+            return 0
+        return max(self._tokens["expires_at"] - time.time(), 0)
+
+    def headers(self, extra: dict | None = None, force: bool = False) -> dict:
+        """Authorization header with a valid token, plus any extra headers."""
+        return {"Authorization": f"Bearer {self.token(force)}", **(extra or {})}
+
+    def request(self, method: str, url: str, headers: dict | None = None, **kwargs) -> requests.Response:
+        """
+        Authenticated request through the shared session.
+
+        A 401 response is retried once with a freshly obtained token.
+        Streaming (stream=True) responses are returned unread, as requests does.
+        """
+        kwargs.setdefault("timeout", TIMEOUT)
+        r = self.session.request(method, url, headers=self.headers(headers), **kwargs)
+        if r.status_code == 401:
+            r.close()
+            r = self.session.request(method, url, headers=self.headers(headers, force=True), **kwargs)
+        return r
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def download(
+        self,
+        jobs,
+        workers: int = CDSE_MAX_DOWNLOADS,
+        max_rate: float | None = None,
+        segments: int = 1,
+    ) -> list:
+        """
+        Download (url, out_path[, verify]) jobs concurrently, see common.downloads.download_many.
+
+        Each attempt gets a current token, so a batch outliving one token
+        carries on. max_rate caps the total in bytes/s. segments > 1
+        fetches each product as that many parallel byte ranges; every range
+        is a connection, so products run CDSE_MAX_DOWNLOADS // segments at
+        a time and segments is capped at CDSE_MAX_DOWNLOADS. Returns
+        [(url, out_path, error)].
+        """
+        if segments > CDSE_MAX_DOWNLOADS:
+            print(f"⚠️ segments={segments} exceeds CDSE's {CDSE_MAX_DOWNLOADS} connections; using {CDSE_MAX_DOWNLOADS}")
+            segments = CDSE_MAX_DOWNLOADS
+        return download_many(
+            jobs,
+            workers=workers,
+            session=self.session,
+            headers=self.headers,
+            max_rate=max_rate,
+            per_host=CDSE_MAX_DOWNLOADS // max(1, segments),
+            segments=segments,
+        )
@@ -3,11 +3,11 @@
 # Batch-clip all Sentinel-2 JP2 bands in a folder to a single AOI
 # Output: GeoTIFFs clipped to your study area
 
-import rasterio
 import geopandas as gpd
-from rasterio.mask import mask
 from pathlib import Path
 
+from clip_raster_to_aoi import clip_raster_window
+
 # ------------- USER SETTINGS -------------
 AOI_PATH = r"../data/aoi/egm704_aoi_wgs84.gpkg"
 LAYER = "aoi_sites"
@@ -24,8 +24,6 @@ aoi = gdf[gdf["name"] == FEATURE]
 if aoi.empty:
     raise ValueError(f"AOI '{FEATURE}' not found in {AOI_PATH}")
 
-geom = [aoi.geometry.iloc[0].__geo_interface__]
-
 # 2. make output dir
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -44,23 +42,12 @@ for jp2_path in jp2_files:
 
     print(f"Clipping {jp2_path} → {out_path}")
 
-    with rasterio.open(jp2_path) as src:
-        try:
-            out_img, out_transform = mask(src, geom, crop=True)
-        except ValueError:
-            # geometry and raster don't overlap
-            print(f"  ⚠️  Skipping {jp2_path} (no overlap)")
-            continue
-
-        out_meta = src.meta.copy()
-        out_meta.update({
-            "driver": "GTiff",
-            "height": out_img.shape[1],
-            "width": out_img.shape[2],
-            "transform": out_transform
-        })
-
-        with rasterio.open(out_path, "w", **out_meta) as dst:
-            dst.write(out_img)
+    try:
+        # reads only the AOI window of each JP2, not the whole scene
+        clip_raster_window(jp2_path, aoi, out_path)
+    except ValueError:
+        # geometry and raster don't overlap
+        print(f"  ⚠️  Skipping {jp2_path} (no overlap)")
+        continue
 
 print("✅ Done.")
@@ -2,11 +2,21 @@
 #
 # Clip a single raster (e.g. Sentinel-2 band) to an AOI in a GeoPackage
 
+import math
+import sys
+
 import rasterio
 import geopandas as gpd
-from rasterio.mask import mask
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
 from pathlib import Path
 
+# scripts/common holds the helpers shared with the lidar scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.raster_profiles import cog_writer
+
 # ------------ USER SETTINGS ------------
 AOI_PATH = r"../data/aoi/egm704_aoi_wgs84.gpkg"
 LAYER = "aoi_sites"
@@ -14,34 +24,77 @@ FEATURE = "desborough_operational"
 
 INPUT_RASTER = r"../data/sentinel2_raw/example_band.jp2"   # change this
 OUTPUT_RASTER = r"../data/sentinel2_raw/desborough_B04.tif"
+OUTPUT_RES = None   # e.g. 20 to decode a 10 m JP2 straight to 20 m; None = native
 # ---------------------------------------
 
-# 1. read AOI
-gdf = gpd.read_file(AOI_PATH, layer=LAYER)
-aoi = gdf[gdf["name"] == FEATURE]
 
-if aoi.empty:
-    raise ValueError(f"AOI '{FEATURE}' not found in {AOI_PATH}")
+def clip_raster_window(src_path, aoi, out_path, out_res=None):
+    """
+    Clip a raster to an AOI by reading only the AOI's pixel window.
+
+    - aoi is a GeoDataFrame; its first geometry is reprojected to the raster CRS
+    - the polygon mask is rasterised over the window only, not the scene
+    - out_res (map units) coarser than the native pixel lets GDAL decode
+      from the JP2 resolution levels / overviews instead of full resolution
+
+    Pixels outside the polygon are set to nodata (0 if the raster has none).
+    Raises ValueError if the AOI does not overlap the raster.
+    """
+    with rasterio.open(src_path) as src:
+        if aoi.crs != src.crs:
+            aoi = aoi.to_crs(src.crs)
+        geoms = [aoi.geometry.iloc[0]]
+
+        try:
+            window = geometry_window(src, geoms)
+        except WindowError:
+            raise ValueError("Input shapes do not overlap raster.")
+        window = Window(int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+        if window.width == 0 or window.height == 0:
+            raise ValueError("Input shapes do not overlap raster.")
+
+        # Decimated read: GDAL picks the matching overview / JP2 resolution level
+        factor = 1.0
+        if out_res is not None and out_res > src.res[0]:
+            factor = out_res / src.res[0]
+        out_height = max(1, math.ceil(window.height / factor))
+        out_width = max(1, math.ceil(window.width / factor))
+        out_transform = src.window_transform(window) * rasterio.Affine.scale(
+            window.width / out_width, window.height / out_height
+        )
+
+        out_img = src.read(
+            window=window,
+            out_shape=(src.count, out_height, out_width),
+            resampling=Resampling.average,
+        )
+
+        outside = geometry_mask(geoms, out_shape=(out_height, out_width), transform=out_transform)
+        out_img[:, outside] = src.nodata if src.nodata is not None else 0
+
+        out_meta = src.meta.copy()
+
+    out_meta.update({
+        "driver": "GTiff",
+        "height": out_height,
+        "width": out_width,
+        "transform": out_transform
+    })
+
+    # tiled, compressed COG (see common/raster_profiles.py)
+    with cog_writer(out_path, out_meta) as dst:
+        dst.write(out_img)
 
-# rasterio wants GeoJSON-like geometry
-geoms = [aoi.geometry.iloc[0].__geo_interface__]
 
-# 2. open raster and clip
-with rasterio.open(INPUT_RASTER) as src:
-    out_img, out_transform = mask(src, geoms, crop=True)
-    out_meta = src.meta.copy()
+if __name__ == "__main__":
+    # 1. read AOI
+    gdf = gpd.read_file(AOI_PATH, layer=LAYER)
+    aoi = gdf[gdf["name"] == FEATURE]
 
-# 3. update metadata
-out_meta.update({
-    "driver": "GTiff",
-    "height": out_img.shape[1],
-    "width": out_img.shape[2],
-    "transform": out_transform
-})
+    if aoi.empty:
+        raise ValueError(f"AOI '{FEATURE}' not found in {AOI_PATH}")
 
-# 4. write out
-Path(OUTPUT_RASTER).parent.mkdir(parents=True, exist_ok=True)
-with rasterio.open(OUTPUT_RASTER, "w", **out_meta) as dst:
-    dst.write(out_img)
+    # 2. clip the AOI window and write out
+    clip_raster_window(INPUT_RASTER, aoi, OUTPUT_RASTER, out_res=OUTPUT_RES)
 
-print(f"✅ Clipped raster written to: {OUTPUT_RASTER}")
+    print(f"✅ Clipped raster written to: {OUTPUT_RASTER}")
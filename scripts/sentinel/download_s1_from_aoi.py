@@ -1,7 +1,8 @@
 """
 Download Sentinel-1 products for your AOI using Copernicus Data Space (CDSE).
 
-- Auth via Keycloak token (CDSE_USER / CDSE_PASS env vars)
+- Auth via the shared CDSE client (CDSE_USER / CDSE_PASS env vars,
+  token cached and refreshed, see cdse_client.py)
 - AOI from aoi_combined.gpkg
 - Downloads ZIPs to data/raw/sentinel1
 
@@ -10,18 +11,14 @@ Adjust:
 as needed.
 """
 
-import os
 from pathlib import Path
 
 import geopandas as gpd
-import requests
-
-# CDSE endpoints
-TOKEN_URL = (
-    "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/"
-    "protocol/openid-connect/token"
-)
-CATALOGUE_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
+
+from catalogue_cache import cached_search, odata_all
+from cdse_client import CATALOGUE_URL, CDSEClient, check_existing, product_verifier
+
+# CDSE download endpoint
 DOWNLOAD_BASE_URL = "https://download.dataspace.copernicus.eu/odata/v1/Products"
 
 # Paths (adjust if needed)
@@ -31,31 +28,14 @@ OUT_DIR = Path(r"C:\EGM704\data_sets\egm704_project\data\raw\sentinel1")
 # Date range and query limits
 START_DATE = "2024-01-01"   # YYYY-MM-DD
 END_DATE = "2024-12-31"
-MAX_RESULTS = 5             # keep small while testing
-
-
-def get_cdse_token() -> str:
-    """Get an access token from Copernicus Data Space using env vars."""
-    username = os.environ.get("CDSE_USER")
-    password = os.environ.get("CDSE_PASS")
-
-    if not username or not password:
-        raise RuntimeError(
-            "CDSE_USER or CDSE_PASS environment variables not set. "
-            "Set them with `setx` and restart your terminal."
-        )
+MAX_RESULTS = 5             # products to download (newest first); keep small while testing
 
-    data = {
-        "client_id": "cdse-public",
-        "grant_type": "password",
-        "username": username,
-        "password": password,
-    }
-
-    resp = requests.post(TOKEN_URL, data=data)
-    resp.raise_for_status()
-    token_info = resp.json()
-    return token_info["access_token"]
+# Download concurrency and total bandwidth cap (bytes/s, None = no cap).
+# SEGMENTS > 1 splits each product into parallel byte ranges, for when one
+# large product is all there is (each range is one connection).
+WORKERS = 4
+MAX_RATE = None
+SEGMENTS = 1
 
 
 def load_aoi_geometry(aoi_path: str):
@@ -79,14 +59,15 @@ def load_aoi_geometry(aoi_path: str):
 
 
 def search_s1_for_aoi(geom, start_date: str, end_date: str,
-                      token: str, max_results: int = 10):
+                      client: CDSEClient, max_results: int = 10):
     """
     Search Sentinel-1 products intersecting the AOI.
 
-    - Uses CDSE OData catalogue
+    - Uses CDSE OData catalogue, through the local catalogue cache
+      (AOI / date windows searched before are answered offline)
     - Prints raw product names
-    - Returns products after a light filter:
-      keep IW GRD variants only, drop SLC/AUX/RAW/ETA.
+    - Returns up to max_results products (newest first) after a light
+      filter: keep IW GRD variants only, drop SLC/AUX/RAW/ETA.
     """
     minx, miny, maxx, maxy = geom.bounds
 
@@ -96,28 +77,30 @@ def search_s1_for_aoi(geom, start_date: str, end_date: str,
         f"{maxx} {maxy}, {maxx} {miny}, {minx} {miny}))"
     )
 
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # OData filter: Sentinel-1 + intersects AOI + time range
-    filter_expr = (
-        "Collection/Name eq 'SENTINEL-1' and "
-        f"OData.CSC.Intersects(area=geography'SRID=4326;{wkt}') and "
-        f"ContentDate/Start ge {start_date}T00:00:00Z and "
-        f"ContentDate/Start le {end_date}T23:59:59Z"
+    def fetch(start, end):
+        # OData filter: Sentinel-1 + intersects AOI + time range
+        filter_expr = (
+            "Collection/Name eq 'SENTINEL-1' and "
+            f"OData.CSC.Intersects(area=geography'SRID=4326;{wkt}') and "
+            f"ContentDate/Start ge {start} and "
+            f"ContentDate/Start le {end}"
+        )
+        params = {
+            "$filter": filter_expr,
+            "$orderby": "ContentDate/Start desc",
+        }
+        print("Querying CDSE catalogue for Sentinel-1 products ...")
+        return odata_all(client.get, CATALOGUE_URL, params)
+
+    products = cached_search(
+        "odata",
+        "SENTINEL-1",
+        geom.bounds,
+        f"{start_date}T00:00:00Z",
+        f"{end_date}T23:59:59.999Z",
+        fetch,
     )
 
-    params = {
-        "$top": max_results,
-        "$filter": filter_expr,
-        "$orderby": "ContentDate/Start desc",
-    }
-
-    print("Querying CDSE catalogue for Sentinel-1 products ...")
-    r = requests.get(CATALOGUE_URL, headers=headers, params=params)
-    r.raise_for_status()
-    data = r.json()
-    products = data.get("value", [])
-
     print(f"Raw products from CDSE: {len(products)}")
     for p in products:
         print("  -", p.get("Name", "(no name)"))
@@ -152,49 +135,20 @@ def search_s1_for_aoi(geom, start_date: str, end_date: str,
         filtered.append(p)
 
     print(f"Products after filtering to IW GRD only: {len(filtered)}")
-    return filtered
+    return filtered[:max_results]
 
 
-def download_product(product: dict, out_dir: Path, token: str):
-    """Download a single Sentinel-1 product by product dict."""
-    product_id = product["Id"]
-    name = product["Name"]
-
-    safe_name = name.replace(".SAFE", "")
-    out_path = out_dir / f"{safe_name}.zip"
-
-    if out_path.exists():
-        print(f"Already downloaded: {out_path.name}")
-        return
-
-    headers = {"Authorization": f"Bearer {token}"}
-    url = f"{DOWNLOAD_BASE_URL}({product_id})/$value"
-
-    print(f"Downloading {name} to {out_path}")
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    try:
-        with requests.get(url, headers=headers, stream=True) as r:
-            r.raise_for_status()
-            with open(out_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-    except Exception as e:
-        # If something goes wrong, remove partial file
-        if out_path.exists():
-            try:
-                out_path.unlink()
-            except Exception:
-                pass
-        raise e
-
-    print(f"Saved: {out_path}")
+def product_job(product: dict, out_dir: Path):
+    """(download url, local zip path, verifier) for one catalogue product."""
+    safe_name = product["Name"].replace(".SAFE", "")
+    url = f"{DOWNLOAD_BASE_URL}({product['Id']})/$value"
+    return url, out_dir / f"{safe_name}.zip", product_verifier(product)
 
 
 def main():
     print("Starting Sentinel-1 download with CDSE")
-    token = get_cdse_token()
+    client = CDSEClient()
+    client.token()
     print("Token acquired")
 
     geom = load_aoi_geometry(AOI_PATH)
@@ -203,7 +157,7 @@ def main():
         geom=geom,
         start_date=START_DATE,
         end_date=END_DATE,
-        token=token,
+        client=client,
         max_results=MAX_RESULTS,
     )
 
@@ -215,11 +169,13 @@ def main():
     for p in products:
         print("  -", p["Name"])
 
-    for p in products:
-        try:
-            download_product(p, OUT_DIR, token)
-        except Exception as e:
-            print(f"Failed to download {p['Name']}: {e}")
+    jobs = [product_job(p, OUT_DIR) for p in products]
+    for out_path in check_existing(jobs):
+        print(f"Already downloaded: {out_path.name}")
+
+    for (url, out_path, err), p in zip(client.download(jobs, workers=WORKERS, max_rate=MAX_RATE, segments=SEGMENTS), products):
+        if err:
+            print(f"Failed to download {p['Name']}: {err}")
 
     print("Done.")
 
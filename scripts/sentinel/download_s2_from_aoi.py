@@ -2,19 +2,17 @@
 # download_s2_from_aoi.py
 #
 # Download Sentinel-2 scenes over AOI using:
-# - STAC for search (AOI + date window)
+# - STAC for search (AOI + date window), cached locally by catalogue_cache.py
 # - zipper.dataspace.copernicus.eu for download (OData, which we know works)
 #
-# Uses existing CDSE_USER and CDSE_PASS environment variables for authentication.
+# Uses existing CDSE_USER and CDSE_PASS environment variables for authentication,
+# through the shared client in cdse_client.py (token cached and refreshed).
 
-import os
-import requests
 from pathlib import Path
 import geopandas as gpd
 
-TOKEN_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
-STAC_SEARCH_URL = "https://catalogue.dataspace.copernicus.eu/stac/search"
-ZIPPER_URL = "https://zipper.dataspace.copernicus.eu/odata/v1/Products({id})/$value"
+from catalogue_cache import cached_search, stac_all
+from cdse_client import STAC_SEARCH_URL, ZIPPER_URL, CDSEClient, check_existing, product_verifier
 
 # --- EDIT THESE AS NEEDED ---
 BASE = Path(r"C:\EGM704\data_sets\egm704_project\data")
@@ -23,30 +21,10 @@ OUT_DIR = BASE / "raw" / "sentinel2"
 
 START_DATE = "2025-09-01T00:00:00Z"
 END_DATE   = "2025-09-30T23:59:59Z"
-MAX_ITEMS  = 4  # number of products to request from STAC
-
-
-def get_cdse_token():
-    """
-    Get an access token from Copernicus Data Space using env vars:
-    CDSE_USER and CDSE_PASS.
-    """
-    username = os.environ.get("CDSE_USER")
-    password = os.environ.get("CDSE_PASS")
-    if not username or not password:
-        raise RuntimeError("CDSE_USER or CDSE_PASS not set in environment.")
-
-    data = {
-        "client_id": "cdse-public",
-        "grant_type": "password",
-        "username": username,
-        "password": password,
-    }
-
-    resp = requests.post(TOKEN_URL, data=data)
-    resp.raise_for_status()
-    j = resp.json()
-    return j["access_token"], j.get("expires_in")
+MAX_ITEMS  = 4  # number of products to return (newest first)
+WORKERS    = 4  # products downloaded at once (CDSE allows 4 per user)
+MAX_RATE   = None  # total download cap in bytes/s (None = no cap)
+SEGMENTS   = 1  # parallel byte ranges per product (each one is a connection)
 
 
 def get_aoi_bbox():
@@ -59,30 +37,33 @@ def get_aoi_bbox():
     return [float(minx), float(miny), float(maxx), float(maxy)]
 
 
-def stac_search_s2(token, bbox):
+def stac_search_s2(client, bbox):
     """
     Query STAC for Sentinel-2 products over the AOI bbox and date window.
+
+    Answered from the local catalogue cache where this AOI / window was
+    searched before; only the uncovered part of the window goes to STAC.
     """
     headers = {
-        "Authorization": f"Bearer {token}",
         "Accept": "application/json",
         "Content-Type": "application/json",
     }
 
-    body = {
-        "collections": ["SENTINEL-2"],
-        "bbox": bbox,  # [minLon, minLat, maxLon, maxLat]
-        "datetime": f"{START_DATE}/{END_DATE}",
-        "limit": MAX_ITEMS
-    }
-
-    resp = requests.post(STAC_SEARCH_URL, headers=headers, json=body, timeout=60)
-    print("STAC status:", resp.status_code)
-    print("STAC raw text (first 200 chars):", resp.text[:200])
-    resp.raise_for_status()
+    def fetch(start, end):
+        body = {
+            "collections": ["SENTINEL-2"],
+            "bbox": bbox,  # [minLon, minLat, maxLon, maxLat]
+            "datetime": f"{start}/{end}",
+        }
+        return stac_all(
+            lambda url, **kw: client.post(url, headers=headers, timeout=60, **kw),
+            lambda url, **kw: client.get(url, headers=headers, timeout=60, **kw),
+            STAC_SEARCH_URL,
+            body,
+        )
 
-    data = resp.json()
-    return data.get("features", [])
+    features = cached_search("stac", "SENTINEL-2", bbox, START_DATE, END_DATE, fetch)
+    return features[:MAX_ITEMS]
 
 
 def get_odata_id_from_feature(feature):
@@ -103,57 +84,30 @@ def get_odata_id_from_feature(feature):
     return None
 
 
-def download_via_zipper(token, product_id, title):
-    """
-    Download product using zipper.dataspace.copernicus.eu and known ID.
-    This is the same pattern that already works in your other script.
+def zipper_job(product_id, title):
     """
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    (zipper url, local .SAFE.zip path, verifier) for a product ID and title.
 
+    STAC items carry no OData checksum, so only the ZIP is checked.
+    """
     base_name = title
     if base_name.endswith(".SAFE"):
         base_name = base_name[:-5]
-
-    out_path = OUT_DIR / f"{base_name}.SAFE.zip"
-    if out_path.exists():
-        print(f"➡ Already exists: {out_path.name}")
-        return
-
-    url = ZIPPER_URL.format(id=product_id)
-    headers = {"Authorization": f"Bearer {token}"}
-    print(f"⬇ Downloading {title} via zipper ...")
-
-    with requests.get(url, headers=headers, stream=True) as r:
-        r.raise_for_status()
-        total = int(r.headers.get("Content-Length") or 0)
-        downloaded = 0
-        with open(out_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if not chunk:
-                    continue
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total:
-                    pct = downloaded / total * 100
-                    print(
-                        f"  {downloaded/1e6:6.1f} MB / {total/1e6:6.1f} MB ({pct:4.1f}%)",
-                        end="\r"
-                    )
-
-    print(f"\n✅ Saved: {out_path}")
+    return ZIPPER_URL.format(id=product_id), OUT_DIR / f"{base_name}.SAFE.zip", product_verifier()
 
 
 def main():
     # 1) Token
-    token, exp = get_cdse_token()
-    print("✅ Got token, expires in:", exp, "seconds")
+    client = CDSEClient()
+    client.token()
+    print("✅ Got token, expires in:", round(client.expires_in), "seconds")
 
     # 2) AOI bbox
     bbox = get_aoi_bbox()
     print("📦 AOI bbox (minLon, minLat, maxLon, maxLat):", bbox)
 
     # 3) STAC search
-    features = stac_search_s2(token, bbox)
+    features = stac_search_s2(client, bbox)
     print(f"📦 Found {len(features)} Sentinel-2 product(s) over AOI in date range.")
 
     if not features:
@@ -168,6 +122,7 @@ def main():
         dt = props.get("datetime") or props.get("start_datetime")
         print(f"[{i}] {title} | {pid} | {dt}")
 
+    jobs = []
     for feat in features:
         props = feat.get("properties", {})
         title = props.get("title", feat.get("id", "UNKNOWN"))
@@ -183,7 +138,15 @@ def main():
             print(f"⚠ No OData ID found in assets for {title}, skipping.")
             continue
 
-        download_via_zipper(token, odata_id, title)
+        job = zipper_job(odata_id, title)
+        if check_existing([job]):
+            print(f"➡ Already exists: {job[1].name}")
+            continue
+        jobs.append(job)
+
+    print(f"⬇ Downloading {len(jobs)} product(s) via zipper, {WORKERS} at a time ...")
+    for url, out_path, err in client.download(jobs, workers=WORKERS, max_rate=MAX_RATE, segments=SEGMENTS):
+        print(f"❌ Failed: {out_path.name}: {err}" if err else f"✅ Saved: {out_path}")
 
 
 if __name__ == "__main__":
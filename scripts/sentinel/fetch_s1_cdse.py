@@ -11,6 +11,8 @@ import requests
 from tqdm import tqdm
 from dateutil.parser import isoparse
 
+from catalogue_cache import cached_search, stac_all
+
 STAC_SEARCH = "https://catalogue.dataspace.copernicus.eu/stac/search"
 # For downloads, we’ll try hrefs from STAC assets first.
 # If needed, we can also fall back to the OData “zipper” endpoint using the product ID.
@@ -23,61 +25,45 @@ def bearer_headers(token: str) -> dict:
     }
 
 def stac_search(token, bbox, start, end, product_type="GRD", polarizations=None,
-                orbit_direction=None, limit=10, max_items=50):
+                orbit_direction=None, limit=10, max_items=50, refresh=False):
     """
     Query the CDSE STAC API for Sentinel-1 products.
-    Returns a list of STAC items (dicts).
+    Returns a list of up to max_items STAC items (dicts), newest first.
+
+    Results go through the local catalogue cache (catalogue_cache.py): only
+    the part of start/end not searched before for this bbox and these
+    filters is sent to STAC, so a repeated search needs no network (and no
+    token). refresh=True searches the whole window again.
     """
-    # Build STAC POST body
-    body = {
-        "collections": ["SENTINEL-1"],
-        "bbox": bbox,  # [minLon, minLat, maxLon, maxLat]
-        "datetime": f"{start}/{end}",
-        "limit": min(limit, max_items),
-        # STAC 'query' filters for S1:
-        # s1:productType (e.g., GRD, SLC, OCN)
-        "query": {
-            "s1:productType": {"eq": product_type}
-        },
-        # You can constrain instrument mode, polarisations, etc., if desired
-    }
+    # STAC 'query' filters for S1:
+    # s1:productType (e.g., GRD, SLC, OCN)
+    # You can constrain instrument mode, polarisations, etc., if desired
+    query = {"s1:productType": {"eq": product_type}}
     if polarizations:
-        body["query"]["sar:polarizations"] = {"in": polarizations}
+        query["sar:polarizations"] = {"in": polarizations}
     if orbit_direction:
-        body["query"]["sat:orbit_state"] = {"eq": orbit_direction}  # 'ascending'/'descending'
-
-    headers = bearer_headers(token)
-    items = []
-
-    # Basic pagination loop via 'next' link
-    url = STAC_SEARCH
-    while True:
-        resp = requests.post(url, headers=headers, json=body, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-
-        features = data.get("features", [])
-        items.extend(features)
-
-        if len(items) >= max_items:
-            items = items[:max_items]
-            break
-
-        next_link = None
-        for lk in data.get("links", []):
-            if lk.get("rel") == "next" and lk.get("href"):
-                next_link = lk["href"]
-                break
-
-        if not next_link:
-            break
-
-        # For the next page, switch to GET (per many STAC impls) with the provided next href.
-        url = next_link
-        # Clear body so we follow server’s pagination token
-        body = None
-
-    return items
+        query["sat:orbit_state"] = {"eq": orbit_direction}  # 'ascending'/'descending'
+
+    headers = bearer_headers(token) if token else {"Accept": "application/json"}
+
+    def fetch(gap_start, gap_end):
+        # Build STAC POST body; every page of the gap is fetched
+        body = {
+            "collections": ["SENTINEL-1"],
+            "bbox": bbox,  # [minLon, minLat, maxLon, maxLat]
+            "datetime": f"{gap_start}/{gap_end}",
+            "limit": min(limit, 100),
+            "query": query,
+        }
+        return stac_all(
+            lambda url, **kw: requests.post(url, headers=headers, timeout=60, **kw),
+            lambda url, **kw: requests.get(url, headers=headers, timeout=60, **kw),
+            STAC_SEARCH,
+            body,
+        )
+
+    items = cached_search("stac", "SENTINEL-1", bbox, start, end, fetch, filters=query, refresh=refresh)
+    return items[:max_items]
 
 def pick_download_href(item: dict) -> str | None:
     """
@@ -142,9 +128,10 @@ def main():
     ap.add_argument("--max-items", type=int, default=10, help="Max number of items to return")
     ap.add_argument("--outdir", default="downloads", help="Directory to save downloads")
     ap.add_argument("--dry-run", action="store_true", help="Search only; do not download")
+    ap.add_argument("--refresh", action="store_true", help="Search the whole window again, ignoring the catalogue cache")
     args = ap.parse_args()
 
-    if not args.token:
+    if not args.token and not args.dry_run:
         sys.exit("ERROR: Provide a token via --token or CDSE_TOKEN env var.")
 
     # Basic validation on dates
@@ -164,7 +151,8 @@ def main():
         polarizations=args.polarizations,
         orbit_direction=args.orbit,
         limit=max(1, min(args.limit, 100)),
-        max_items=args.max_items
+        max_items=args.max_items,
+        refresh=args.refresh,
     )
 
     if not items:
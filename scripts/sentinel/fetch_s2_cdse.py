@@ -1,51 +1,21 @@
-import os
-import requests
 from pathlib import Path
 
-TOKEN_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
-CATALOGUE_URL = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
-ZIPPER_URL = "https://zipper.dataspace.copernicus.eu/odata/v1/Products({id})/$value"
+from cdse_client import CATALOGUE_URL, ZIPPER_URL, CDSEClient, check_existing, product_verifier
 
 # === EDIT THESE FOR YOUR PROJECT ===
 OUT_DIR = Path(r"C:\EGM704\data_sets\egm704_project\data\raw\sentinel2")
 START_DATE = "2025-09-01T00:00:00Z"
 END_DATE   = "2025-09-30T23:59:59Z"
 MAX_PRODUCTS = 2  # how many S2 scenes to download (for now)
+WORKERS = 4       # products downloaded at once (CDSE allows 4 per user)
+MAX_RATE = None   # total download cap in bytes/s, e.g. 20e6 (None = no cap)
+SEGMENTS = 1      # parallel byte ranges per product (each one is a connection)
 
 
-def get_cdse_token():
-    """
-    Get an access token from Copernicus Data Space using env vars:
-    CDSE_USER and CDSE_PASS.
-    """
-    username = os.environ.get("CDSE_USER")
-    password = os.environ.get("CDSE_PASS")
-
-    if not username or not password:
-        raise RuntimeError(
-            "CDSE_USER or CDSE_PASS environment variables not set. "
-            "Set them with `setx` and restart your terminal."
-        )
-
-    data = {
-        "client_id": "cdse-public",
-        "grant_type": "password",
-        "username": username,
-        "password": password,
-    }
-
-    resp = requests.post(TOKEN_URL, data=data)
-    resp.raise_for_status()
-
-    token_info = resp.json()
-    return token_info["access_token"], token_info.get("expires_in")
-
-
-def query_s2_products(token):
+def query_s2_products(client):
     """
     Query OData for Sentinel-2 Level-2A products within a date window.
     """
-    headers = {"Authorization": f"Bearer {token}"}
 
     # Filter:
     # - Sentinel-2 collection
@@ -64,7 +34,7 @@ def query_s2_products(token):
         "$filter": filter_str
     }
 
-    r = requests.get(CATALOGUE_URL, headers=headers, params=params)
+    r = client.get(CATALOGUE_URL, params=params)
     r.raise_for_status()
 
     data = r.json()
@@ -72,50 +42,21 @@ def query_s2_products(token):
     return products
 
 
-def download_product(token, product):
-    """
-    Download a single product via zipper endpoint.
-    """
-    prod_id = product["Id"]
-    name = product["Name"]  # this is the SAFE/zip name
-
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-    out_path = OUT_DIR / f"{name}.zip"
-
-    if out_path.exists():
-        print(f"➡ Already downloaded: {out_path.name}")
-        return
-
-    url = ZIPPER_URL.format(id=prod_id)
-    headers = {"Authorization": f"Bearer {token}"}
-
-    print(f"⬇ Downloading {name} …")
-    with requests.get(url, headers=headers, stream=True) as resp:
-        resp.raise_for_status()
-        total = int(resp.headers.get("Content-Length") or 0)
-        downloaded = 0
-
-        with open(out_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
-                if not chunk:
-                    continue
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total:
-                    pct = downloaded / total * 100
-                    print(f"  {downloaded/1e6:6.1f} MB / {total/1e6:6.1f} MB ({pct:4.1f}%)", end="\r")
-
-    print(f"\n✅ Saved: {out_path}")
+def product_job(product):
+    """(zipper url, local zip path, verifier) for one catalogue product."""
+    url = ZIPPER_URL.format(id=product["Id"])
+    return url, OUT_DIR / f"{product['Name']}.zip", product_verifier(product)
 
 
 def main():
-    # 1) Get a token
-    token, expires_in = get_cdse_token()
+    # 1) Get a token (cached between runs, refreshed when it runs out)
+    client = CDSEClient()
+    token = client.token()
     print("✅ Got token (first 60 chars):", token[:60] + "...")
-    print("⏳ Expires in (seconds):", expires_in)
+    print("⏳ Expires in (seconds):", round(client.expires_in))
 
     # 2) Query Sentinel-2 products
-    products = query_s2_products(token)
+    products = query_s2_products(client)
     print(f"📦 Found {len(products)} product(s) matching filters.")
 
     if not products:
@@ -127,9 +68,16 @@ def main():
         print(f"[{i}] {p['Name']}  |  Id: {p['Id']}  |  "
               f"{p['ContentDate']['Start']} -> {p['ContentDate']['End']}")
 
-    # 3) Download each product
-    for p in products:
-        download_product(token, p)
+    # 3) Download the products, WORKERS at a time
+    jobs = [product_job(p) for p in products]
+    for out_path in check_existing(jobs):
+        print(f"➡ Already downloaded: {out_path.name}")
+
+    results = client.download(jobs, workers=WORKERS, max_rate=MAX_RATE, segments=SEGMENTS)
+    for url, out_path, err in results:
+        if err:
+            print(f"❌ Failed: {out_path.name}: {err}")
+    print(f"✅ Saved {sum(err is None for *_, err in results)} product(s) to {OUT_DIR}")
 
 
 if __name__ == "__main__":
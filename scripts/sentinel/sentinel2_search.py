@@ -1,18 +1,20 @@
 import json, os, sys, requests, pandas as pd
 from shapely.geometry import shape, mapping
 from shapely.ops import unary_union
-from datetime import datetime
+
+from catalogue_cache import cached_search, odata_all
 
 # --- INPUTS ---
 AOI_GEOJSON = r"C:\EGM704\data_sets\egm704_project\qgis\AOI\desborough_aoi.geojson"
 DATE_FROM   = "2025-05-01T00:00:00Z"
-DATE_TO     = "2025-10-11T23:59:59Z"
+DATE_TO     = "2025-10-11T23:59:59.999Z"
 CLOUD_MAX   = 20
 
 # --- OUTPUTS ---
 META_DIR = r"C:\EGM704\data_sets\egm704_project\data\sentinel2\metadata"
 os.makedirs(META_DIR, exist_ok=True)
-CSV_OUT = os.path.join(META_DIR, f"s2_cdse_search_{datetime.now().strftime('%Y%m%d_%H%M')}.csv")
+# One CSV per query, rewritten from the local catalogue cache on each run
+CSV_OUT = os.path.join(META_DIR, f"s2_cdse_search_{DATE_FROM[:10]}_{DATE_TO[:10]}_cc{CLOUD_MAX}.csv")
 
 # --- CDSE OData endpoint (search) ---
 ODATA = "https://catalogue.dataspace.copernicus.eu/odata/v1/Products"
@@ -41,37 +43,43 @@ poly_wkt = f"POLYGON(({minx} {miny},{maxx} {miny},{maxx} {maxy},{minx} {maxy},{m
 geog = f"geography'SRID=4326;{poly_wkt}'"
 footprint_filter = f"OData.CSC.Intersects(area={geog})"  # <-- removed geometry=Footprint
 
-# Ensure CDSE-friendly timestamp literals (with milliseconds)
-DATE_FROM = "2025-05-01T00:00:00.000Z"
-DATE_TO   = "2025-10-11T23:59:59.999Z"
-
-# Build the $filter
-flt = (
-    "Collection/Name eq 'SENTINEL-2' "
-    "and Attributes/processingLevel eq 'L2A' "
-    f"and ContentDate/Start ge {DATE_FROM} and ContentDate/Start le {DATE_TO} "
-    f"and Attributes/cloudCoverPercentage le {CLOUD_MAX} "
-    f"and {footprint_filter}"
-)
-
-params = {
-    "$filter": flt,
-    "$select": "Id,Name,ContentDate,Attributes,GeoFootprint",
-    "$orderby": "ContentDate/Start desc",
-    "$top": 100
-}
-
-print("[INFO] Querying CDSE OData…")
-print("[DEBUG] Params:", params)  # helpful if it 400s again
-r = requests.get(ODATA, params=params, timeout=90)
+
+def fetch(start, end):
+    """Every L2A product over the AOI bbox starting in [start, end] (CDSE-friendly ms literals)."""
+    # Build the $filter
+    flt = (
+        "Collection/Name eq 'SENTINEL-2' "
+        "and Attributes/processingLevel eq 'L2A' "
+        f"and ContentDate/Start ge {start} and ContentDate/Start le {end} "
+        f"and Attributes/cloudCoverPercentage le {CLOUD_MAX} "
+        f"and {footprint_filter}"
+    )
+    params = {
+        "$filter": flt,
+        "$select": "Id,Name,ContentDate,Attributes,GeoFootprint",
+        "$orderby": "ContentDate/Start desc",
+    }
+    print("[INFO] Querying CDSE OData…")
+    print("[DEBUG] Params:", params)  # helpful if it 400s again
+    return odata_all(lambda url, **kw: requests.get(url, timeout=90, **kw), ODATA, params)
+
+
+# Only the part of the window not searched before goes to CDSE
 try:
-    r.raise_for_status()
-except Exception as e:
-    print("[DEBUG] Final URL:", r.url)
-    print("[DEBUG] Body:", r.text[:800])
+    items = cached_search(
+        "odata",
+        "SENTINEL-2",
+        (minx, miny, maxx, maxy),
+        DATE_FROM,
+        DATE_TO,
+        fetch,
+        filters={"processingLevel": "L2A", "cloudCoverPercentage": CLOUD_MAX, "select": "Attributes,GeoFootprint"},
+    )
+except requests.HTTPError as e:
+    print("[DEBUG] Final URL:", e.response.url)
+    print("[DEBUG] Body:", e.response.text[:800])
     fail(f"OData request failed: {e}")
 
-items = r.json().get("value", [])
 print(f"[INFO] Found {len(items)} item(s).")
 
 if not items:
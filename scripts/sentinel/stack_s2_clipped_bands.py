@@ -3,11 +3,16 @@
 # Build a single multiband GeoTIFF from previously clipped Sentinel-2 bands.
 # Assumes filenames still contain the band name, e.g. ..._B04_10m_desborough_operational.tif
 
+import sys
 from pathlib import Path
 import rasterio
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import numpy as np
 
+# scripts/common holds the helpers shared with the lidar scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.raster_profiles import cog_writer
+
 # ------------- USER SETTINGS -------------
 INPUT_DIR = Path(r"../data/sentinel2_clipped")
 OUTPUT_PATH = Path(r"../data/sentinel2_clipped/desborough_s2_stack.tif")
@@ -107,9 +112,8 @@ def main():
         "crs": ref_crs,
     })
 
-    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-
-    with rasterio.open(OUTPUT_PATH, "w", **profile) as dst:
+    # tiled, compressed COG with overviews (see common/raster_profiles.py)
+    with cog_writer(OUTPUT_PATH, profile, "reflectance") as dst:
         for idx, band_array in enumerate(stacked, start=1):
             dst.write(band_array, idx)
 